@@ -0,0 +1,228 @@
+"""
+broker.py
+---------------------------------
+SQLite-backed job broker shared by the API process and workers.
+
+The API enqueues jobs (a kind plus a JSON payload); workers lease them.
+A lease lasts `lease_seconds` and is extended by heartbeats while the
+worker runs the job. A lease that runs out (worker died, machine gone) puts
+the job back in the queue, until `max_attempts` is used up and it is
+marked failed. Failed attempts are retried after a short backoff.
+
+The database is a single file (WAL mode), so the broker needs no outside
+service: the web tier and the workers only have to share the file and the
+media directories (same machine, or a shared mount).
+
+Statuses: queued → leased → done | failed
+
+Classes:
+    JobBroker
+
+Functions:
+    get_broker()
+
+Environment overrides:
+    JOB_BROKER_DB (default: jobs.sqlite3 in the project root)
+    JOB_WORKERS   "local" (default: the API process runs video jobs itself)
+                  or "remote" (the API only enqueues; worker.py runs them)
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_DB = ROOT / "jobs.sqlite3"
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 5
+REMOTE_WORKERS = (os.environ.get("JOB_WORKERS") or "local").lower() == "remote"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, kind, created);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    kinds TEXT,
+    current_job TEXT,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class JobBroker:
+    """Queue, leases and heartbeats on one SQLite file (safe across threads and processes)."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get("JOB_BROKER_DB") or DEFAULT_DB)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        # One short-lived connection per call: sqlite3 connections are per thread
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    # ---------- API side ----------
+    def enqueue(self, kind, payload, job_id=None, max_attempts=MAX_ATTEMPTS):
+        """Queue a job; re-enqueueing an existing id is a no-op. Returns the id."""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, default=str), max_attempts, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._db() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    # ---------- Worker side ----------
+    def _expire_leases(self, db, now):
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired (worker lost)', "
+            "lease_owner = NULL, updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+            (now, now),
+        )
+        db.execute(
+            "UPDATE jobs SET status = 'queued', lease_owner = NULL, updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (now, now),
+        )
+
+    def lease(self, worker_id, kinds, lease_seconds=LEASE_SECONDS):
+        """Claim the oldest queued job of `kinds` → job dict, or None."""
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._transaction() as db:
+            self._expire_leases(db, now)
+            row = db.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({marks}) AND not_before <= ? "
+                "ORDER BY created LIMIT 1",
+                (*kinds, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+        job = self._job(row)
+        job.update(status="leased", lease_owner=worker_id, attempts=job["attempts"] + 1)
+        return job
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=LEASE_SECONDS) -> bool:
+        """Extend a lease; False if it was lost (expired and taken over)."""
+        now = time.time()
+        with self._db() as db:
+            cur = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (now + lease_seconds, now, job_id, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None) -> bool:
+        now = time.time()
+        with self._db() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (json.dumps(result, default=str), now, job_id, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, retry=True) -> bool:
+        """Give a job back: queued again after a backoff, or failed when out of attempts."""
+        now = time.time()
+        with self._db() as db:
+            cur = db.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "not_before = ?, error = ?, lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (int(retry), now + RETRY_BACKOFF_SECONDS, str(error), now, job_id, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def worker_seen(self, worker_id, kinds, current_job=None):
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO workers (id, host, kinds, current_job, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET current_job = excluded.current_job, last_seen = excluded.last_seen",
+                (worker_id, socket.gethostname(), ",".join(kinds), current_job, time.time()),
+            )
+
+    # ---------- Introspection ----------
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self, worker_timeout=LEASE_SECONDS):
+        with self._db() as db:
+            counts = {f"{r['kind']}_{r['status']}": r["n"] for r in db.execute(
+                "SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status")}
+            workers = [dict(r) for r in db.execute(
+                "SELECT * FROM workers WHERE last_seen > ? ORDER BY id", (time.time() - worker_timeout,))]
+        return {"jobs": counts, "workers": workers}
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Process-wide broker (opened on first use)."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = JobBroker()
+        return _broker
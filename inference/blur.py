@@ -0,0 +1,122 @@
+"""
+blur.py
+---------------------------------
+Fast large-kernel background blur.
+
+A full-resolution cv2.GaussianBlur costs O(kernel) per pixel, so the blur
+slider made background blur slower the further it went up. `fast_blur`
+gives the same Gaussian (same sigma OpenCV derives from the kernel size)
+through a pyramid instead: area-downsample by a power of two, blur the
+small image with the small residual sigma, upsample linearly. The cost is
+about constant in the blur strength, and everything stays uint8.
+
+For static cameras `BlurCache` reuses the blurred background of the last
+frame while the picture has not changed noticeably (one per stream).
+
+Functions:
+    blur_kernel(blur_strength)
+    kernel_sigma(ksize)
+    blurred_level(image, blur_strength)
+    fast_blur(image, blur_strength)
+
+Classes:
+    BlurCache
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+DIRECT_MAX_KERNEL = 9      # small kernels: plain GaussianBlur is cheapest
+CACHE_THUMB_WIDTH = 64
+CACHE_DIFF_THRESHOLD = 3.0  # mean abs gray-level change that invalidates the cache
+CACHE_REFRESH_FRAMES = 60
+
+
+def blur_kernel(blur_strength):
+    """Slider value → odd Gaussian kernel size (≥ 3)."""
+    blur_k = int(blur_strength)
+    if blur_k % 2 == 0:
+        blur_k += 1
+    return max(3, blur_k)
+
+
+def kernel_sigma(ksize):
+    """The sigma cv2.GaussianBlur uses for `ksize` when sigma=0."""
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+def blurred_level(image, blur_strength):
+    """
+    The blurred, reduced pyramid level that `fast_blur` upsamples to the
+    image size, or None for small kernels (blurred directly at full size).
+    Callers working in bands upsample only their rows of it.
+    """
+    k = blur_kernel(blur_strength)
+    if k <= DIRECT_MAX_KERNEL:
+        return None
+
+    h, w = image.shape[:2]
+    sigma = kernel_sigma(k)
+    # Area downsampling (box, variance ≈ f²/12) plus linear upsampling
+    # (triangle, variance ≈ f²/6) add ≈ f²/4 of variance: keep f ≤ sigma
+    factor = 2 ** int(math.log2(sigma))
+    factor = min(factor, max(1, min(h, w) // 4))
+    residual = math.sqrt(max(sigma * sigma - factor * factor / 4, 0.25)) / factor
+
+    small = cv2.resize(image, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (0, 0), residual, borderType=cv2.BORDER_REFLECT)
+
+
+def fast_blur(image, blur_strength):
+    """
+    Gaussian blur equivalent to cv2.GaussianBlur(image, (k, k), 0) with
+    k = blur_kernel(blur_strength), at near-constant cost for large k.
+    """
+    small = blurred_level(image, blur_strength)
+    if small is None:
+        k = blur_kernel(blur_strength)
+        return cv2.GaussianBlur(image, (k, k), 0)
+    h, w = image.shape[:2]
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+class BlurCache:
+    """
+    Blurred background of a stream, reused while the frame stays the same.
+
+    The frame is compared as a small grayscale thumbnail; the blur is redone
+    when it changes by more than `threshold` grey levels on average, when the
+    strength or size changes, and at least every `refresh` frames.
+    """
+
+    def __init__(self, threshold=CACHE_DIFF_THRESHOLD, refresh=CACHE_REFRESH_FRAMES):
+        self.threshold = threshold
+        self.refresh = refresh
+        self.thumb = None
+        self.blurred = None
+        self.key = None
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        size = (CACHE_THUMB_WIDTH, max(1, h * CACHE_THUMB_WIDTH // w))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def get(self, frame, blur_strength):
+        """Blurred `frame` (uint8), from the cache when the scene is static."""
+        thumb = self._thumbnail(frame)
+        key = (frame.shape, blur_kernel(blur_strength))
+        if (self.blurred is not None and key == self.key and self.age < self.refresh
+                and np.abs(thumb - self.thumb).mean() < self.threshold):
+            self.age += 1
+            self.hits += 1
+            return self.blurred
+        self.blurred = fast_blur(frame, blur_strength)
+        self.thumb, self.key, self.age = thumb, key, 0
+        self.misses += 1
+        return self.blurred
@@ -0,0 +1,250 @@
+"""
+evaluate.py
+---------------------------------
+Quality-versus-speed evaluation of matting configurations.
+
+Every configuration is run over a fixture directory of images and short
+clips and compared with the reference path (full frame, fp32, 512×512
+input). Per configuration it reports:
+
+    fps / ms     throughput of the configuration call alone
+    SAD          sum of absolute matte differences per frame, ÷1000
+    MSE          mean squared matte difference per pixel, ×1000
+    Grad         squared difference of Gaussian matte gradients
+                 (σ = 1.4) per frame, ÷1000
+    Flicker      mean |Δmatte − Δreference| between consecutive frames,
+                 ×1000 (clips only; 0 = changes exactly like the reference)
+
+Lower is better for all error columns. Results are printed as a table
+and, with --json, written as JSON (aggregate and per fixture).
+
+A configuration is a factory returning a `fn(frame_bgr) -> matte` callable
+(float32 0..1, frame size); the factory is called once per fixture so
+stateful modes (ROI tracking, temporal reuse) start fresh on every clip.
+New fast modes register themselves with @register_config.
+
+Functions:
+    register_config(name)
+    load_fixtures(directory, max_frames)
+    evaluate(fixtures, configs, reference)
+
+Usage:
+    python -m inference.evaluate FIXTURE_DIR [--configs size_384,roi_320] [--model webcam] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from inference.modnet_infer_video import predict_video_matte, SubjectTracker, predict_tracked_matte
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+CLIP_EXTS = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+REFERENCE = "ref_512"
+GRAD_SIGMA = 1.4
+
+CONFIGS = {}
+
+
+def register_config(name):
+    """Decorator: register `factory(model) -> fn(frame_bgr) -> matte` under `name`."""
+    def wrap(factory):
+        CONFIGS[name] = factory
+        return factory
+    return wrap
+
+
+# ---------- Built-in configurations ----------
+@register_config(REFERENCE)
+def _reference(model):
+    return lambda frame: predict_video_matte(frame, infer_size=512, model=model)
+
+
+def _sized(size):
+    def factory(model):
+        return lambda frame: predict_video_matte(frame, infer_size=size, model=model)
+    return factory
+
+
+for _size in (384, 320, 256):
+    register_config(f"size_{_size}")(_sized(_size))
+
+
+def _roi(size):
+    def factory(model):
+        tracker = SubjectTracker()
+        return lambda frame: predict_tracked_matte(frame, tracker, infer_size=size, model=model)
+    return factory
+
+
+register_config("roi_512")(_roi(512))
+register_config("roi_320")(_roi(320))
+
+
+# ---------- Fixtures ----------
+def load_fixtures(directory, max_frames=60):
+    """[(name, [frames])]: images are single-frame fixtures, clips are cut to `max_frames`."""
+    fixtures = []
+    for path in sorted(Path(directory).iterdir()):
+        ext = path.suffix.lower()
+        if ext in IMAGE_EXTS:
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                fixtures.append((path.name, [frame]))
+        elif ext in CLIP_EXTS:
+            cap = cv2.VideoCapture(str(path))
+            frames = []
+            while len(frames) < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            cap.release()
+            if frames:
+                fixtures.append((path.name, frames))
+    return fixtures
+
+
+# ---------- Metrics ----------
+def _gradient(matte):
+    smooth = cv2.GaussianBlur(matte, (0, 0), GRAD_SIGMA)
+    gx = cv2.Sobel(smooth, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(smooth, cv2.CV_32F, 0, 1, ksize=3)
+    return np.sqrt(gx * gx + gy * gy)
+
+
+def matte_errors(matte, ref):
+    """SAD, MSE and gradient error of one matte against the reference."""
+    diff = matte.astype(np.float32) - ref
+    return {
+        "sad": float(np.abs(diff).sum() / 1000),
+        "mse": float((diff * diff).mean() * 1000),
+        "grad": float(((_gradient(matte.astype(np.float32)) - _gradient(ref)) ** 2).sum() / 1000),
+    }
+
+
+def flicker(mattes, refs):
+    """Mean |Δmatte − Δreference| between consecutive frames (×1000); None for stills."""
+    if len(mattes) < 2:
+        return None
+    values = [
+        np.abs((mattes[i] - mattes[i - 1]) - (refs[i] - refs[i - 1])).mean()
+        for i in range(1, len(mattes))
+    ]
+    return float(np.mean(values) * 1000)
+
+
+# ---------- Runner ----------
+def run_config(factory, frames, model):
+    """Run one configuration over a fixture: (mattes, seconds spent in the calls)."""
+    fn = factory(model)
+    fn(frames[0])  # warm-up (allocations, cuDNN autotune), not timed
+    fn = factory(model)  # fresh state for the timed pass
+    mattes, elapsed = [], 0.0
+    for frame in frames:
+        start = time.perf_counter()
+        matte = fn(frame)
+        elapsed += time.perf_counter() - start
+        mattes.append(np.asarray(matte, dtype=np.float32))
+    return mattes, elapsed
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return float(np.mean(values)) if values else None
+
+
+def evaluate(fixtures, configs, reference=REFERENCE, model=None):
+    """
+    Evaluate `configs` (names in CONFIGS) against `reference` over `fixtures`.
+    Returns {"configs": {name: aggregate}, "fixtures": {fixture: {name: metrics}}}.
+    """
+    per_fixture = {}
+    ref_total = 0.0
+    totals = {name: {"frames": 0, "seconds": 0.0, "sad": [], "mse": [], "grad": [], "flicker": []}
+              for name in configs}
+
+    for fixture, frames in fixtures:
+        refs, ref_seconds = run_config(CONFIGS[reference], frames, model)
+        ref_total += ref_seconds
+        per_fixture[fixture] = {}
+        for name in configs:
+            if name == reference:
+                mattes, seconds = refs, ref_seconds
+            else:
+                mattes, seconds = run_config(CONFIGS[name], frames, model)
+            errors = [matte_errors(m, r) for m, r in zip(mattes, refs)]
+            metrics = {
+                "frames": len(frames),
+                "ms": 1000 * seconds / len(frames),
+                "sad": _mean([e["sad"] for e in errors]),
+                "mse": _mean([e["mse"] for e in errors]),
+                "grad": _mean([e["grad"] for e in errors]),
+                "flicker": flicker(mattes, refs),
+            }
+            per_fixture[fixture][name] = metrics
+            t = totals[name]
+            t["frames"] += len(frames)
+            t["seconds"] += seconds
+            for key in ("sad", "mse", "grad"):
+                t[key] += [e[key] for e in errors]
+            t["flicker"].append(metrics["flicker"])
+
+    aggregate = {}
+    for name, t in totals.items():
+        frames = max(1, t["frames"])
+        aggregate[name] = {
+            "frames": t["frames"],
+            "fps": t["frames"] / t["seconds"] if t["seconds"] else None,
+            "ms": 1000 * t["seconds"] / frames,
+            "speedup": ref_total / t["seconds"] if t["seconds"] else None,
+            "sad": _mean(t["sad"]),
+            "mse": _mean(t["mse"]),
+            "grad": _mean(t["grad"]),
+            "flicker": _mean(t["flicker"]),
+        }
+    return {"reference": reference, "model": model, "configs": aggregate, "fixtures": per_fixture}
+
+
+def format_table(results):
+    columns = ("fps", "ms", "speedup", "sad", "mse", "grad", "flicker")
+    header = f"{'config':<14}" + "".join(f"{c:>10}" for c in columns)
+    lines = [header, "-" * len(header)]
+    for name, row in results["configs"].items():
+        cells = "".join(f"{row[c]:>10.3f}" if row[c] is not None else f"{'-':>10}" for c in columns)
+        lines.append(f"{name:<14}{cells}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Matte quality vs. speed for inference configurations.")
+    parser.add_argument("fixtures", help="directory of images and short clips")
+    parser.add_argument("--configs", default=",".join(CONFIGS),
+                        help=f"comma-separated configurations (available: {', '.join(CONFIGS)})")
+    parser.add_argument("--model", default=None, help="registry model name (default: webcam)")
+    parser.add_argument("--max-frames", type=int, default=60, help="frames read per clip")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    configs = [c.strip() for c in args.configs.split(",") if c.strip()]
+    unknown = [c for c in configs if c not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configuration(s): {', '.join(unknown)}")
+    fixtures = load_fixtures(args.fixtures, args.max_frames)
+    if not fixtures:
+        parser.error(f"no images or clips found in {args.fixtures}")
+
+    print(f"📏 {len(fixtures)} fixtures, {sum(len(f) for _, f in fixtures)} frames, reference {REFERENCE}")
+    results = evaluate(fixtures, configs, model=args.model)
+    print(format_table(results))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
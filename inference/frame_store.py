@@ -0,0 +1,333 @@
+"""
+frame_store.py
+---------------------------------
+Shared cache of pre-decoded background-video frames.
+
+A background video is decoded (and scaled by ffmpeg) once per target
+resolution into a raw uint8 frame file under cache/bgframes/. Jobs and
+webcam sessions then memory-map it and read frames by index with no
+decoding, resizing or seeking; the pages are shared through the page cache
+by every job and worker process using the same background.
+
+Stores are keyed by a content fingerprint (size plus the first and last
+64 KB), so a background re-uploaded under another name, or rewritten with
+the same bytes, hits the same store. The fingerprint of a path is
+remembered per (mtime, size), so `open` (once per webcam frame) only
+stats the file. Videos whose frames would exceed
+BG_CACHE_MAX_STORE_MB, or that cannot be decoded, are not cached (callers
+decode them directly); a `.skip` marker remembers that, so they are not
+tried again on every open. Stores unused for BG_CACHE_MAX_AGE_HOURS, and
+the least recently used ones beyond BG_CACHE_MAX_MB in total, are evicted
+(checked at most every EVICT_INTERVAL seconds, from `open`).
+
+Classes:
+    FrameStore, BackgroundFrameCache
+
+Globals:
+    bg_frame_cache   process-wide instance
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from filelock import FileLock
+
+from inference.video_io import FFmpegFrameReader
+
+ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = ROOT / "cache" / "bgframes"
+MB = 1024 * 1024
+FINGERPRINT_BYTES = 64 * 1024
+
+BG_CACHE_MAX_MB = int(os.environ.get("BG_CACHE_MAX_MB") or 4096)
+BG_CACHE_MAX_STORE_MB = int(os.environ.get("BG_CACHE_MAX_STORE_MB") or 1024)
+BG_CACHE_MAX_AGE_HOURS = float(os.environ.get("BG_CACHE_MAX_AGE_HOURS") or 24)
+MAX_OPEN_STORES = 16
+MAX_FINGERPRINTS = 256     # remembered path fingerprints
+TOUCH_INTERVAL = 60        # seconds between last-use updates of an open store
+EVICT_INTERVAL = 300       # seconds between eviction passes
+
+
+def fingerprint(path) -> str:
+    """Content key of a file: its size plus hashes of its head and tail."""
+    p = Path(path)
+    size = p.stat().st_size
+    h = hashlib.sha1(str(size).encode())
+    with open(p, "rb") as f:
+        h.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            h.update(f.read(FINGERPRINT_BYTES))
+    return h.hexdigest()[:20]
+
+
+class FrameStore:
+    """Memory-mapped frames of one background video at one size."""
+
+    def __init__(self, raw_path, meta):
+        self.count, self.width, self.height = meta["count"], meta["width"], meta["height"]
+        self.fps = meta["fps"]
+        self.frames = np.memmap(raw_path, dtype=np.uint8, mode="r",
+                                shape=(self.count, self.height, self.width, 3))
+
+    def frame(self, index):
+        """Frame `index`, looping past the end (read-only view, no copy)."""
+        return self.frames[index % self.count]
+
+    def __len__(self):
+        return self.count
+
+
+class BackgroundFrameCache:
+    """Decode-once, memory-mapped background frames shared by all jobs."""
+
+    def __init__(self, directory=CACHE_DIR, max_mb=BG_CACHE_MAX_MB,
+                 max_store_mb=BG_CACHE_MAX_STORE_MB, max_age_hours=BG_CACHE_MAX_AGE_HOURS):
+        self.dir = Path(directory)
+        self.max_bytes = max_mb * MB
+        self.max_store_bytes = max_store_mb * MB
+        self.max_age = max_age_hours * 3600
+        self.lock = threading.Lock()
+        self.open_stores = OrderedDict()   # key -> FrameStore
+        self.building = set()
+        self.skipped = set()               # keys not worth caching (marker files)
+        self.touched = {}                  # key -> last mtime refresh
+        self.fingerprints = OrderedDict()  # path -> (mtime_ns, size, fingerprint)
+        self.last_evict = time.monotonic()
+        self.hits = 0
+        self.builds = 0
+        self.too_large = 0
+
+    def _paths(self, key):
+        return self.dir / f"{key}.raw", self.dir / f"{key}.json"
+
+    def _skip(self, key, reason):
+        """Remember (across processes) that `key` will not be cached."""
+        with self.lock:
+            self.skipped.add(key)
+        try:
+            (self.dir / f"{key}.skip").write_text(reason)
+        except OSError:
+            pass
+
+    def _is_skipped(self, key):
+        with self.lock:
+            if key in self.skipped:
+                return True
+        if (self.dir / f"{key}.skip").exists():
+            with self.lock:
+                self.skipped.add(key)
+            return True
+        return False
+
+    def _fingerprint(self, video_path):
+        """fingerprint(video_path), hashed again only when the file's mtime or size changed."""
+        path = str(video_path)
+        st = os.stat(path)
+        with self.lock:
+            known = self.fingerprints.get(path)
+            if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+                self.fingerprints.move_to_end(path)
+                return known[2]
+        digest = fingerprint(path)
+        with self.lock:
+            self.fingerprints[path] = (st.st_mtime_ns, st.st_size, digest)
+            self.fingerprints.move_to_end(path)
+            while len(self.fingerprints) > MAX_FINGERPRINTS:
+                self.fingerprints.popitem(last=False)
+        return digest
+
+    def _touch(self, key, meta_path):
+        """Record a use of the store (rate-limited: open runs once per webcam frame)."""
+        now = time.monotonic()
+        if now - self.touched.get(key, 0) < TOUCH_INTERVAL:
+            return
+        self.touched[key] = now
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+    # ---------- Open / build ----------
+    def open(self, video_path, width, height, wait=True):
+        """
+        FrameStore for `video_path` scaled to width×height, decoding it first
+        if needed. With wait=False a missing store is built in the background
+        and None is returned meanwhile. None also when the video is too
+        large to cache or cannot be decoded.
+        """
+        self._maybe_evict()
+        try:
+            key = f"{self._fingerprint(video_path)}_{width}x{height}"
+        except OSError:
+            return None
+        raw_path, meta_path = self._paths(key)
+        with self.lock:
+            store = self.open_stores.get(key)
+            if store is not None:
+                self.open_stores.move_to_end(key)
+                self.hits += 1
+        if store is not None:
+            self._touch(key, meta_path)  # in use: not evicted for age
+            return store
+        if self._is_skipped(key):
+            return None
+
+        if not meta_path.exists():
+            if not wait:
+                self._build_async(key, video_path, width, height)
+                return None
+            if not self._build(key, video_path, width, height):
+                return None
+        return self._load(key)
+
+    def _load(self, key):
+        raw_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            store = FrameStore(raw_path, meta)
+        except (OSError, ValueError):
+            return None
+        self.touched.pop(key, None)
+        self._touch(key, meta_path)  # last use, for eviction
+        with self.lock:
+            self.open_stores[key] = store
+            while len(self.open_stores) > MAX_OPEN_STORES:
+                self.open_stores.popitem(last=False)
+        return store
+
+    def _build_async(self, key, video_path, width, height):
+        with self.lock:
+            if key in self.building:
+                return
+            self.building.add(key)
+
+        def run():
+            try:
+                self._build(key, video_path, width, height)
+            finally:
+                with self.lock:
+                    self.building.discard(key)
+
+        threading.Thread(target=run, daemon=True, name=f"bgframes-{key}").start()
+
+    def _build(self, key, video_path, width, height):
+        """Decode + scale the video into a raw frame file (once, across processes)."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        raw_path, meta_path = self._paths(key)
+        frame_bytes = width * height * 3
+        with FileLock(str(self.dir / f"{key}.lock")):
+            if meta_path.exists():  # built by another job meanwhile
+                return True
+            try:
+                reader = FFmpegFrameReader(video_path, vf=f"scale={width}:{height}")
+            except RuntimeError as e:
+                print(f"⚠️ Could not decode background video {video_path}: {e}")
+                self._skip(key, "undecodable")
+                return False
+            if reader.frame_count * frame_bytes > self.max_store_bytes:
+                reader.close()
+                self.too_large += 1
+                self._skip(key, "too large")
+                return False
+
+            part_path = raw_path.with_suffix(".part")
+            count = 0
+            try:
+                with open(part_path, "wb") as f:
+                    for frame in reader:
+                        if (count + 1) * frame_bytes > self.max_store_bytes:
+                            self.too_large += 1
+                            count = 0
+                            break
+                        f.write(np.ascontiguousarray(frame).data)
+                        count += 1
+            finally:
+                reader.close()
+            if count == 0:
+                part_path.unlink(missing_ok=True)
+                self._skip(key, "too large or empty")
+                return False
+
+            part_path.replace(raw_path)
+            meta = {"count": count, "width": width, "height": height, "fps": reader.fps,
+                    "source": Path(video_path).name, "created": time.time()}
+            meta_path.write_text(json.dumps(meta))
+            self.builds += 1
+            print(f"🎞️ Background frames cached: {Path(video_path).name} → {width}x{height}, {count} frames")
+
+        self.evict(keep=key)
+        return True
+
+    # ---------- Eviction ----------
+    def _maybe_evict(self):
+        """Run an eviction pass in the background every EVICT_INTERVAL seconds."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_evict < EVICT_INTERVAL:
+                return
+            self.last_evict = now
+        threading.Thread(target=self.evict, daemon=True, name="bgframes-evict").start()
+
+    def _entries(self):
+        entries = []
+        for meta_path in self.dir.glob("*.json"):
+            raw_path = meta_path.with_suffix(".raw")
+            try:
+                entries.append((meta_path.stat().st_mtime, meta_path.stem,
+                                raw_path.stat().st_size if raw_path.exists() else 0))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Drop stores past the age limit, then least recently used ones over the size cap."""
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        now = time.time()
+        for last_used, key, size in entries:
+            if key == keep:
+                continue
+            if now - last_used <= self.max_age and total <= self.max_bytes:
+                continue
+            raw_path, meta_path = self._paths(key)
+            # Mapped stores stay readable after unlinking (pages freed on unmap)
+            meta_path.unlink(missing_ok=True)
+            raw_path.unlink(missing_ok=True)
+            with self.lock:
+                self.open_stores.pop(key, None)
+            total -= size
+
+        # Skip markers expire too, so a fixed or smaller video gets another try
+        for marker in self.dir.glob("*.skip"):
+            try:
+                if now - marker.stat().st_mtime > self.max_age:
+                    marker.unlink()
+                    with self.lock:
+                        self.skipped.discard(marker.stem)
+            except FileNotFoundError:
+                continue
+
+    def stats(self):
+        entries = self._entries() if self.dir.exists() else []
+        with self.lock:
+            return {
+                "stores": len(entries),
+                "size_mb": round(sum(size for _, _, size in entries) / MB, 1),
+                "max_mb": round(self.max_bytes / MB, 1),
+                "open": len(self.open_stores),
+                "building": len(self.building),
+                "hits": self.hits,
+                "builds": self.builds,
+                "too_large": self.too_large,
+                "skipped": len(self.skipped),
+            }
+
+
+bg_frame_cache = BackgroundFrameCache()
@@ -0,0 +1,162 @@
+"""
+governor.py
+---------------------------------
+One compute governor for all MODNet work in the process.
+
+Inference used to run from several independent thread pools, each thread
+using torch's default intra-op threads (= all cores), so mixed load
+oversubscribed the CPU many times over. The governor instead:
+
+  * sizes the number of concurrent inference slots and the torch / OpenCV
+    thread counts so that slots × threads ≈ available cores,
+  * runs interactive work (webcam frames, image requests) on one shared pool,
+  * hands out slots by priority: interactive waiters always go first, and
+    batch video jobs (which take a slot per frame) may never hold the last
+    slot. With a single slot, batch frames only borrow it while no
+    interactive work is running or waiting, and interactive work never waits
+    for a borrowed slot (it runs alongside that one batch frame instead).
+
+Classes:
+    ComputeGovernor
+
+Globals:
+    governor            process-wide instance
+    INTERACTIVE, BATCH  priorities
+
+Environment overrides:
+    MODNET_SLOTS, MODNET_TORCH_THREADS
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = ("interactive", "batch")
+
+MAX_CPU_SLOTS = 4
+CORES_PER_SLOT = 4
+GPU_SLOTS = 2
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ComputeGovernor:
+    """
+    Priority-aware inference slots plus the shared interactive pool.
+
+    `slot(priority)` is a context manager around one unit of inference work;
+    `run(fn, *args)` runs a blocking call on the interactive pool inside an
+    interactive slot.
+    """
+
+    def __init__(self, slots=None, torch_threads=None, cpus=None):
+        self.cpus = cpus or available_cpus()
+        self.cuda = self._cuda_available()
+        default_slots = GPU_SLOTS if self.cuda else max(1, min(MAX_CPU_SLOTS, self.cpus // CORES_PER_SLOT))
+        self.slots = int(slots or os.environ.get("MODNET_SLOTS") or default_slots)
+        self.torch_threads = int(torch_threads or os.environ.get("MODNET_TORCH_THREADS")
+                                 or max(1, self.cpus // self.slots))
+        # Batch jobs never take every slot (0 with a single slot: borrow it when idle)
+        self.batch_slots = self.slots - 1
+
+        self.cond = threading.Condition()
+        self.active = [0, 0]
+        self.waiting = [0, 0]
+        self.served = [0, 0]
+        self.wait_total = [0.0, 0.0]
+        self.pool = ThreadPoolExecutor(max_workers=self.slots + 2, thread_name_prefix="modnet-interactive")
+        self._configured = False
+
+    @staticmethod
+    def _cuda_available():
+        try:
+            import torch
+            return torch.cuda.is_available()
+        except ImportError:
+            return False
+
+    # ---------- Thread configuration ----------
+    def configure(self):
+        """Apply torch / OpenCV thread counts (once, before the first inference)."""
+        if self._configured:
+            return
+        self._configured = True
+        import cv2
+        import torch
+        torch.set_num_threads(self.torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # already fixed once inter-op work has started
+        cv2.setNumThreads(self.torch_threads)
+        print(f"🧮 Compute governor: {self.slots} slots × {self.torch_threads} threads "
+              f"({self.cpus} CPUs{', CUDA' if self.cuda else ''})")
+
+    # ---------- Slots ----------
+    def _can_start(self, priority):
+        if priority == BATCH:
+            return (self.waiting[INTERACTIVE] == 0 and sum(self.active) < self.slots
+                    and self.active[BATCH] < max(1, self.batch_slots))
+        # Batch frames beyond their share only borrowed an idle slot
+        return self.active[INTERACTIVE] + min(self.active[BATCH], self.batch_slots) < self.slots
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Hold one inference slot for the duration of the block."""
+        start = time.perf_counter()
+        with self.cond:
+            self.waiting[priority] += 1
+            while not self._can_start(priority):
+                self.cond.wait()
+            self.waiting[priority] -= 1
+            self.active[priority] += 1
+            self.served[priority] += 1
+            self.wait_total[priority] += time.perf_counter() - start
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active[priority] -= 1
+                self.cond.notify_all()
+
+    def call(self, priority, fn, *args, **kwargs):
+        with self.slot(priority):
+            return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking inference call on the interactive pool (interactive priority)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, lambda: self.call(INTERACTIVE, fn, *args, **kwargs))
+
+    # ---------- Introspection ----------
+    def stats(self):
+        with self.cond:
+            return {
+                "cpus": self.cpus,
+                "cuda": self.cuda,
+                "slots": self.slots,
+                "batch_slots": self.batch_slots,
+                "torch_threads": self.torch_threads,
+                **{
+                    name: {
+                        "active": self.active[p],
+                        "waiting": self.waiting[p],
+                        "served": self.served[p],
+                        "avg_wait_ms": round(1000 * self.wait_total[p] / self.served[p], 2) if self.served[p] else 0.0,
+                    }
+                    for p, name in enumerate(PRIORITY_NAMES)
+                },
+            }
+
+
+governor = ComputeGovernor()
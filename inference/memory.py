@@ -0,0 +1,206 @@
+"""
+memory.py
+---------------------------------
+Memory budget for request and job working memory.
+
+Work declares what it is about to allocate (decoded frames, float32 mattes
+and compositing copies) and reserves it before starting:
+
+  * work that could never fit the budget is refused up front
+    (MemoryBudgetExceeded), so callers can downscale or reject it,
+  * work that would fit but not right now waits until reservations are
+    released (queueing) instead of pushing the process into swap or the
+    OOM killer; interactive callers pass a timeout.
+
+Each request / job carries a MemoryUsage record: its largest reservation,
+time spent waiting for memory and the RSS high-water mark of the process
+that made the reservations, observed while it held memory (sampled in the
+background). That is a process-wide figure: it includes all concurrent
+work, and not the inference processes' own memory.
+
+Classes:
+    MemoryBudget, MemoryUsage, MemoryBudgetExceeded
+
+Functions:
+    image_work_bytes(w, h, hires)
+    video_frame_bytes(w, h)
+    fit_video_frame(w, h, budget)
+
+Globals:
+    memory_budget    process-wide instance
+
+Environment overrides:
+    MEMORY_BUDGET_MB (default: half the RAM available at startup)
+    MEMORY_WAIT_SECONDS (how long interactive requests queue for memory)
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+MB = 1024 * 1024
+SAMPLE_SECONDS = 0.05
+MEMORY_WAIT_SECONDS = float(os.environ.get("MEMORY_WAIT_SECONDS") or 30)
+
+# Working bytes per pixel (see the compositing code in inference/):
+# uint8 frame + float32 matte, 3-channel matte, frame, background and result
+IMAGE_BYTES_PER_PIXEL = 3 + 4 + 12 + 12 + 12 + 12 + 3 + 3
+# Tiled high-resolution path: uint8 frame and output, float work is per band
+HIRES_BYTES_PER_PIXEL = 3 + 4
+VIDEO_BYTES_PER_PIXEL = 3 + 4 + 12 + 12 + 12 + 12 + 3
+FIXED_OVERHEAD = 64 * MB  # 512×512 tensors, model activations, encoder buffers
+VIDEO_MIN_SIDE = 64
+
+
+def image_work_bytes(w, h, hires=False) -> int:
+    """Estimated peak working memory for one image request."""
+    return w * h * (HIRES_BYTES_PER_PIXEL if hires else IMAGE_BYTES_PER_PIXEL) + FIXED_OVERHEAD
+
+
+def video_frame_bytes(w, h) -> int:
+    """Estimated working memory for one video frame in flight."""
+    return w * h * VIDEO_BYTES_PER_PIXEL + FIXED_OVERHEAD
+
+
+def fit_video_frame(w, h, budget):
+    """
+    (w, h) when one video frame's working memory fits `budget` bytes, else
+    the largest even-sized, aspect-preserving downscale that does; None when
+    not even a VIDEO_MIN_SIDE frame fits.
+    """
+    if video_frame_bytes(w, h) <= budget:
+        return w, h
+    room = budget - FIXED_OVERHEAD
+    if room <= 0:
+        return None
+    scale = math.sqrt(room / (w * h * VIDEO_BYTES_PER_PIXEL))
+    fw, fh = int(w * scale) // 2 * 2, int(h * scale) // 2 * 2
+    if min(fw, fh) < VIDEO_MIN_SIDE:
+        return None
+    return fw, fh
+
+
+class MemoryBudgetExceeded(Exception):
+    """The work can never fit, or did not get memory within its timeout."""
+
+
+class MemoryUsage:
+    """
+    Memory record of one image request or video job. `process_rss_peak` is
+    the reserving process's RSS, shared with all concurrent work.
+    """
+
+    def __init__(self):
+        self.reserved_peak = 0
+        self.process_rss_peak = 0
+        self.wait_seconds = 0.0
+        self.holding = 0
+
+    def as_dict(self):
+        return {
+            "reserved_peak_mb": round(self.reserved_peak / MB, 1),
+            "process_rss_peak_mb": round(self.process_rss_peak / MB, 1),
+            "wait_s": round(self.wait_seconds, 3),
+        }
+
+
+class MemoryBudget:
+    """Byte reservations against a fixed budget, with queueing."""
+
+    def __init__(self, budget_mb=None):
+        budget_mb = budget_mb or os.environ.get("MEMORY_BUDGET_MB")
+        self.budget = int(float(budget_mb) * MB) if budget_mb else psutil.virtual_memory().available // 2
+        self.reserved = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cond = threading.Condition()
+        self.active = []   # MemoryUsage of holders, for RSS sampling
+        self.process = psutil.Process()
+        self._sampler = None
+
+    def fits(self, nbytes) -> bool:
+        """Could `nbytes` ever be reserved (with nothing else running)?"""
+        return nbytes <= self.budget
+
+    # ---------- Reservations ----------
+    def acquire(self, nbytes, usage=None, timeout=None):
+        """Reserve `nbytes`, waiting up to `timeout` seconds (None = until it fits)."""
+        if not self.fits(nbytes):
+            with self.cond:
+                self.rejected += 1
+            raise MemoryBudgetExceeded(
+                f"Needs {nbytes / MB:.0f} MB, budget is {self.budget / MB:.0f} MB")
+        start = time.perf_counter()
+        with self.cond:
+            self.waiting += 1
+            try:
+                if not self.cond.wait_for(lambda: self.reserved + nbytes <= self.budget, timeout):
+                    self.timed_out += 1
+                    raise MemoryBudgetExceeded("Timed out waiting for memory")
+            finally:
+                self.waiting -= 1
+            self.reserved += nbytes
+            if usage is not None:
+                usage.wait_seconds += time.perf_counter() - start
+                usage.holding += nbytes
+                usage.reserved_peak = max(usage.reserved_peak, usage.holding)
+                self.active.append(usage)
+                self._ensure_sampler()
+        self._sample()
+
+    def release(self, nbytes, usage=None):
+        self._sample()
+        with self.cond:
+            self.reserved -= nbytes
+            if usage is not None:
+                usage.holding -= nbytes
+                self.active.remove(usage)
+            self.cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes, usage=None, timeout=None):
+        self.acquire(nbytes, usage, timeout)
+        try:
+            yield
+        finally:
+            self.release(nbytes, usage)
+
+    # ---------- RSS sampling ----------
+    def _sample(self):
+        rss = self.process.memory_info().rss
+        with self.cond:
+            for usage in self.active:
+                usage.process_rss_peak = max(usage.process_rss_peak, rss)
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name="memory-sampler")
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.active)
+            self._sample()
+            time.sleep(SAMPLE_SECONDS)
+
+    # ---------- Introspection ----------
+    def stats(self):
+        with self.cond:
+            return {
+                "budget_mb": round(self.budget / MB, 1),
+                "reserved_mb": round(self.reserved / MB, 1),
+                "rss_mb": round(self.process.memory_info().rss / MB, 1),
+                "tracked": len(self.active),
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+memory_budget = MemoryBudget()
@@ -7,6 +7,10 @@ from PIL import Image
 import sys
 from pathlib import Path
 import os
+from concurrent.futures import ThreadPoolExecutor
+from inference.registry import registry, DEFAULT_IMAGE_MODEL
+from inference.governor import governor
+from inference.blur import blurred_level, fast_blur, blur_kernel
 
 # -------------------------------------------------------
 # Add path to official MODNet repo
@@ -33,39 +37,24 @@ if not MODNET_PATH.exists():
 if str(MODNET_PATH) not in sys.path:
     sys.path.append(str(MODNET_PATH))
 
-# Try import
-try:
-    from models.modnet import MODNet
-    print("✅ MODNet imported successfully.")
-except ModuleNotFoundError as e:
-    raise ImportError(f"❌ Could not import MODNet. Check path: {MODNET_PATH}\n{e}")
-
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print(f"🧠 Using device: {device}")
+governor.configure()  # torch / OpenCV thread counts sized to the machine
 
 # -------------------------------------------------------
-# Load your fine-tuned checkpoint
+# Models come from the shared registry (inference/registry.py); the
+# default image model is loaded up front so a bad checkpoint fails fast.
 # -------------------------------------------------------
-model_name = "modnet_finetuned_photographic.ckpt"
-CKPT_PATH = ROOT / "weights" / model_name
+print(f"Loading Image Model: {DEFAULT_IMAGE_MODEL}")
+try:
+    registry.get(DEFAULT_IMAGE_MODEL)
+except FileNotFoundError as e:
+    raise RuntimeError(str(e))
 
-modnet = MODNet(backbone_pretrained=False).to(device)
 
-print(f"Loading Image Model from: {CKPT_PATH}")
-try:
-    state = torch.load(CKPT_PATH, map_location=device)
-except FileNotFoundError:
-    raise RuntimeError(
-        f"Model checkpoint not found at '{CKPT_PATH}'. "
-        "Please ensure the file exists before running the application."
-    )
-if isinstance(state, dict) and "state_dict" in state:
-    state = state["state_dict"]
-state = {k.replace("module.", ""): v for k, v in state.items()}
-missing, unexpected = modnet.load_state_dict(state, strict=False)
-print(f"✅ MODNet loaded ({device}) | Missing: {len(missing)} | Unexpected: {len(unexpected)}")
-
-modnet.eval()
+def image_model(name=None):
+    """Registry model for `name` (default: the photographic model)."""
+    return registry.get(registry.resolve(name, DEFAULT_IMAGE_MODEL))
 
 # -------------------------------------------------------
 # Define preprocess globally (BEFORE the function)
@@ -87,7 +76,7 @@ preprocess = transforms.Compose([
 # -------------------------------------------------------
 
 @torch.inference_mode()
-def apply_modnet(frame_bgr, bg_image_path=None, bgcolor=(255, 255, 255)):
+def apply_modnet(frame_bgr, bg_image_path=None, bgcolor=(255, 255, 255), model=None):
     """
     Apply MODNet to remove background and blend with custom background image.
     If bg_image_path is None or not found, use solid background color (default: white).
@@ -99,7 +88,7 @@ def apply_modnet(frame_bgr, bg_image_path=None, bgcolor=(255, 255, 255)):
     tensor_input = preprocess(im)              # -> torch.Tensor [3,512,512]
     x = tensor_input.unsqueeze(0).to(device)   # -> [1,3,512,512]
     # ---- Inference ----
-    _, _, matte = modnet(x, True)
+    _, _, matte = image_model(model)(x, True)
     matte = matte[0][0].cpu().numpy()
     matte = cv2.resize(matte, (w, h), interpolation=cv2.INTER_LINEAR)
 
@@ -128,7 +117,7 @@ def apply_modnet(frame_bgr, bg_image_path=None, bgcolor=(255, 255, 255)):
     return out
 
 @torch.inference_mode()
-def apply_modnet_cutout_rgba(frame_bgr):
+def apply_modnet_cutout_rgba(frame_bgr, model=None):
     """
     Return an RGBA image (numpy uint8 HxWx4) where the alpha channel is the MODNet matte.
     Background is transparent (no compositing).
@@ -142,7 +131,7 @@ def apply_modnet_cutout_rgba(frame_bgr):
     x = tensor_input.unsqueeze(0).to(device)    # [1,3,512,512]
 
     # Inference
-    _, _, matte = modnet(x, True)
+    _, _, matte = image_model(model)(x, True)
     matte = matte[0][0].cpu().numpy()
     matte = cv2.resize(matte, (w, h), interpolation=cv2.INTER_LINEAR)
     matte = np.clip(matte, 0, 1)
@@ -159,7 +148,7 @@ def apply_modnet_cutout_rgba(frame_bgr):
     return rgba
 
 @torch.inference_mode()
-def extract_background(frame_bgr):
+def extract_background(frame_bgr, model=None):
     """
     Extract only the background part of the image using MODNet matte.
     Returns a BGR image where foreground is blacked out.
@@ -169,7 +158,7 @@ def extract_background(frame_bgr):
     im = Image.fromarray(rgb).resize((512, 512))
     tensor_input = preprocess(im).unsqueeze(0).to(device)
 
-    _, _, matte = modnet(tensor_input, True)
+    _, _, matte = image_model(model)(tensor_input, True)
     matte = matte[0][0].cpu().numpy()
     matte = cv2.resize(matte, (w, h), interpolation=cv2.INTER_LINEAR)
     matte = np.clip(matte, 0, 1)
@@ -182,7 +171,7 @@ def extract_background(frame_bgr):
 
 
 @torch.inference_mode()
-def apply_modnet_blur_background(frame_bgr, blur_strength=35):
+def apply_modnet_blur_background(frame_bgr, blur_strength=35, model=None):
     """
     Keep the person/foreground sharp, blur only the background region.
     Uses MODNet matte to isolate foreground from background.
@@ -192,7 +181,7 @@ def apply_modnet_blur_background(frame_bgr, blur_strength=35):
     im = Image.fromarray(rgb).resize((512, 512))
     tensor_input = preprocess(im).unsqueeze(0).to(device)
 
-    _, _, matte = modnet(tensor_input, True)
+    _, _, matte = image_model(model)(tensor_input, True)
     matte = matte[0][0].cpu().numpy()
     matte = cv2.resize(matte, (w, h), interpolation=cv2.INTER_LINEAR)
     matte = np.clip(matte, 0, 1)
@@ -200,14 +189,8 @@ def apply_modnet_blur_background(frame_bgr, blur_strength=35):
     # Smooth matte edges for better blending
     matte = cv2.GaussianBlur(matte, (5, 5), 0)
 
-    # Ensure blur strength is odd number for cv2.GaussianBlur
-    blur_k = int(blur_strength)
-    if blur_k % 2 == 0:
-        blur_k += 1
-    blur_k = max(3, blur_k)  # minimum kernel size
-
-    # Create blurred background
-    blurred_bg = cv2.GaussianBlur(frame_bgr, (blur_k, blur_k), 0)
+    # Create blurred background (uint8 pyramid blur, see inference/blur.py)
+    blurred_bg = fast_blur(frame_bgr, blur_strength)
 
     # Matte: 1.0 = foreground (keep original), 0.0 = background (use blurred)
     # Expand matte to 3 channels for blending
@@ -219,6 +202,206 @@ def apply_modnet_blur_background(frame_bgr, blur_strength=35):
     
     return out
 
+# -------------------------------------------------------
+# High-resolution path (proxy inference + tiled compositing)
+# -------------------------------------------------------
+# Images at or above this size go through apply_modnet_hires: inference runs
+# on a reduced decode, the original stays uint8 and the matte is upsampled and
+# composited one horizontal band at a time, so no full-size float copies exist.
+HIRES_MIN_PIXELS = 12_000_000
+HIRES_TILE_ROWS = 256
+HIRES_PROXY_MIN_SIDE = 512
+
+# One inference slot's share of the cores (see inference/governor.py)
+tile_executor = ThreadPoolExecutor(max_workers=governor.torch_threads, thread_name_prefix="modnet-tile")
+
+
+def decode_proxy(npimg, full_shape, min_side=HIRES_PROXY_MIN_SIDE):
+    """
+    Decode a downscaled proxy of an encoded image for inference.
+    Uses libjpeg's DCT-domain reduction (IMREAD_REDUCED_*), which is far
+    cheaper than decoding at full size and resizing.
+    """
+    h, w = full_shape[:2]
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if min(h, w) // factor >= min_side:
+            proxy = cv2.imdecode(npimg, flag)
+            if proxy is not None:
+                return proxy
+    return None
+
+
+@torch.inference_mode()
+def predict_matte(frame_bgr, model=None):
+    """Run MODNet and return the raw 512x512 float32 matte."""
+    rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    im = Image.fromarray(rgb).resize((512, 512))
+    x = preprocess(im).unsqueeze(0).to(device)
+    _, _, matte = image_model(model)(x, True)
+    return matte[0][0].cpu().numpy()
+
+
+def _resize_rows(src, out_w, out_h, y0, y1, interpolation=cv2.INTER_LINEAR):
+    """
+    Equivalent to cv2.resize(src, (out_w, out_h))[y0:y1], but only the
+    requested output rows are ever materialised.
+    """
+    sh, sw = src.shape[:2]
+    map_x = (np.arange(out_w, dtype=np.float32) + 0.5) * (sw / out_w) - 0.5
+    map_y = (np.arange(y0, y1, dtype=np.float32) + 0.5) * (sh / out_h) - 0.5
+    map_x = np.tile(map_x, (y1 - y0, 1))
+    map_y = np.repeat(map_y[:, None], out_w, axis=1)
+    return cv2.remap(src, map_x, map_y, interpolation, borderMode=cv2.BORDER_REPLICATE)
+
+
+def apply_modnet_hires(frame_bgr, proxy_bgr=None, mode="color", bgcolor=(255, 255, 255),
+                       bg_image=None, blur_strength=35, tile_rows=HIRES_TILE_ROWS, model=None):
+    """
+    Memory-bounded version of apply_modnet / apply_modnet_cutout_rgba /
+    apply_modnet_blur_background for very large images.
+
+    mode: 'color', 'custom', 'transparent', 'blur_bg'
+    Returns BGR uint8 (BGRA for 'transparent').
+    """
+    h, w, _ = frame_bgr.shape
+    if proxy_bgr is None:
+        scale = HIRES_PROXY_MIN_SIDE / min(h, w)
+        proxy_bgr = frame_bgr if scale >= 1 else cv2.resize(
+            frame_bgr, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    matte_small = predict_matte(proxy_bgr, model)
+    blur_k = blur_kernel(blur_strength)
+    # One blur for the whole frame: bands cut their rows from its reduced level
+    blur_level = blurred_level(frame_bgr, blur_strength) if mode == "blur_bg" else None
+    channels = 4 if mode == "transparent" else 3
+    out = np.empty((h, w, channels), dtype=np.uint8)
+
+    def composite_band(y0):
+        y1 = min(y0 + tile_rows, h)
+
+        # Upsample matte rows (+2 halo rows for the 5x5 edge smoothing)
+        m0, m1 = max(0, y0 - 2), min(h, y1 + 2)
+        matte = _resize_rows(matte_small, w, h, m0, m1)
+        matte = np.clip(matte, 0, 1)
+        if mode != "blur_bg":
+            matte = np.where(matte > 0.2, matte, 0).astype(np.float32)
+        matte = cv2.GaussianBlur(matte, (5, 5), 0)[y0 - m0:y0 - m0 + (y1 - y0)]
+
+        fg = frame_bgr[y0:y1]
+        if mode == "transparent":
+            out[y0:y1, :, :3] = fg
+            out[y0:y1, :, 3] = (matte * 255).astype(np.uint8)
+            return
+
+        if mode == "blur_bg" and blur_level is not None:
+            bg = _resize_rows(blur_level, w, h, y0, y1)
+        elif mode == "blur_bg":  # small kernel: blurred directly, with a halo
+            b0, b1 = max(0, y0 - blur_k // 2), min(h, y1 + blur_k // 2)
+            bg = cv2.GaussianBlur(frame_bgr[b0:b1], (blur_k, blur_k), 0)[y0 - b0:y0 - b0 + (y1 - y0)]
+        elif mode == "custom" and bg_image is not None:
+            bg = _resize_rows(bg_image, w, h, y0, y1)
+        else:
+            bg = None
+
+        alpha = matte[:, :, None]
+        if bg is None:
+            color = np.array(bgcolor, dtype=np.float32)
+            band = fg.astype(np.float32) * alpha + color * (1 - alpha)
+        else:
+            band = fg.astype(np.float32) * alpha + bg.astype(np.float32) * (1 - alpha)
+        out[y0:y1] = np.clip(band, 0, 255).astype(np.uint8)
+
+    list(tile_executor.map(composite_band, range(0, h, tile_rows)))
+    return out
+
+
+# -------------------------------------------------------
+# One image request, end to end (API process or inference process)
+# -------------------------------------------------------
+def parse_bgr(color: str):
+    """Parse '#rrggbb' into an OpenCV BGR tuple (white on bad input)."""
+    hex_color = color.lstrip("#")
+    try:
+        r = int(hex_color[0:2], 16)
+        g = int(hex_color[2:4], 16)
+        b = int(hex_color[4:6], 16)
+    except ValueError:
+        r, g, b = (255, 255, 255)
+    return (b, g, r)
+
+
+def render_image_sync(npimg, bg_bytes, mode, color, blur_strength, hires, original_path, changed_path, bg_path, model=None):
+    """
+    Blocking decode + MODNet + save for one image (runs in an interactive
+    governor slot, or as the inference pool's `render_image` op). Returns
+    an error message, or None on success.
+    """
+    frame = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    if frame is None:
+        return "Invalid image."
+    cv2.imwrite(str(original_path), frame)
+
+    # High-resolution: proxy inference + tiled uint8 compositing
+    if hires or frame.shape[0] * frame.shape[1] >= HIRES_MIN_PIXELS:
+        bg_img = None
+        if mode == "custom" and bg_bytes:
+            bg_img = cv2.imdecode(np.frombuffer(bg_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if bg_img is None:
+                return "Could not read background image."
+        result = apply_modnet_hires(
+            frame,
+            proxy_bgr=decode_proxy(npimg, frame.shape),
+            mode=mode,
+            bgcolor=parse_bgr(color),
+            bg_image=bg_img,
+            blur_strength=blur_strength,
+            model=model,
+        )
+        cv2.imwrite(str(changed_path), result)
+
+    # Transparent
+    elif mode == "transparent":
+        rgba = apply_modnet_cutout_rgba(frame, model=model)
+        cv2.imwrite(str(changed_path), cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA))
+
+    # Custom background image
+    elif mode == "custom" and bg_bytes:
+        np_bg = np.frombuffer(bg_bytes, np.uint8)
+        bg_img = cv2.imdecode(np_bg, cv2.IMREAD_COLOR)
+        if bg_img is not None:
+            cv2.imwrite(str(bg_path), bg_img)
+            result = apply_modnet(frame, bg_image_path=str(bg_path), model=model)
+            cv2.imwrite(str(changed_path), result)
+        else:
+            return "Could not read background image."
+    # elif mode == "extract_bg":
+    #     result = extract_background(frame)
+    #     if result is not None:
+    #         cv2.imwrite(str(changed_path), result)  # Save the extracted background
+    #     else:
+    #         return HTMLResponse("<h3>❌ Could not extract background.</h3>", status_code=400)
+
+    # Replace background with its blurred version
+    elif mode == "blur_bg":
+        print("Blur background mode triggered")
+        # print(f" Blurring background with strength: {blur_strength}")
+        result = apply_modnet_blur_background(frame_bgr=frame, blur_strength=blur_strength, model=model)
+        if result is not None:
+            cv2.imwrite(str(changed_path), result)
+        else:
+            return "Could not blur background."
+
+    # Solid color
+    else:
+        bg = np.full((frame.shape[0], frame.shape[1], 3), parse_bgr(color), dtype=np.uint8)
+        cv2.imwrite(str(bg_path), bg)
+        result = apply_modnet(frame, bg_image_path=str(bg_path), model=model)
+        cv2.imwrite(str(changed_path), result)
+    return None
+
+
 if __name__ == "__main__":
     input_path = "./images/upload/Sat Naing Tun bg changed.jpg"
     output_path = "./images/changed/Sat Naing Tun blur only.png"
@@ -8,8 +8,22 @@ import sys
 import cv2
 import numpy as np
 import torch
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from progress import start_progress, set_progress, complete_progress, fail_progress
+from jobs import JobCancelled
+from inference.registry import registry, DEFAULT_VIDEO_MODEL
+from inference.governor import governor, BATCH
+from inference.memory import memory_budget, MemoryBudgetExceeded, video_frame_bytes, fit_video_frame
+from inference.blur import fast_blur, BlurCache
+from inference.frame_store import bg_frame_cache
+from inference.process_pool import inference_pool
+from inference.video_io import (
+    GrowingFile, FFmpegFrameReader, FFmpegFrameWriter, FFmpegSegmentWriter,
+    FFmpegMatteWriter, FFmpegAlphaWriter, PNGSequenceWriter,
+    sniff_streamable, segment_dir_for, finished_segments, segments_complete, assemble_segments,
+)
 
 
 from tqdm import tqdm
@@ -36,41 +50,24 @@ if not MODNET_PATH.exists():
 if str(MODNET_PATH) not in sys.path:
     sys.path.append(str(MODNET_PATH))
 
-# Try import
-try:
-    from models.modnet import MODNet
-    print("✅ MODNet imported successfully.")
-except ModuleNotFoundError as e:
-    raise ImportError(f"❌ Could not import MODNet. Check path: {MODNET_PATH}\n{e}")
-
 # --------------------------------------------------
 # 🔧 MODEL INITIALIZATION
 # --------------------------------------------------
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+governor.configure()  # torch / OpenCV thread counts sized to the machine
 
-ROOT = Path(__file__).resolve().parent.parent
-webcam_model_name = "modnet_finetuned_webcam.ckpt"
-webcam_model_path = ROOT / "weights" / webcam_model_name
-
-print(f"🔧 Loading webcam MODNet model: {webcam_model_path}")
-
-modnet_webcam = MODNet(backbone_pretrained=False).to(device)
+print(f"🔧 Loading webcam MODNet model: {DEFAULT_VIDEO_MODEL}")
+registry.get(DEFAULT_VIDEO_MODEL)
 
-# Load checkpoint
-state = torch.load(webcam_model_path, map_location=device)
-if isinstance(state, dict) and "state_dict" in state:
-    state = state["state_dict"]
-state = {k.replace("module.", ""): v for k, v in state.items()}
 
-missing, unexpected = modnet_webcam.load_state_dict(state, strict=False)
-print(f"✅ Webcam MODNet loaded. Missing: {len(missing)}, Unexpected: {len(unexpected)}")
-
-modnet_webcam.eval()
+def video_model(name=None):
+    """Registry model for `name` (default: the webcam model)."""
+    return registry.get(registry.resolve(name, DEFAULT_VIDEO_MODEL))
 
 # ==============================
 # 🔹 New: Blur Background Support
 # ==============================
-def apply_modnet_video_blur(frame, blur_strength=25):
+def apply_modnet_video_blur(frame, blur_strength=25, model=None):
     """Apply MODNet matting and blur only the background."""
     image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     image = cv2.resize(image, (512, 512), interpolation=cv2.INTER_AREA)
@@ -78,7 +75,7 @@ def apply_modnet_video_blur(frame, blur_strength=25):
     image_tensor = torch.from_numpy(image.transpose(2, 0, 1)).unsqueeze(0).to(device)
 
     with torch.no_grad():
-        _, _, matte = modnet_webcam(image_tensor, True)
+        _, _, matte = video_model(model)(image_tensor, True)
 
     matte = matte[0][0].cpu().numpy()
     matte = cv2.resize(matte, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_LINEAR)
@@ -88,40 +85,150 @@ def apply_modnet_video_blur(frame, blur_strength=25):
     matte_3 = np.repeat(matte[:, :, np.newaxis], 3, axis=2)
 
     fg = frame.astype(np.float32) / 255.0
-    
-    # Ensure blur kernel is odd and valid
-    blur_k = int(blur_strength)
-    if blur_k % 2 == 0:
-        blur_k += 1
-    blur_k = max(3, blur_k)
-    
-    blurred_bg = cv2.GaussianBlur(fg, (blur_k, blur_k), 0)
+    blurred_bg = fast_blur(frame, blur_strength).astype(np.float32) / 255.0
 
     # matte=1.0 (foreground) → use original, matte=0.0 (background) → use blurred
     result = (fg * matte_3 + blurred_bg * (1 - matte_3)) * 255
     return result.astype(np.uint8)
 
 # --------------------------------------------------
-# 🧠 INFERENCE FUNCTION
+# 🎯 SUBJECT ROI TRACKING
 # --------------------------------------------------
-def apply_modnet_video(frame, mode="color", bgcolor=(255, 255, 255), bg_image=None, blur_strength=25):
+ROI_PADDING = 0.25         # padding around the subject box (fraction of its size)
+ROI_REFRESH_FRAMES = 30    # full-frame pass every N frames
+ROI_MAX_AREA = 0.6         # crops larger than this share of the frame → full frame
+ROI_MAX_SIDE = 512         # longest tensor side for a crop
+ROI_MIN_SIDE = 64
+ROI_THRESHOLD = 0.1        # matte level counted as subject
+
+
+class SubjectTracker:
     """
-    Apply MODNet portrait matting for webcam frames.
-    mode: 'color', 'custom', 'transparent', 'blur'
+    Tracks the subject's bounding box from the previous frame's matte so
+    inference can run on a padded crop around the person instead of the
+    whole frame. A full-frame pass runs every `refresh` frames, when the
+    subject was lost, and when it touches the crop border (moving out).
+    One tracker per stream (webcam session or video job).
     """
-    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    image = cv2.resize(image, (512, 512), interpolation=cv2.INTER_AREA)
+
+    def __init__(self, padding=ROI_PADDING, refresh=ROI_REFRESH_FRAMES):
+        self.padding = padding
+        self.refresh = refresh
+        self.box = None
+        self.frames_since_full = 0
+
+    def region(self, shape):
+        """Crop (x0, y0, x1, y1) for the next frame, or None for a full-frame pass."""
+        if self.box is None or self.frames_since_full >= self.refresh:
+            return None
+        h, w = shape[:2]
+        x0, y0, x1, y1 = self.box
+        px, py = int((x1 - x0) * self.padding), int((y1 - y0) * self.padding)
+        x0, y0, x1, y1 = max(0, x0 - px), max(0, y0 - py), min(w, x1 + px), min(h, y1 + py)
+        if (x1 - x0) * (y1 - y0) > ROI_MAX_AREA * w * h:
+            return None
+        return x0, y0, x1, y1
+
+    def update(self, matte, region, frame_shape=None):
+        """
+        Record the subject box found in this frame's matte. A matte smaller
+        than the frame (`frame_shape`) is mapped back to frame coordinates.
+        """
+        self.frames_since_full = 0 if region is None else self.frames_since_full + 1
+        ys = np.flatnonzero(matte.max(axis=1) > ROI_THRESHOLD)
+        xs = np.flatnonzero(matte.max(axis=0) > ROI_THRESHOLD)
+        if len(xs) == 0:
+            self.box = None
+            return
+        box = (int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1)
+        h, w = matte.shape
+        if frame_shape is not None and frame_shape[:2] != (h, w):
+            sy, sx = frame_shape[0] / h, frame_shape[1] / w
+            box = (int(box[0] * sx), int(box[1] * sy), int(np.ceil(box[2] * sx)), int(np.ceil(box[3] * sy)))
+            h, w = frame_shape[:2]
+
+        if region is not None:
+            rx0, ry0, rx1, ry1 = region
+            if ((box[0] <= rx0 and rx0 > 0) or (box[1] <= ry0 and ry0 > 0)
+                    or (box[2] >= rx1 and rx1 < w) or (box[3] >= ry1 and ry1 < h)):
+                self.box = None  # subject may extend past the crop → full frame next
+                return
+        self.box = box
+
+
+# --------------------------------------------------
+# 🧠 INFERENCE FUNCTION
+# --------------------------------------------------
+def _infer_matte(image_bgr, size, model=None):
+    """Run a registry model (default: webcam) on `image_bgr` resized to `size` (w, h)."""
+    image = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
     image = image.astype(np.float32) / 255.0
     image_tensor = torch.from_numpy(image.transpose(2, 0, 1)).unsqueeze(0).to(device)
 
     with torch.no_grad():
-        _, _, matte = modnet_webcam(image_tensor, True)
-    
-    matte = matte[0][0].cpu().numpy()
-    matte = cv2.resize(matte, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_LINEAR)
+        _, _, matte = video_model(model)(image_tensor, True)
+    return matte[0][0].cpu().numpy()
+
+
+def _roi_tensor_size(w, h, max_side=ROI_MAX_SIDE):
+    """Aspect-preserving tensor size for a crop (multiples of 32, ≤ max_side)."""
+    scale = min(1.0, max_side / max(w, h))
+    return tuple(max(ROI_MIN_SIDE, int(round(v * scale / 32)) * 32) for v in (w, h))
+
+
+def predict_video_matte(frame, region=None, infer_size=512, out_size=None, model=None):
+    """
+    Matte (float32, 0..1) for a frame, at frame size or `out_size` (w, h).
+    With `region` only that crop is inferred, at a tensor size that scales
+    with the crop, and the result is pasted into an empty matte.
+    `infer_size` (multiple of 32) caps the inference resolution; `model`
+    names the registry model (default: webcam).
+    """
+    fh, fw = frame.shape[:2]
+    ow, oh = out_size or (fw, fh)
+    if region is None:
+        matte = _infer_matte(frame, (infer_size, infer_size), model)
+        matte = cv2.resize(matte, (ow, oh), interpolation=cv2.INTER_LINEAR)
+    else:
+        x0, y0, x1, y1 = region
+        small = _infer_matte(frame[y0:y1, x0:x1], _roi_tensor_size(x1 - x0, y1 - y0, min(ROI_MAX_SIDE, infer_size)), model)
+        matte = np.zeros((oh, ow), np.float32)
+        ox0, ox1 = x0 * ow // fw, max(x0 * ow // fw + 1, x1 * ow // fw)
+        oy0, oy1 = y0 * oh // fh, max(y0 * oh // fh + 1, y1 * oh // fh)
+        matte[oy0:oy1, ox0:ox1] = cv2.resize(small, (ox1 - ox0, oy1 - oy0), interpolation=cv2.INTER_LINEAR)
     matte = np.clip(matte, 0, 1)
-    matte = cv2.GaussianBlur(matte, (5, 5), 0)  # smooth edges
-    
+    return cv2.GaussianBlur(matte, (5, 5), 0)  # smooth edges
+
+
+def apply_modnet_video(frame, mode="color", bgcolor=(255, 255, 255), bg_image=None, blur_strength=25, tracker=None, infer_size=512, model=None, blur_cache=None):
+    """
+    Apply MODNet portrait matting for webcam frames.
+    mode: 'color', 'custom', 'transparent', 'blur'
+    tracker: optional SubjectTracker → inference only on the subject crop
+    infer_size: inference resolution (webcam quality negotiation lowers it)
+    model: registry model name (default: webcam)
+    blur_cache: optional BlurCache for 'blur' (one per stream)
+    """
+    matte = predict_tracked_matte(frame, tracker, infer_size, model=model)
+    return composite_video_frame(frame, matte, mode, bgcolor, bg_image, blur_strength, blur_cache)
+
+
+def predict_tracked_matte(frame, tracker=None, infer_size=512, out_size=None, model=None):
+    """predict_video_matte on the tracker's subject crop (full frame without one)."""
+    region = tracker.region(frame.shape) if tracker is not None else None
+    matte = predict_video_matte(frame, region, infer_size, out_size, model)
+    if tracker is not None:
+        tracker.update(matte, region, frame.shape)
+    return matte
+
+
+def composite_video_frame(frame, matte, mode="color", bgcolor=(255, 255, 255), bg_image=None, blur_strength=25, blur_cache=None):
+    """
+    Blend a frame over the chosen background using its matte.
+    blur_cache: optional BlurCache → the blurred background is reused while
+    the camera image is static.
+    """
     matte_3 = np.repeat(matte[:, :, np.newaxis], 3, axis=2)
     fg = frame.astype(np.float32) / 255.0
 
@@ -139,13 +246,9 @@ def apply_modnet_video(frame, mode="color", bgcolor=(255, 255, 255), bg_image=No
         return result.astype(np.uint8)
     
     elif mode == "blur":
-        # Ensure blur kernel is odd and valid
-        blur_k = int(blur_strength)
-        if blur_k % 2 == 0:
-            blur_k += 1
-        blur_k = max(3, blur_k)
-        
-        blurred_bg = cv2.GaussianBlur(fg, (blur_k, blur_k), 0)
+        # uint8 pyramid blur: cost stays flat as blur_strength goes up
+        blurred = blur_cache.get(frame, blur_strength) if blur_cache is not None else fast_blur(frame, blur_strength)
+        blurred_bg = blurred.astype(np.float32) / 255.0
         # matte=1.0 (foreground sharp), matte=0.0 (background blurred)
         result = (fg * matte_3 + blurred_bg * (1 - matte_3)) * 255
         return result.astype(np.uint8)
@@ -156,19 +259,189 @@ def apply_modnet_video(frame, mode="color", bgcolor=(255, 255, 255), bg_image=No
         return result.astype(np.uint8)
 
 # =====================================================
-# 🎬 Apply MODNet on full video using MoviePy
+# 🔹 Background helpers for video jobs
 # =====================================================
-def apply_modnet_video_file(input_path, output_path, mode="color", color="#00ff00", bg_path=None, progress_file=None, blur_strength=25):
+VIDEO_BG_EXTS = [".mp4", ".mov", ".avi", ".mkv"]
+
+
+@lru_cache(maxsize=4)
+def _decode_bg_image(path, mtime):
+    return cv2.imread(path)
+
+
+def load_bg_image(bg_path):
+    """Decode a background image once; preview and full render share it."""
+    try:
+        return _decode_bg_image(str(bg_path), Path(bg_path).stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def parse_bgcolor(color):
+    """'#rrggbb' → OpenCV BGR tuple."""
+    r, g, b = (int(color.lstrip("#")[i:i+2], 16) for i in (0, 2, 4))
+    return (b, g, r)
+
+
+class BackgroundVideo:
+    """
+    Looping background-video frames at the job's size (w, h).
+
+    Frames come from the shared pre-decoded frame store (decoded and scaled
+    once per background and size, read by index without decoding); videos
+    too large to cache are decoded directly with cv2.VideoCapture.
+    """
+
+    def __init__(self, path, w, h):
+        self.w, self.h = w, h
+        self.index = 0
+        self.cap = None
+        self.store = bg_frame_cache.open(path, w, h)
+        if self.store is None:
+            self.cap = cv2.VideoCapture(str(path))
+            if not self.cap.isOpened():
+                raise RuntimeError(f"Could not open background video: {path}")
+
+    def __len__(self):
+        if self.store is not None:
+            return len(self.store)
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+
+    def seek(self, index):
+        """Continue at frame `index` (looped), e.g. when resuming a job."""
+        self.index = index
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index % len(self))
+
+    def read(self):
+        """Next frame (loops back to the start if the background is shorter)."""
+        self.index += 1
+        if self.store is not None:
+            return self.store.frame(self.index - 1)
+        ret_bg, bg_frame = self.cap.read()
+        if not ret_bg:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret_bg, bg_frame = self.cap.read()
+        return cv2.resize(bg_frame, (self.w, self.h)) if ret_bg else None
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+def open_background(mode, bg_path, w, h):
+    """Return (bg_image, bg_video) for a video job; both None when unused."""
+    bg_image = None
+    bg_video = None
+
+    if mode == "custom" and bg_path:
+        ext = Path(bg_path).suffix.lower()
+        if ext in VIDEO_BG_EXTS:
+            try:
+                bg_video = BackgroundVideo(bg_path, w, h)
+                print(f"🎥 Background video loaded ({len(bg_video)} frames"
+                      f"{', cached' if bg_video.store is not None else ''})")
+            except RuntimeError as e:
+                print(f"⚠️ {e}")
+        else:
+            bg_image = load_bg_image(bg_path)
+            if bg_image is not None:
+                bg_image = cv2.resize(bg_image, (w, h))
+            else:
+                print(f"⚠️ Could not read background image: {bg_path}")
+
+    return bg_image, bg_video
+
+
+def next_background(bg_image, bg_video, w, h):
+    """Next background frame: from the background video, else the still image."""
+    if bg_video is not None:
+        return bg_video.read()
+    return bg_image
+
+
+def plan_video_frame(w, h):
+    """
+    Size to process w×h video frames at, checked once from the probed
+    dimensions before the first frame: the full size when a frame's working
+    memory fits the memory budget, else scaled down until it does (as
+    plan_image_memory does for images). Raises MemoryBudgetExceeded when
+    not even a small frame fits.
+    """
+    size = fit_video_frame(w, h, memory_budget.budget)
+    if size is None:
+        raise MemoryBudgetExceeded(f"{w}x{h} video frames do not fit the memory budget")
+    if size != (w, h):
+        print(f"📉 {w}x{h} video over the memory budget → processing at {size[0]}x{size[1]}")
+    return size
+
+
+def fit_frame(frame, size):
+    """`frame` scaled to the planned `size` (w, h), when it differs."""
+    if (frame.shape[1], frame.shape[0]) == size:
+        return frame
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+@contextmanager
+def batch_frame(w, h, usage=None, cancel=None):
+    """
+    One video-job frame: its working memory is reserved against the memory
+    budget (waiting while it is full), then a batch inference slot is taken.
+    `usage` (MemoryUsage) records the job's peak memory. Raises JobCancelled
+    once `cancel` (threading.Event) is set.
+    """
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+    with memory_budget.reserve(video_frame_bytes(w, h), usage), governor.slot(BATCH):
+        yield
+
+
+@contextmanager
+def composited_frame(frame, stream, mode, bgcolor, bg_image=None, blur_strength=25, tracker=None, model=None, blur_cache=None):
+    """
+    apply_modnet_video for one job frame. With the inference process pool
+    the frame is composited in an inference process (which keeps the
+    stream's tracker and blur cache) and the result is a view into shared
+    memory, valid inside the block; otherwise it runs in this thread.
+    """
+    h, w = frame.shape[:2]
+    if not inference_pool.fits(frame, bg_image, out_bytes=h * w * 4, stream=stream):
+        yield apply_modnet_video(frame, mode=mode, bgcolor=bgcolor, bg_image=bg_image, blur_strength=blur_strength,
+                                 tracker=tracker, model=model, blur_cache=blur_cache)
+        return
+    params = dict(mode=mode, bgcolor=bgcolor, blur_strength=blur_strength, roi=tracker is not None, model=model)
+    with inference_pool.call("composite", stream, params, frame=frame, bg=bg_image) as result:
+        yield result
+
+
+@contextmanager
+def matte_frame(frame, stream, tracker=None, model=None):
+    """uint8 matte of one job frame (in an inference process when the pool runs; see composited_frame)."""
+    h, w = frame.shape[:2]
+    if not inference_pool.fits(frame, out_bytes=h * w, stream=stream):
+        yield (predict_tracked_matte(frame, tracker, model=model) * 255 + 0.5).astype(np.uint8)
+        return
+    with inference_pool.call("matte", stream, dict(roi=tracker is not None, model=model), frame=frame) as matte:
+        yield matte
+
+
+# =====================================================
+# 🎬 Apply MODNet on full video (streaming ffmpeg encoder)
+# =====================================================
+def apply_modnet_video_file(input_path, output_path, mode="color", color="#00ff00", bg_path=None, progress_file=None, blur_strength=25, roi=False, model=None, usage=None, cancel=None):
     """
     Process full video with MODNet.
     Supports image or video backgrounds.
     If background video is shorter → loops.
     If background video is longer → stops at foreground end.
+    Frames are encoded as they are produced into live HLS segments next to
+    the output (playable while the job runs); the final MP4 is then
+    assembled from them by stream copy, together with the source audio.
+    Finished segments double as checkpoints: if a previous run of the same
+    job was interrupted, processing continues after the last one.
     """
 
-    from moviepy import ImageSequenceClip
-    from modnet_infer_video import apply_modnet_video
-
     cap = cv2.VideoCapture(str(input_path))
     if not cap.isOpened():
         print(f"❌ Cannot open video: {input_path}")
@@ -178,34 +451,41 @@ def apply_modnet_video_file(input_path, output_path, mode="color", color="#00ff0
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    print(f"🎞 Processing {frame_count} frames from {input_path}")
+    seg_dir = segment_dir_for(output_path)
+
+    # Interrupted after encoding finished → only the assembly is left
+    if segments_complete(seg_dir):
+        cap.release()
+        return finish_video_file(seg_dir, input_path, output_path, progress_file)
 
     # -----------------------------------------------------
-    # 🔹 Background setup
+    # ⏩ Resume after the last finished segment
     # -----------------------------------------------------
-    bg_image = None
-    bg_cap = None
-    bg_is_video = False
-
-    if mode == "custom" and bg_path:
-        ext = Path(bg_path).suffix.lower()
-        if ext in [".mp4", ".mov", ".avi", ".mkv"]:
-            bg_cap = cv2.VideoCapture(str(bg_path))
-            if bg_cap.isOpened():
-                bg_is_video = True
-                bg_frame_count = int(bg_cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                print(f"🎥 Background video loaded ({bg_frame_count} frames)")
-            else:
-                print(f"⚠️ Could not open background video: {bg_path}")
-        else:
-            bg_image = cv2.imread(str(bg_path))
-            if bg_image is not None:
-                bg_image = cv2.resize(bg_image, (w, h))
-            else:
-                print(f"⚠️ Could not read background image: {bg_path}")
+    try:
+        w, h = plan_video_frame(w, h)
+    except MemoryBudgetExceeded:
+        cap.release()
+        raise
+    done_segments, resume_seconds = finished_segments(seg_dir)
+    start_frame = round(resume_seconds * fps) if done_segments else 0
+    if start_frame:
+        print(f"⏩ Resuming {Path(input_path).name} at frame {start_frame} ({done_segments} segments done)")
+        for _ in range(start_frame):
+            if not cap.grab():
+                break
+    print(f"🎞 Processing {frame_count - start_frame} frames from {input_path}")
 
-    bgcolor = tuple(int(color.lstrip("#")[i:i+2], 16) for i in (0, 2, 4))
-    frames = []
+    # -----------------------------------------------------
+    # 🔹 Background setup
+    # -----------------------------------------------------
+    bg_image, bg_cap = open_background(mode, bg_path, w, h)
+    if bg_cap is not None and start_frame:
+        bg_cap.seek(start_frame)
+    bgcolor = parse_bgcolor(color)
+    tracker = SubjectTracker() if roi else None
+    blur_cache = BlurCache() if mode == "blur" else None
+    writer = FFmpegSegmentWriter(seg_dir, w, h, fps, resume_seconds=start_frame / fps)
+    stream = str(seg_dir)
 
     if progress_file:
         start_progress(progress_file, "processing")
@@ -213,59 +493,360 @@ def apply_modnet_video_file(input_path, output_path, mode="color", color="#00ff0
     # -----------------------------------------------------
     # 🎬 Frame-by-frame MODNet inference
     # -----------------------------------------------------
-    for idx in tqdm(range(frame_count), desc="Processing frames", ncols=80):
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            break
-
-        # ----- Background frame logic -----
-        current_bg = None
-        if bg_is_video:
-            ret_bg, bg_frame = bg_cap.read()
-            if not ret_bg:  # Loop back to start if shorter
-                bg_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret_bg, bg_frame = bg_cap.read()
-            if ret_bg:
-                current_bg = cv2.resize(bg_frame, (w, h))
-        elif bg_image is not None:
-            current_bg = bg_image
-
-        # ----- MODNet processing -----
-        try:
-            result = apply_modnet_video(frame, mode=mode, bgcolor=bgcolor, bg_image=current_bg, blur_strength=blur_strength)
-            frames.append(cv2.cvtColor(result, cv2.COLOR_BGR2RGB))
-        except Exception as e:
-            print(f"⚠️ Frame {idx} error: {e}")
-
-        set_progress(progress_file, idx + 1, frame_count, "processing")
-
-    cap.release()
-    if bg_cap: bg_cap.release()
+    try:
+        for idx in tqdm(range(start_frame, frame_count), desc="Processing frames", ncols=80):
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                break
+            frame = fit_frame(frame, (w, h))
+
+            current_bg = next_background(bg_image, bg_cap, w, h)
+
+            # ----- MODNet processing -----
+            try:
+                with batch_frame(w, h, usage, cancel), composited_frame(frame, stream, mode, bgcolor, current_bg, blur_strength, tracker, model, blur_cache) as result:
+                    writer.write(result)
+            except (MemoryBudgetExceeded, JobCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ Frame {idx} error: {e}")
+
+            set_progress(progress_file, idx + 1, frame_count, "processing")
+    except JobCancelled:
+        writer.abort()  # don't finish files the job's new runner is writing
+        raise
+    finally:
+        cap.release()
+        if bg_cap: bg_cap.release()
+        inference_pool.close_stream(stream)
+        ok = writer.close()
 
     # -----------------------------------------------------
-    # 🧩 Write video
+    # 🧩 Finish
     # -----------------------------------------------------
-    if not frames:
+    if writer.frames == 0 and not done_segments:
         fail_progress(progress_file)
         print("❌ No frames processed.")
         return False
+    if not ok:
+        fail_progress(progress_file)
+        print(f"❌ Error writing video: {output_path}")
+        return False
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+    return finish_video_file(seg_dir, input_path, output_path, progress_file)
+
+
+def finish_video_file(seg_dir, input_path, output_path, progress_file=None):
+    """Assemble the encoded segments (plus source audio) into the output MP4."""
+    if not assemble_segments(seg_dir, output_path, audio_source=input_path):
+        fail_progress(progress_file)
+        print(f"❌ Error writing video: {output_path}")
+        return False
+
+    print(f"✅ Saved processed video: {output_path}")
+    complete_progress(progress_file)
+    return True
+
+
+# =====================================================
+# 📡 Apply MODNet while the upload is still arriving
+# =====================================================
+def apply_modnet_video_upload(upload, output_path, mode="color", color="#00ff00", bg_path=None, progress_file=None, blur_strength=25, expected_size=0, roi=False, model=None, usage=None, cancel=None):
+    """
+    Process a video whose upload is still in progress (`upload` is a GrowingFile).
+
+    Streamable containers (WebM/MKV, MPEG-TS, faststart MP4) are piped into
+    ffmpeg as bytes arrive and encoded frame-by-frame, so total time approaches
+    max(upload, processing). Other files wait for the upload to finish and then
+    take the regular apply_modnet_video_file path, as do uploads that are
+    already complete (e.g. a job resumed after a restart).
+    """
+    if upload.done.is_set() or not sniff_streamable(upload):
+        upload.done.wait()
+        if upload.failed:
+            fail_progress(progress_file)
+            return False
+        return apply_modnet_video_file(str(upload.path), output_path, mode, color, bg_path, progress_file, blur_strength, roi, model, usage, cancel)
+
+    print(f"📡 Streaming decode started for {upload.path.name} (upload in progress)")
+    try:
+        reader = FFmpegFrameReader(upload)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        fail_progress(progress_file)
+        return False
 
     try:
-        clip = ImageSequenceClip(frames, fps=fps)
-        clip.write_videofile(
-            str(output_path),
-            codec="libx264",
-            audio=False,
-            preset="medium",
-            ffmpeg_params=["-movflags", "+faststart"]
-        )
-        print(f"✅ Saved processed video: {output_path}")
+        w, h = plan_video_frame(reader.width, reader.height)
+    except MemoryBudgetExceeded:
+        reader.close()
+        raise
+    bg_image, bg_cap = open_background(mode, bg_path, w, h)
+    bgcolor = parse_bgcolor(color)
+    tracker = SubjectTracker() if roi else None
+    blur_cache = BlurCache() if mode == "blur" else None
+    # Audio isn't complete yet → encode video-only segments, add audio (copy) on assembly
+    seg_dir = segment_dir_for(output_path)
+    writer = FFmpegSegmentWriter(seg_dir, w, h, reader.fps)
+    stream = str(seg_dir)
+
+    if progress_file:
+        start_progress(progress_file, "processing")
+
+    idx = 0
+    try:
+        for idx, frame in enumerate(reader, start=1):
+            frame = fit_frame(frame, (w, h))
+            current_bg = next_background(bg_image, bg_cap, w, h)
+            try:
+                with batch_frame(w, h, usage, cancel), composited_frame(frame, stream, mode, bgcolor, current_bg, blur_strength, tracker, model, blur_cache) as result:
+                    writer.write(result)
+            except (MemoryBudgetExceeded, JobCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ Frame {idx} error: {e}")
+
+            # Frame total is unknown for some live containers → use upload bytes
+            if reader.frame_count:
+                set_progress(progress_file, idx, reader.frame_count, "processing")
+            elif expected_size:
+                set_progress(progress_file, upload.size(), expected_size, "processing")
+    except JobCancelled:
+        writer.abort()  # don't finish files the job's new runner is writing
+        raise
+    finally:
+        reader.close()
+        if bg_cap: bg_cap.release()
+        inference_pool.close_stream(stream)
+        ok = writer.close()
+
+    if upload.failed or not ok or writer.frames == 0:
+        fail_progress(progress_file)
+        print("❌ Streaming video processing failed.")
+        return False
+
+    upload.done.wait()
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+    if not assemble_segments(seg_dir, output_path, audio_source=upload.path):
+        fail_progress(progress_file)
+        return False
+
+    print(f"✅ Saved processed video: {output_path} ({idx} frames)")
+    complete_progress(progress_file)
+    return True
+
+
+# =====================================================
+# ⚡ Fast preview render
+# =====================================================
+PREVIEW_MAX_WIDTH = 640
+PREVIEW_FPS = 10
+PREVIEW_MAX_SECONDS = 20
+
+
+def render_preview(input_path, preview_path, mode="color", color="#00ff00", bg_path=None, progress_file=None, blur_strength=25, roi=False, model=None, usage=None, cancel=None):
+    """
+    Render a quick preview: first PREVIEW_MAX_SECONDS, scaled to at most
+    PREVIEW_MAX_WIDTH wide, decimated to PREVIEW_FPS, x264 'ultrafast'.
+    The file only appears at `preview_path` once complete.
+    """
+    vf = f"fps={PREVIEW_FPS},scale='min({PREVIEW_MAX_WIDTH},iw)':-2"
+    try:
+        reader = FFmpegFrameReader(input_path, vf=vf, max_seconds=PREVIEW_MAX_SECONDS)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return False
+
+    try:
+        w, h = plan_video_frame(reader.width, reader.height)
+    except MemoryBudgetExceeded:
+        reader.close()
+        raise
+    total = int(reader.duration * reader.fps) if reader.duration else 0
+    bg_image, bg_cap = open_background(mode, bg_path, w, h)
+    bgcolor = parse_bgcolor(color)
+    tracker = SubjectTracker() if roi else None
+    blur_cache = BlurCache() if mode == "blur" else None
+    part_path = Path(preview_path).with_suffix(".part.mp4")
+    writer = FFmpegFrameWriter(part_path, w, h, reader.fps, preset="ultrafast")
+    stream = str(part_path)
+
+    try:
+        for idx, frame in enumerate(reader, start=1):
+            frame = fit_frame(frame, (w, h))
+            current_bg = next_background(bg_image, bg_cap, w, h)
+            try:
+                with batch_frame(w, h, usage, cancel), composited_frame(frame, stream, mode, bgcolor, current_bg, blur_strength, tracker, model, blur_cache) as result:
+                    writer.write(result)
+            except (MemoryBudgetExceeded, JobCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ Preview frame {idx} error: {e}")
+            set_progress(progress_file, idx, max(total, idx), "preview")
+    except JobCancelled:
+        writer.abort()  # don't finish files the job's new runner is writing
+        raise
+    finally:
+        reader.close()
+        if bg_cap: bg_cap.release()
+        inference_pool.close_stream(stream)
+        ok = writer.close()
+
+    if not ok or writer.frames == 0:
+        part_path.unlink(missing_ok=True)
+        return False
+    part_path.replace(preview_path)
+    print(f"⚡ Preview ready: {preview_path}")
+    return True
+
+
+def apply_modnet_video_preview(upload, output_path, preview_path, mode="color", color="#00ff00", bg_path=None, progress_file=None, blur_strength=25, full_render=True, roi=False, model=None, usage=None, cancel=None):
+    """
+    Preview job for an upload: render the fast preview first, then (optionally)
+    the full-quality render with the same settings. Both passes read the same
+    uploaded file and share the decoded background image. A preview left by
+    an interrupted run of the same job is reused.
+    """
+    upload.done.wait()
+    if upload.failed:
+        fail_progress(progress_file)
+        return False
+
+    if not Path(preview_path).exists():
+        start_progress(progress_file, "preview")
+        if not render_preview(str(upload.path), preview_path, mode, color, bg_path, progress_file, blur_strength, roi, model, usage, cancel):
+            fail_progress(progress_file)
+            return False
+
+    if not full_render:
         complete_progress(progress_file)
         return True
-    except Exception as e:
+    return apply_modnet_video_file(str(upload.path), output_path, mode, color, bg_path, progress_file, blur_strength, roi, model, usage, cancel)
+
+
+# =====================================================
+# 🫥 Matte / alpha export (no compositing)
+# =====================================================
+EXPORT_FORMATS = {
+    "mp4": ".mp4",              # composited video (default)
+    "matte": "_matte.mp4",      # grayscale matte video
+    "alpha": "_alpha.webm",     # VP9 with alpha channel
+    "png_zip": "_matte.zip",    # PNG matte sequence archive
+}
+
+
+def export_output_name(stem, export="mp4"):
+    """File name of a job output for an export format."""
+    return stem + EXPORT_FORMATS.get(export, ".mp4")
+
+
+def export_modnet_video(upload, output_path, export="matte", progress_file=None, roi=False, model=None, usage=None, cancel=None):
+    """
+    Export the matte of an uploaded video for downstream compositing.
+
+    export: 'matte'   grayscale matte video (MP4)
+            'alpha'   source colours + matte as alpha (VP9 WebM, straight alpha)
+            'png_zip' PNG matte sequence streamed into a ZIP archive
+    Only the matte is predicted per frame: no background compositing and,
+    except for 'alpha', no full-colour encode. The output only appears at
+    `output_path` once complete.
+    """
+    upload.done.wait()
+    if upload.failed:
+        fail_progress(progress_file)
+        return False
+
+    cap = cv2.VideoCapture(str(upload.path))
+    if not cap.isOpened():
+        print(f"❌ Cannot open video: {upload.path}")
+        fail_progress(progress_file)
+        return False
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    try:
+        w, h = plan_video_frame(w, h)
+    except MemoryBudgetExceeded:
+        cap.release()
+        raise
+    output_path = Path(output_path)
+    part_path = output_path.with_name(output_path.stem + ".part" + output_path.suffix)
+
+    if export == "alpha":
+        writer = FFmpegAlphaWriter(part_path, w, h, fps)
+    elif export == "png_zip":
+        writer = PNGSequenceWriter(output_path)
+    else:
+        writer = FFmpegMatteWriter(part_path, w, h, fps)
+    tracker = SubjectTracker() if roi else None
+    stream = str(part_path)
+
+    start_progress(progress_file, "processing")
+    try:
+        for idx in tqdm(range(frame_count), desc=f"Exporting {export}", ncols=80):
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                break
+            frame = fit_frame(frame, (w, h))
+            try:
+                with batch_frame(w, h, usage, cancel), matte_frame(frame, stream, tracker, model) as matte_u8:
+                    if export == "alpha":
+                        bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+                        bgra[:, :, 3] = matte_u8
+                        writer.write(bgra)
+                    else:
+                        writer.write(matte_u8)
+            except (MemoryBudgetExceeded, JobCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ Frame {idx} error: {e}")
+            set_progress(progress_file, idx + 1, frame_count, "processing")
+    except JobCancelled:
+        writer.abort()  # don't finish files the job's new runner is writing
+        raise
+    finally:
+        cap.release()
+        inference_pool.close_stream(stream)
+        ok = writer.close()
+
+    if not ok or writer.frames == 0:
+        part_path.unlink(missing_ok=True)
         fail_progress(progress_file)
-        print(f"❌ Error writing video: {e}")
+        print(f"❌ Matte export failed: {output_path}")
         return False
+    if export != "png_zip":
+        part_path.replace(output_path)
 
+    print(f"✅ Saved {export} export: {output_path}")
+    complete_progress(progress_file)
+    return True
 
 
+# =====================================================
+# 🧾 Job dispatch (API process and workers)
+# =====================================================
+def run_video_job(job, upload=None, usage=None, cancel=None):
+    """
+    Run a video job described by its manifest parameters (see jobs.py):
+    export, preview (+ full render) or full render. `upload` is the
+    GrowingFile of an upload still arriving; without it the input file is
+    taken as complete (resumed jobs, workers). Setting `cancel` stops the
+    job at the next frame with JobCancelled, leaving its outputs and
+    progress to whoever runs it now.
+    """
+    if upload is None:
+        upload = GrowingFile(job["input_path"])
+        upload.finish()
+    args = (job["mode"], job["color"], job["bg_path"], job["progress_path"], job["blur_strength"])
+    options = dict(roi=job.get("roi", False), model=job.get("model"), usage=usage, cancel=cancel)
+    export = job.get("export", "mp4")
+    if export != "mp4":
+        return export_modnet_video(upload, job["output_path"], export, job["progress_path"], **options)
+    if job["preview"]:
+        return apply_modnet_video_preview(upload, job["output_path"], job["preview_path"], *args,
+                                          job["full_render"], **options)
+    return apply_modnet_video_upload(upload, job["output_path"], *args, job["expected_size"], **options)
@@ -0,0 +1,484 @@
+"""
+process_pool.py
+---------------------------------
+Inference in separate processes, fed through shared-memory rings.
+
+MODNet itself releases the GIL, but the Python-level work around it
+(colour conversion, normalisation, matte post-processing, compositing) does
+not, so inference threads inside the uvicorn process slowed request
+handling down. The pool runs that work in spawned processes instead, one
+per governor slot with the governor's thread count each, so all cores do
+image work while the web process only moves bytes.
+
+Each process owns a `FrameRing`: one shared-memory block split into fixed
+slots. A call takes a free slot of its process, writes its input arrays into
+it, and sends only a small (slot, op, offsets, shapes, params) message; the
+process reads the inputs in place, writes the result behind them in the same
+slot, and answers with its offset and shape. The caller reads the result in
+place too, inside the `call` block; the slot is free again afterwards.
+Frames are never pickled.
+
+Streams (webcam sessions, video jobs) stick to one process, which keeps
+their ROI tracker, blur cache and background frame index. Calls fall back to
+the calling thread (`fits` is False) while the process they would go to has
+not loaded its models (new streams and unrouted calls go to ready processes
+only), and for frames too large for a slot. A process that dies is
+restarted; its in-flight calls fail. Operations import nothing from
+routers/, whose modules have side effects at import. A call that gets no answer within
+INFERENCE_CALL_TIMEOUT seconds fails too, and its process (presumably hung)
+is killed and restarted. `reload(name)` has every process reload a model
+from its checkpoint (the model registry is per process).
+
+Operations (`pool_op`): composite, matte, webcam_frame, render_image.
+
+Classes:
+    FrameRing, StreamState, InferencePool, PoolError
+
+Functions:
+    pool_op(name)
+
+Globals:
+    inference_pool   process-wide instance (started by the API and workers)
+
+Environment overrides:
+    INFERENCE_PROCESSES  (default: governor slots; 0 = inference in threads)
+    INFERENCE_RING_SLOTS (slots per process, default 2)
+    INFERENCE_SLOT_MB    (default 32)
+    INFERENCE_CALL_TIMEOUT (seconds, default 120)
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MB = 1024 * 1024
+ALIGN = 64
+MAX_STREAMS = 64           # stream states kept per process (and routes per process)
+CHECK_SECONDS = 1.0        # dead-process check interval
+STOP_SECONDS = 5.0
+
+INFERENCE_RING_SLOTS = int(os.environ.get("INFERENCE_RING_SLOTS") or 2)
+INFERENCE_SLOT_MB = int(os.environ.get("INFERENCE_SLOT_MB") or 32)
+INFERENCE_CALL_TIMEOUT = float(os.environ.get("INFERENCE_CALL_TIMEOUT") or 120)
+
+
+class PoolError(RuntimeError):
+    """An inference process failed a call (or died while running it)."""
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class FrameRing:
+    """`slots` fixed-size slots in one shared-memory block (created, or attached by name)."""
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots, self.slot_bytes = slots, slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    def view(self, slot, offset, shape, dtype):
+        """Array over part of a slot (no copy)."""
+        return np.ndarray(shape, np.dtype(dtype), buffer=self.shm.buf, offset=slot * self.slot_bytes + offset)
+
+    @staticmethod
+    def layout(arrays):
+        """{name: (offset, shape, dtype)} for the inputs, and where the result may start."""
+        specs, end = {}, 0
+        for name, array in arrays.items():
+            specs[name] = (end, array.shape, array.dtype.str)
+            end = _aligned(end + array.nbytes)
+        return specs, end
+
+    def close(self, unlink=False):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # views still alive; the mapping goes with the process
+        if unlink:
+            self.shm.unlink()
+
+
+# =====================================================
+# 🧠 Inference-process side
+# =====================================================
+OPS = {}
+
+
+def pool_op(name):
+    """Register `fn(state, inputs, params) -> ndarray | None` as pool operation `name`."""
+    def register(fn):
+        OPS[name] = fn
+        return fn
+    return register
+
+
+class StreamState:
+    """Per-stream state kept in an inference process: ROI tracker, blur cache, background frame index."""
+
+    def __init__(self):
+        self.tracker = None
+        self.blur_cache = None
+        self.bg_index = 0
+
+    def tools(self, roi, mode):
+        """(tracker or None, blur cache or None), created on first use."""
+        from inference.modnet_infer_video import SubjectTracker
+        from inference.blur import BlurCache
+        if roi and self.tracker is None:
+            self.tracker = SubjectTracker()
+        if mode == "blur" and self.blur_cache is None:
+            self.blur_cache = BlurCache()
+        return (self.tracker if roi else None), self.blur_cache
+
+
+@pool_op("composite")
+def _composite(state, inputs, params):
+    from inference.modnet_infer_video import apply_modnet_video
+    tracker, blur_cache = state.tools(params["roi"], params["mode"])
+    return apply_modnet_video(
+        inputs["frame"], mode=params["mode"], bgcolor=tuple(params["bgcolor"]), bg_image=inputs.get("bg"),
+        blur_strength=params["blur_strength"], tracker=tracker, model=params["model"], blur_cache=blur_cache,
+    )
+
+
+@pool_op("matte")
+def _matte(state, inputs, params):
+    from inference.modnet_infer_video import predict_tracked_matte
+    tracker, _ = state.tools(params["roi"], None)
+    matte = predict_tracked_matte(inputs["frame"], tracker, model=params["model"])
+    return (matte * 255 + 0.5).astype(np.uint8)
+
+
+@pool_op("webcam_frame")
+def _webcam_frame(state, inputs, params):
+    from inference.webcam import process_frame_sync
+    tracker, blur_cache = state.tools(params["roi"], "blur")
+    result = process_frame_sync(
+        inputs["frame"], params["mode"], params["color"], None, params["bg_path"], tracker,
+        params["infer_size"], params["fmt"], params["quality"], params["matte_only"], params["model"],
+        blur_cache, state,
+    )
+    if "error" in result:
+        raise ValueError(result["error"])
+    return np.frombuffer(result["image"], np.uint8)
+
+
+@pool_op("render_image")
+def _render_image(state, inputs, params):
+    from inference.modnet_infer import render_image_sync
+    bg = inputs.get("bg")
+    error = render_image_sync(
+        inputs["image"], bg.tobytes() if bg is not None else None, params["mode"], params["color"],
+        params["blur_strength"], params["hires"], params["original_path"], params["changed_path"],
+        params["bg_path"], params["model"],
+    )
+    if error:
+        raise ValueError(error)
+    return None
+
+
+def _serve(index, ring_name, slots, slot_bytes, tasks, results):
+    """Inference-process main loop."""
+    import inference.modnet_infer_video  # noqa: F401  (loads the model, sizes threads)
+
+    ring = FrameRing(slots, slot_bytes, ring_name)
+    streams = OrderedDict()
+    results.put(("ready", index))
+    while True:
+        message = tasks.get()
+        if message is None:
+            break
+        task_id, slot, op, stream, specs, end, params = message
+        if op == "close":
+            streams.pop(stream, None)
+            continue
+        if op == "reload":  # in the background: calls keep running on the old model meanwhile
+            from inference.registry import registry
+            threading.Thread(target=registry.reload, args=(params["name"],), daemon=True,
+                             name=f"model-reload-{params['name']}").start()
+            continue
+
+        state = streams.pop(stream, None) or StreamState()
+        if stream is not None:
+            streams[stream] = state
+            while len(streams) > MAX_STREAMS:
+                streams.popitem(last=False)
+        try:
+            inputs = {name: ring.view(slot, *spec) for name, spec in specs.items()}
+            out = OPS[op](state, inputs, params)
+            del inputs
+            spec = None
+            if out is not None:
+                out = np.ascontiguousarray(out)
+                if end + out.nbytes > slot_bytes:
+                    raise ValueError(f"{op} result ({out.nbytes // 1024} KB) does not fit a ring slot")
+                ring.view(slot, end, out.shape, out.dtype)[...] = out
+                spec = (end, out.shape, out.dtype.str)
+            results.put(("done", task_id, spec, None))
+        except Exception as e:
+            results.put(("done", task_id, None, (type(e).__name__, str(e))))
+    ring.close()
+
+
+# =====================================================
+# 🔌 API-process side
+# =====================================================
+class _Process:
+    """One inference process as seen from the API process."""
+
+    def __init__(self, index, slots, slot_bytes):
+        self.index = index
+        self.ring = FrameRing(slots, slot_bytes)
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.tasks = None
+        self.proc = None
+        self.ready = False
+        self.streams = 0
+        self.restarts = 0
+
+
+class InferencePool:
+    """Spawned inference processes with shared-memory rings (see module docstring)."""
+
+    def __init__(self, processes=None, slots=INFERENCE_RING_SLOTS, slot_mb=INFERENCE_SLOT_MB):
+        self.processes = processes
+        self.slots = slots
+        self.slot_bytes = slot_mb * MB
+        self.ctx = mp.get_context("spawn")
+        self.procs = []
+        self.results = None
+        self.pending = {}             # task id -> (Future, process index)
+        self.routes = OrderedDict()   # stream -> process index
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.running = False
+        self.calls = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        """Spawn the processes (they load their models in the background)."""
+        if self.running:
+            return
+        count = self.processes
+        if count is None:
+            env = os.environ.get("INFERENCE_PROCESSES")
+            if env is not None and env != "":
+                count = int(env)
+            else:
+                from inference.governor import governor
+                count = governor.slots
+        if count <= 0:
+            print("🧵 Inference process pool disabled (inference runs in threads)")
+            return
+        self.results = self.ctx.Queue()
+        self.procs = [_Process(i, self.slots, self.slot_bytes) for i in range(count)]
+        for p in self.procs:
+            self._spawn(p)
+        self.running = True
+        threading.Thread(target=self._collect, daemon=True, name="inference-pool").start()
+        print(f"🧠 Inference process pool: {count} processes × {self.slots} slots × {self.slot_bytes // MB} MB")
+
+    def _spawn(self, p):
+        p.tasks = self.ctx.Queue()
+        p.ready = False
+        p.proc = self.ctx.Process(
+            target=_serve, args=(p.index, p.ring.name, self.slots, self.slot_bytes, p.tasks, self.results),
+            daemon=True, name=f"inference-{p.index}",
+        )
+        p.proc.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        for p in self.procs:
+            p.tasks.put(None)
+        for p in self.procs:
+            p.proc.join(STOP_SECONDS)
+            if p.proc.is_alive():
+                p.proc.terminate()
+            p.ring.close(unlink=True)
+        with self.lock:
+            futures = self._take_pending()
+        for future in futures:
+            future.set_exception(PoolError("inference pool stopped"))
+
+    def _collect(self):
+        """Route results to waiting calls; restart processes that died."""
+        last_check = time.monotonic()
+        while self.running:
+            try:
+                message = self.results.get(timeout=CHECK_SECONDS)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                break
+            if message is not None and message[0] == "ready":
+                self.procs[message[1]].ready = True
+                print(f"✅ Inference process {message[1]} ready")
+            elif message is not None:
+                _, task_id, spec, error = message
+                with self.lock:
+                    future, _ = self.pending.pop(task_id, (None, None))
+                if future is None:
+                    pass
+                elif error is None:
+                    future.set_result(spec)
+                elif error[0] == "ValueError":
+                    future.set_exception(ValueError(error[1]))
+                else:
+                    future.set_exception(PoolError(f"{error[0]}: {error[1]}"))
+
+            if time.monotonic() - last_check >= CHECK_SECONDS:
+                last_check = time.monotonic()
+                for p in self.procs:
+                    if self.running and not p.proc.is_alive():
+                        print(f"💥 Inference process {p.index} died (exit {p.proc.exitcode}); restarting")
+                        with self.lock:  # no call can queue on the dead process meanwhile
+                            futures = self._take_pending(p.index)
+                            p.restarts += 1
+                            self._spawn(p)
+                        for future in futures:
+                            future.set_exception(PoolError("inference process died"))
+
+    def _recycle(self, p, task_id):
+        """Give up on a call that timed out and kill its process (`_collect` restarts it)."""
+        with self.lock:
+            self.pending.pop(task_id, None)
+            self.timeouts += 1
+        print(f"⏱️ Inference process {p.index} did not answer within {INFERENCE_CALL_TIMEOUT:g}s; recycling it")
+        if p.proc.is_alive():
+            p.proc.kill()
+
+    def _take_pending(self, index=None):
+        """Remove and return the futures of calls in flight (on one process, or all); lock held."""
+        failed = [tid for tid, (_, i) in self.pending.items() if index is None or i == index]
+        return [self.pending.pop(tid)[0] for tid in failed]
+
+    # ---------- Calls ----------
+    def fits(self, *arrays, out_bytes=0, stream=None):
+        """
+        True when the process a call for `stream` would go to is ready and
+        the arrays plus a result of `out_bytes` fit a slot.
+        """
+        if not self.running:
+            return False
+        with self.lock:
+            index = self.routes.get(stream) if stream is not None else None
+            ready = self.procs[index].ready if index is not None else any(p.ready for p in self.procs)
+        if not ready:
+            return False
+        need = sum(_aligned(a.nbytes) for a in arrays if a is not None) + out_bytes
+        if need > self.slot_bytes:
+            self.fallbacks += 1
+            return False
+        return True
+
+    def _route(self, stream):
+        with self.lock:
+            candidates = [p for p in self.procs if p.ready] or self.procs
+            if stream is None:  # most free slots
+                return max(candidates, key=lambda p: p.free.qsize())
+            index = self.routes.pop(stream, None)
+            if index is None:
+                index = min(candidates, key=lambda p: p.streams).index
+                self.procs[index].streams += 1
+            self.routes[stream] = index
+            # Streams nobody closed (abandoned clients): forget the oldest
+            while len(self.routes) > MAX_STREAMS * len(self.procs):
+                old, old_index = self.routes.popitem(last=False)
+                self._close(old, old_index)
+            return self.procs[index]
+
+    def _close(self, stream, index):
+        """Forget a routed stream and drop its state in its process; lock held."""
+        self.procs[index].streams -= 1
+        self.procs[index].tasks.put((None, None, "close", stream, None, None, None))
+
+    @contextmanager
+    def call(self, op, stream=None, params=None, **arrays):
+        """
+        Run pool operation `op` on `arrays` (None entries are skipped) in an
+        inference process; yields the result array (a view into shared
+        memory, valid inside the block) or None. Calls with the same
+        `stream` go to the same process. Raises ValueError for bad input and
+        PoolError when the process fails or does not answer in time.
+        """
+        arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items() if a is not None}
+        specs, end = FrameRing.layout(arrays)
+        if end > self.slot_bytes:
+            raise ValueError(f"{op} inputs do not fit a ring slot")
+        p = self._route(stream)
+        slot = p.free.get()
+        try:
+            for name, (offset, shape, dtype) in specs.items():
+                p.ring.view(slot, offset, shape, dtype)[...] = arrays[name]
+            future = Future()
+            task_id = next(self.ids)
+            with self.lock:
+                self.pending[task_id] = (future, p.index)
+                self.calls += 1
+                p.tasks.put((task_id, slot, op, stream, specs, end, params or {}))
+            try:
+                spec = future.result(INFERENCE_CALL_TIMEOUT)
+            except FutureTimeout:
+                self._recycle(p, task_id)
+                raise PoolError(f"{op} timed out in inference process {p.index}")
+            yield p.ring.view(slot, *spec) if spec is not None else None
+        finally:
+            p.free.put(slot)
+
+    def close_stream(self, stream):
+        """Drop a finished stream's state in its process."""
+        if not self.running:
+            return
+        with self.lock:
+            index = self.routes.pop(stream, None)
+            if index is not None:
+                self._close(stream, index)
+
+    def reload(self, name):
+        """Have every inference process reload model `name`; returns how many were asked."""
+        if not self.running:
+            return 0
+        with self.lock:
+            for p in self.procs:
+                p.tasks.put((None, None, "reload", None, None, None, {"name": name}))
+            return len(self.procs)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "running": self.running,
+                "processes": [
+                    {"index": p.index, "alive": p.proc.is_alive(), "ready": p.ready,
+                     "busy_slots": self.slots - p.free.qsize(), "streams": p.streams, "restarts": p.restarts}
+                    for p in self.procs
+                ],
+                "slot_mb": self.slot_bytes // MB,
+                "calls": self.calls,
+                "in_flight": len(self.pending),
+                "fallbacks": self.fallbacks,
+                "timeouts": self.timeouts,
+            }
+
+
+inference_pool = InferencePool()
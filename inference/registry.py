@@ -0,0 +1,176 @@
+"""
+registry.py
+---------------------------------
+On-demand MODNet model registry shared by the inference modules.
+
+Every checkpoint in `weights/` can be chosen per request by name. Models
+are loaded the first time they are asked for and kept in LRU order; when
+the loaded models exceed MODEL_MEMORY_BUDGET_MB the least recently used
+ones are dropped (callers still running on a dropped model keep their
+reference until they finish).
+
+Hot reload: a checkpoint that changes on disk (e.g. a retrained model
+copied over the old `.ckpt`) is noticed on the next `get` and reloaded in
+the background. The new module replaces the old one in a single dict
+assignment, so requests see either the old or the new model, never a
+half-loaded one. `reload(name)` forces the same.
+
+Classes:
+    ModelRegistry
+
+Globals:
+    registry, MODEL_CHECKPOINTS, DEFAULT_IMAGE_MODEL, DEFAULT_VIDEO_MODEL
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+from inference.weights import WEIGHTS_DIR, load_modnet_weights
+
+MODEL_CHECKPOINTS = {
+    "photographic": "modnet_finetuned_photographic.ckpt",
+    "webcam": "modnet_finetuned_webcam.ckpt",
+    "photographic_base": "modnet_photographic_portrait_matting.ckpt",
+    "webcam_base": "modnet_webcam_portrait_matting.ckpt",
+}
+DEFAULT_IMAGE_MODEL = "photographic"
+DEFAULT_VIDEO_MODEL = "webcam"
+
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get("MODEL_MEMORY_BUDGET_MB") or 512)
+RELOAD_CHECK_SECONDS = 2.0
+
+
+def _build_modnet():
+    # thirdparty/MODNet/src is put on sys.path by the inference modules
+    from models.modnet import MODNet
+    return MODNet(backbone_pretrained=False)
+
+
+def model_bytes(model) -> int:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Named MODNet models loaded on demand, LRU-evicted under a memory budget
+    and hot-reloaded when their checkpoint changes.
+    """
+
+    def __init__(self, checkpoints=MODEL_CHECKPOINTS, device=None,
+                 budget_mb=MODEL_MEMORY_BUDGET_MB, factory=_build_modnet):
+        self.checkpoints = {name: WEIGHTS_DIR / ckpt for name, ckpt in checkpoints.items()}
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.budget = budget_mb * 1024 * 1024
+        self.factory = factory
+        self.models = OrderedDict()   # name -> {"model", "bytes", "mtime", "loaded"}
+        self.lock = threading.Lock()
+        self.load_locks = {name: threading.Lock() for name in self.checkpoints}
+        self.reloading = set()
+        self.last_check = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def names(self):
+        return list(self.checkpoints)
+
+    def resolve(self, name, default):
+        """Validate a requested model name (empty → default)."""
+        name = name or default
+        if name not in self.checkpoints:
+            raise KeyError(f"Unknown model '{name}'. Available: {', '.join(self.checkpoints)}")
+        return name
+
+    # ---------- Loading ----------
+    def _mtime(self, name):
+        try:
+            return self.checkpoints[name].stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self, name):
+        ckpt = self.checkpoints[name]
+        mtime = self._mtime(name)
+        model = self.factory().to(self.device)
+        missing, unexpected = load_modnet_weights(model, ckpt, self.device)
+        model.eval()
+        print(f"✅ Model '{name}' loaded from {ckpt.name} ({self.device}) | "
+              f"Missing: {len(missing)} | Unexpected: {len(unexpected)}")
+        self.loads += 1
+        return {"model": model, "bytes": model_bytes(model), "mtime": mtime, "loaded": time.time()}
+
+    def _install(self, name, entry):
+        with self.lock:
+            self.models[name] = entry
+            self.models.move_to_end(name)
+            while len(self.models) > 1 and sum(e["bytes"] for e in self.models.values()) > self.budget:
+                victim, _ = self.models.popitem(last=False)
+                self.evictions += 1
+                print(f"♻️ Model '{victim}' evicted (memory budget)")
+
+    def get(self, name):
+        """Return the model called `name`, loading it if needed."""
+        with self.lock:
+            entry = self.models.get(name)
+            if entry is not None:
+                self.models.move_to_end(name)
+        if entry is None:
+            with self.load_locks[name]:  # one loader per model
+                with self.lock:
+                    entry = self.models.get(name)
+                if entry is None:
+                    entry = self._load(name)
+                    self._install(name, entry)
+        else:
+            self._maybe_reload(name, entry)
+        return entry["model"]
+
+    # ---------- Hot reload ----------
+    def _maybe_reload(self, name, entry):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_check.get(name, 0) < RELOAD_CHECK_SECONDS:
+                return
+            self.last_check[name] = now
+            mtime = self._mtime(name)
+            if mtime is None or mtime == entry["mtime"] or name in self.reloading:
+                return
+            self.reloading.add(name)
+        threading.Thread(target=self.reload, args=(name,), daemon=True,
+                         name=f"model-reload-{name}").start()
+
+    def reload(self, name):
+        """Load `name` from its checkpoint again and swap it in atomically."""
+        try:
+            with self.load_locks[name]:
+                entry = self._load(name)
+                self._install(name, entry)
+            print(f"🔄 Model '{name}' hot-reloaded")
+            return True
+        except Exception as e:
+            print(f"❌ Reload of model '{name}' failed, keeping the old one: {e}")
+            return False
+        finally:
+            self.reloading.discard(name)
+
+    def stats(self):
+        with self.lock:
+            loaded = {
+                name: {"mb": round(e["bytes"] / 1024 / 1024, 1), "loaded": e["loaded"]}
+                for name, e in self.models.items()
+            }
+        return {
+            "available": self.names(),
+            "loaded": loaded,
+            "budget_mb": round(self.budget / 1024 / 1024, 1),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "device": str(self.device),
+        }
+
+
+registry = ModelRegistry()
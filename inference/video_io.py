@@ -0,0 +1,551 @@
+"""
+video_io.py
+---------------------------------
+Streaming ffmpeg-based frame reader/writer for video jobs.
+
+Frames are piped through ffmpeg subprocesses as raw BGR24, so decoding and
+encoding run frame-by-frame instead of buffering a whole clip in memory.
+The reader can also follow a file that is still being uploaded.
+
+Classes:
+    GrowingFile          file being written by another task (upload)
+    FFmpegFrameReader    iterate BGR frames from a path or GrowingFile
+    FFmpegFrameWriter    encode BGR frames to H.264 as they are produced
+    FFmpegSegmentWriter  same, as a live HLS playlist of fMP4 segments
+    FFmpegMatteWriter    grayscale matte video (H.264 MP4)
+    FFmpegAlphaWriter    BGRA frames to VP9 WebM with an alpha channel
+    PNGSequenceWriter    matte frames as PNGs streamed into a ZIP archive
+
+Functions:
+    ffmpeg_exe()
+    sniff_streamable(growing)
+    probe_audio_codec(path)
+    segment_dir_for(output_path)
+    finished_segments(segment_dir)
+    segments_complete(segment_dir)
+    assemble_segments(segment_dir, output_path, audio_source)
+"""
+
+import re
+import shutil
+import struct
+import subprocess
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def ffmpeg_exe() -> str:
+    """Path of the ffmpeg binary bundled with imageio-ffmpeg (used by moviepy)."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+# =====================================================
+# 📥 Growing file (upload still in progress)
+# =====================================================
+class GrowingFile:
+    """A file another task is still appending to; readers tail it until finished."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = threading.Event()
+        self.failed = False
+
+    def finish(self):
+        self.done.set()
+
+    def abort(self):
+        self.failed = True
+        self.done.set()
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def wait_for(self, n_bytes: int, poll: float = 0.05) -> bool:
+        """Block until the file holds n_bytes or the writer finished."""
+        while self.size() < n_bytes and not self.done.is_set():
+            time.sleep(poll)
+        return self.size() >= n_bytes
+
+    def iter_chunks(self, chunk_size: int = 1 << 20, poll: float = 0.05):
+        """Yield file contents as they appear, until the writer finishes."""
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    yield chunk
+                    continue
+                if self.done.is_set():
+                    rest = f.read()
+                    if rest:
+                        yield rest
+                    return
+                time.sleep(poll)
+
+
+TS_SYNC = 0x47
+TS_PACKETS = ((188, 0), (192, 4))   # (packet size, sync byte offset): MPEG-TS, M2TS (4-byte timecode first)
+
+
+def _is_transport_stream(growing: GrowingFile) -> bool:
+    """Sync bytes at the start of three consecutive MPEG-TS or M2TS packets."""
+    for packet, first in TS_PACKETS:
+        need = first + 2 * packet + 1
+        if not growing.wait_for(need):
+            continue
+        with open(growing.path, "rb") as f:
+            data = f.read(need)
+        if all(data[first + i * packet] == TS_SYNC for i in range(3)):
+            return True
+    return False
+
+
+def sniff_streamable(growing: GrowingFile) -> bool:
+    """
+    Decide whether a partially uploaded container can be decoded front-to-back.
+
+    WebM/Matroska and MPEG-TS (or M2TS) always can. MP4/MOV only when the
+    `moov` index comes before `mdat` (faststart); otherwise the whole file
+    is needed.
+    """
+    if not growing.wait_for(12):
+        return False
+    with open(growing.path, "rb") as f:
+        head = f.read(12)
+    if head[:4] == b"\x1a\x45\xdf\xa3":       # EBML (webm / mkv)
+        return True
+    if TS_SYNC in (head[0], head[4]) and _is_transport_stream(growing):
+        return True
+    if head[4:8] != b"ftyp":
+        return False
+
+    # Walk top-level ISO-BMFF boxes until moov or mdat shows up
+    offset = 0
+    while True:
+        if not growing.wait_for(offset + 16):
+            return False
+        with open(growing.path, "rb") as f:
+            f.seek(offset)
+            header = f.read(16)
+        size, kind = struct.unpack(">I4s", header[:8])
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+        if kind == b"moov":
+            return True
+        if kind == b"mdat" or size < 8:
+            return False
+        offset += size
+
+
+# =====================================================
+# 🔊 Audio passthrough
+# =====================================================
+# Audio codecs MP4 can carry as-is; anything else (vorbis, pcm, ...) is
+# converted to AAC. Only the audio stream is ever re-encoded, never video.
+MP4_COPY_AUDIO = {"aac", "mp3", "ac3", "eac3", "alac", "opus"}
+_AUDIO_RE = re.compile(r"Stream #\d+:\d+.*?: Audio:\s*(\w+)")
+
+
+def probe_audio_codec(path):
+    """Return the first audio stream's codec name, or None if there is no audio."""
+    try:
+        proc = subprocess.run(
+            [ffmpeg_exe(), "-hide_banner", "-i", str(path)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    m = _AUDIO_RE.search(proc.stderr.decode("utf-8", "ignore"))
+    return m.group(1) if m else None
+
+
+def audio_codec_args(codec):
+    if codec in MP4_COPY_AUDIO:
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "160k"]
+
+
+# =====================================================
+# 🎞️ Reader
+# =====================================================
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_STREAM_RE = re.compile(r"Video:.*?,\s*(\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r"([\d.]+)\s*(?:fps|tbr)")
+
+
+class FFmpegFrameReader:
+    """
+    Decode frames with ffmpeg into BGR uint8 arrays.
+    `source` is a path, or a GrowingFile that is fed to ffmpeg through stdin.
+    `vf` is an optional ffmpeg filter chain (e.g. fps/scale for previews) and
+    `max_seconds` stops decoding after that much input.
+    """
+
+    def __init__(self, source, vf=None, max_seconds=None):
+        self.source = source
+        growing = isinstance(source, GrowingFile)
+        cmd = [
+            ffmpeg_exe(), "-hide_banner", "-nostats",
+            "-i", "pipe:0" if growing else str(source),
+            "-map", "0:v:0",
+        ]
+        if max_seconds:
+            cmd += ["-t", str(max_seconds)]
+        if vf:
+            cmd += ["-vf", vf]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-an", "pipe:1"]
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if growing else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.stderr_tail = []
+        if growing:
+            self._feeder = threading.Thread(target=self._feed, daemon=True)
+            self._feeder.start()
+
+        self.width, self.height, self.fps, self.duration = self._read_header()
+        if max_seconds and self.duration:
+            self.duration = min(self.duration, max_seconds)
+        self.frame_count = int(round(self.duration * self.fps)) if self.duration else 0
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    def _feed(self):
+        try:
+            for chunk in self.source.iter_chunks():
+                self.proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def _read_header(self):
+        duration, fps, in_output = 0.0, 0.0, False
+        for raw in iter(self.proc.stderr.readline, b""):
+            line = raw.decode("utf-8", "ignore").strip()
+            self.stderr_tail = (self.stderr_tail + [line])[-20:]
+            m = _DURATION_RE.search(line)
+            if m:
+                h, mnt, s = m.groups()
+                duration = int(h) * 3600 + int(mnt) * 60 + float(s)
+            if line.startswith("Output #0"):
+                in_output = True
+            if "Video:" in line:
+                m_fps = _FPS_RE.search(line)
+                if m_fps and not fps:
+                    fps = float(m_fps.group(1))
+                m = _STREAM_RE.search(line)
+                if in_output and m:
+                    return int(m.group(1)), int(m.group(2)), fps or 25.0, duration
+        self.close()
+        raise RuntimeError("ffmpeg could not open input: " + " | ".join(self.stderr_tail[-3:]))
+
+    def _drain_stderr(self):
+        for raw in iter(self.proc.stderr.readline, b""):
+            self.stderr_tail = (self.stderr_tail + [raw.decode("utf-8", "ignore").strip()])[-20:]
+
+    def __iter__(self):
+        n = self.width * self.height * 3
+        while True:
+            buf = self.proc.stdout.read(n)
+            if len(buf) < n:
+                break
+            yield np.frombuffer(buf, np.uint8).reshape(self.height, self.width, 3)
+        self.close()
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+# =====================================================
+# 🧩 Writer
+# =====================================================
+class FFmpegFrameWriter:
+    """
+    Encode BGR/BGRA frames to an H.264 MP4 through an ffmpeg stdin pipe.
+
+    With `audio_source` (a complete file), its audio stream is muxed into the
+    output by the same ffmpeg process while frames are encoded: copied when
+    MP4 supports the codec, otherwise converted to AAC.
+    """
+
+    def __init__(self, output_path, width, height, fps, preset="medium", audio_source=None):
+        self.output_path = Path(output_path)
+        self.width, self.height = width, height
+        audio_codec = probe_audio_codec(audio_source) if audio_source else None
+
+        cmd = self._input_args(width, height, fps)
+        if audio_codec:
+            cmd += ["-i", str(audio_source), "-map", "0:v:0", "-map", "1:a:0",
+                    *audio_codec_args(audio_codec), "-shortest"]
+        else:
+            cmd += ["-an"]
+        cmd += [
+            "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-movflags", "+faststart",
+            str(self.output_path),
+        ]
+        self._start(cmd)
+
+    @staticmethod
+    def _input_args(width, height, fps, pix_fmt="bgr24"):
+        return [
+            ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", pix_fmt,
+            "-s", f"{width}x{height}", "-r", f"{fps:.3f}",
+            "-i", "pipe:0",
+        ]
+
+    def _start(self, cmd):
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.frames = 0
+        self.aborted = False
+
+    def write(self, frame):
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def abort(self):
+        """Stop ffmpeg without finishing the output (close() then returns False)."""
+        self.aborted = True
+        self.proc.kill()
+
+    def close(self) -> bool:
+        """Finish encoding; returns True when ffmpeg exited cleanly."""
+        if self.aborted:
+            self.proc.wait()
+            return False
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        err = self.proc.stderr.read().decode("utf-8", "ignore").strip()
+        ok = self.proc.wait() == 0
+        if not ok:
+            print(f"❌ ffmpeg encode failed: {err}")
+        return ok
+
+
+# =====================================================
+# 📺 Segmented writer (live HLS, fragmented MP4)
+# =====================================================
+SEGMENT_SECONDS = 4
+PLAYLIST_NAME = "stream.m3u8"
+# MSE type for the segments (H.264 High, video only)
+SEGMENT_MIME = 'video/mp4; codecs="avc1.640028"'
+
+
+def segment_dir_for(output_path) -> Path:
+    """Folder holding the live HLS segments of a job's output file."""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + "_hls")
+
+
+class FFmpegSegmentWriter(FFmpegFrameWriter):
+    """
+    Encode frames into `segment_dir` as an HLS 'event' playlist of fMP4
+    segments (init.mp4 + seg_NNNNN.m4s). Each segment is listed as soon as it
+    is finished, so playback can start while later frames are still encoding.
+    Keyframes are forced on segment boundaries.
+
+    With `resume_seconds` > 0 the writer continues an interrupted playlist:
+    new segments are appended after the finished ones and their timestamps
+    start at `resume_seconds`.
+    """
+
+    def __init__(self, segment_dir, width, height, fps, preset="medium", segment_seconds=SEGMENT_SECONDS,
+                 resume_seconds=0.0):
+        self.segment_dir = Path(segment_dir)
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        self.output_path = self.segment_dir / PLAYLIST_NAME
+        self.width, self.height = width, height
+
+        hls_flags = "independent_segments+temp_file"
+        offset = []
+        if resume_seconds > 0:
+            hls_flags += "+append_list"
+            offset = ["-output_ts_offset", f"{resume_seconds:.6f}"]
+
+        cmd = self._input_args(width, height, fps) + [
+            "-an", *offset, "-c:v", "libx264", "-preset", preset, "-profile:v", "high",
+            "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+            "-f", "hls", "-hls_time", str(segment_seconds),
+            "-hls_playlist_type", "event", "-hls_segment_type", "fmp4",
+            "-hls_flags", hls_flags,
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", str(self.segment_dir / "seg_%05d.m4s"),
+            str(self.output_path),
+        ]
+        self._start(cmd)
+
+
+def finished_segments(segment_dir):
+    """
+    (count, seconds) of the segments already listed in a playlist. Segments
+    are only listed once fully written, so this is the resume checkpoint of
+    an interrupted job; (0, 0.0) when there is none.
+    """
+    playlist = Path(segment_dir) / PLAYLIST_NAME
+    try:
+        lines = playlist.read_text().splitlines()
+    except (FileNotFoundError, UnicodeDecodeError):
+        return 0, 0.0
+    count, seconds = 0, 0.0
+    for line in lines:
+        if line.startswith("#EXTINF:"):
+            count += 1
+            seconds += float(line[len("#EXTINF:"):].split(",")[0])
+    return count, seconds
+
+
+def segments_complete(segment_dir) -> bool:
+    """True once the encoder closed the playlist (#EXT-X-ENDLIST)."""
+    try:
+        return "#EXT-X-ENDLIST" in (Path(segment_dir) / PLAYLIST_NAME).read_text()
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
+
+
+def assemble_segments(segment_dir, output_path, audio_source=None) -> bool:
+    """
+    Build the final faststart MP4 from a finished segment playlist by stream
+    copy (no re-encode), adding the audio of `audio_source` in the same pass.
+    The output only appears at `output_path` once complete; the segment
+    folder is removed afterwards.
+    """
+    output_path = Path(output_path)
+    playlist = Path(segment_dir) / PLAYLIST_NAME
+    part_path = output_path.with_suffix(".part.mp4")
+    audio_codec = probe_audio_codec(audio_source) if audio_source else None
+
+    cmd = [ffmpeg_exe(), "-y", "-loglevel", "error", "-i", str(playlist)]
+    if audio_codec:
+        cmd += ["-i", str(audio_source), "-map", "0:v:0", "-map", "1:a:0",
+                *audio_codec_args(audio_codec), "-shortest"]
+    else:
+        cmd += ["-map", "0:v:0"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", str(part_path)]
+
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        print(f"❌ Segment assembly failed: {proc.stderr.decode('utf-8', 'ignore').strip()}")
+        part_path.unlink(missing_ok=True)
+        return False
+    part_path.replace(output_path)
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    return True
+
+
+# =====================================================
+# 🫥 Matte / alpha export writers
+# =====================================================
+class FFmpegMatteWriter(FFmpegFrameWriter):
+    """
+    Encode single-channel mattes (uint8, H×W) as a grayscale H.264 MP4.
+    Only one byte per pixel crosses the pipe and the chroma planes are flat,
+    so the file stays small.
+    """
+
+    def __init__(self, output_path, width, height, fps, preset="medium"):
+        self.output_path = Path(output_path)
+        self.width, self.height = width, height
+        cmd = self._input_args(width, height, fps, pix_fmt="gray") + [
+            "-an", "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-movflags", "+faststart",
+            str(self.output_path),
+        ]
+        self._start(cmd)
+
+    def write(self, matte):
+        self.proc.stdin.write(np.ascontiguousarray(matte).data)
+        self.frames += 1
+
+
+class FFmpegAlphaWriter(FFmpegFrameWriter):
+    """Encode BGRA frames (straight alpha) as VP9 WebM with an alpha channel."""
+
+    def __init__(self, output_path, width, height, fps):
+        self.output_path = Path(output_path)
+        self.width, self.height = width, height
+        cmd = self._input_args(width, height, fps, pix_fmt="bgra") + [
+            "-an", "-c:v", "libvpx-vp9", "-pix_fmt", "yuva420p",
+            "-b:v", "0", "-crf", "32", "-deadline", "good", "-cpu-used", "4",
+            "-row-mt", "1", "-auto-alt-ref", "0",
+            str(self.output_path),
+        ]
+        self._start(cmd)
+
+    def write(self, frame):
+        self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+
+class PNGSequenceWriter:
+    """
+    Write mattes as matte_000000.png, matte_000001.png, ... into a ZIP
+    archive, one entry per frame as it is produced (PNG is already
+    compressed, so entries are stored). Same write/close interface as the
+    ffmpeg writers; the archive only appears at `output_path` once complete.
+    """
+
+    def __init__(self, output_path, compression=3):
+        self.output_path = Path(output_path)
+        self.part_path = self.output_path.with_suffix(".part.zip")
+        self.file = open(self.part_path, "wb")
+        self.zip = zipfile.ZipFile(self.file, "w", compression=zipfile.ZIP_STORED)
+        self.params = [int(cv2.IMWRITE_PNG_COMPRESSION), compression]
+        self.frames = 0
+
+    def write(self, matte):
+        ok, buf = cv2.imencode(".png", matte, self.params)
+        if not ok:
+            raise RuntimeError("PNG encode failed")
+        self.zip.writestr(f"matte_{self.frames:06d}.png", buf.tobytes())
+        self.frames += 1
+
+    def abort(self):
+        """Drop the archive without finishing it (close() then returns False)."""
+        self.file.close()
+        self.zip.fp = None  # nothing left for ZipFile to finish
+
+    def close(self) -> bool:
+        """Publish the archive; False (and nothing published) when aborted, empty or failed."""
+        if self.zip.fp is None:
+            return False
+        if self.frames == 0:
+            self.abort()
+            self.part_path.unlink(missing_ok=True)
+            print("❌ Matte archive has no frames")
+            return False
+        try:
+            self.zip.close()
+        except Exception as e:
+            self.file.close()
+            print(f"❌ Matte archive failed: {e}")
+            self.part_path.unlink(missing_ok=True)
+            return False
+        self.file.close()
+        self.part_path.replace(self.output_path)
+        return True
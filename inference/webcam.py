@@ -0,0 +1,175 @@
+"""
+webcam.py
+---------------------------------
+Processing of one webcam frame: decode, matte or composite, encode.
+
+This runs in the API process or, with the inference process pool, in an
+inference process (pool op `webcam_frame`), so it lives here and imports
+nothing from routers/: importing a router in a spawned process would run
+its side effects (folders, gallery index, job resumption) there too.
+
+Functions:
+    process_frame_sync(frame_bytes, mode, color, ...)
+    encode_frame(image, fmt, quality)
+    webcam_matte(frame, tracker, infer_size, model)
+    get_next_bg_frame(bg_path, target_size, state)
+
+Environment overrides:
+    WEBCAM_MAX_WIDTH
+"""
+
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from inference.frame_store import bg_frame_cache
+from inference.modnet_infer_video import apply_modnet_video, predict_tracked_matte
+
+# Frames wider than this are scaled down (the client negotiates less)
+WEBCAM_MAX_WIDTH = int(os.environ.get("WEBCAM_MAX_WIDTH") or 1280)
+
+# =================================================
+# 🎥 Background Video Manager (for Webcam)
+# =================================================
+bg_video_cache = {
+    "cap": None,
+    "path": None,
+    "frame_count": 0,
+    "index": 0
+}
+
+def get_next_bg_frame(bg_path, target_size, state=None):
+    """
+    Next background-video frame for a webcam session, looping. Frames come
+    from the shared pre-decoded frame store (per-session frame index); while
+    the store for a new background is being built they are decoded directly.
+    """
+    if not bg_path:
+        return None
+    store = bg_frame_cache.open(bg_path, *target_size, wait=False)
+    if store is None:
+        return decode_next_bg_frame(bg_path, target_size)
+    index = 0
+    if state is not None:
+        index, state.bg_index = state.bg_index, state.bg_index + 1
+    return store.frame(index)
+
+
+def decode_next_bg_frame(bg_path, target_size):
+    """Read next frame from background video, looping when necessary."""
+    global bg_video_cache
+
+    if not bg_path:
+        return None
+
+    # Initialize or reload if new path
+    if (bg_video_cache["path"] != bg_path) or (bg_video_cache["cap"] is None):
+        if bg_video_cache["cap"]:
+            bg_video_cache["cap"].release()
+        cap = cv2.VideoCapture(str(bg_path))
+        if not cap.isOpened():
+            print(f"⚠️ Could not open background video: {bg_path}")
+            return None
+        bg_video_cache.update({
+            "cap": cap,
+            "path": bg_path,
+            "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1,
+            "index": 0
+        })
+        print(f"🎞️ Loaded webcam background video ({bg_video_cache['frame_count']} frames)")
+
+    cap = bg_video_cache["cap"]
+    total = bg_video_cache["frame_count"]
+    idx = bg_video_cache["index"]
+
+    ret, frame = cap.read()
+    if not ret:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        ret, frame = cap.read()
+        bg_video_cache["index"] = 1
+    else:
+        bg_video_cache["index"] = (idx + 1) % total
+
+    if ret and frame is not None:
+        frame = cv2.resize(frame, target_size)
+        return frame
+    return None
+
+
+# =================================================
+# 🧠 Process Single Frame (Webcam)
+# =================================================
+# Response image formats: name -> (extension, OpenCV quality flag)
+FRAME_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+}
+FRAME_MEDIA_TYPES = {".jpg": "image/jpeg", ".webp": "image/webp", ".png": "image/png"}
+
+
+def encode_frame(image, fmt="jpeg", quality=90):
+    """Encode a result once; returns the process_frame_sync result dict."""
+    ext, flag = FRAME_FORMATS.get(fmt, FRAME_FORMATS["jpeg"])
+    level = 3 if ext == ".png" else int(quality)  # PNG: compression level, lossless
+    ok, buffer = cv2.imencode(ext, image, [int(flag), level])
+    if not ok:
+        return {"error": "Could not encode frame"}
+    return {"image": buffer.tobytes(), "ext": ext}
+
+
+def webcam_matte(frame, tracker=None, infer_size=512, model=None):
+    """
+    Matte-only result: uint8 grayscale, no larger than the inference
+    resolution (the browser upsamples it while compositing).
+    """
+    h, w = frame.shape[:2]
+    scale = min(1.0, infer_size / max(h, w))
+    out_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    matte = predict_tracked_matte(frame, tracker, infer_size, out_size, model)
+    return (matte * 255 + 0.5).astype(np.uint8)
+
+
+def process_frame_sync(frame_bytes, mode, color, bg_file_data=None, bg_temp_path=None, tracker=None,
+                       infer_size=512, fmt="jpeg", quality=90, matte_only=False, model=None,
+                       blur_cache=None, state=None):
+    """
+    Heavy synchronous MODNet frame processing (runs in thread).
+    matte_only skips background loading and compositing entirely.
+    """
+    npimg = np.frombuffer(frame_bytes, np.uint8)
+    frame = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    if frame is None:
+        return {"error": "Invalid webcam frame"}
+    if frame.shape[1] > WEBCAM_MAX_WIDTH:  # client ignored the negotiated width
+        scale = WEBCAM_MAX_WIDTH / frame.shape[1]
+        frame = cv2.resize(frame, (WEBCAM_MAX_WIDTH, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    if matte_only:
+        return encode_frame(webcam_matte(frame, tracker, infer_size, model), fmt, quality)
+
+    # Parse color
+    hex_color = color.lstrip("#")
+    r, g, b = int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+    bg_bgr = (b, g, r)
+
+    bg_img = None
+    if bg_temp_path:
+        ext = Path(bg_temp_path).suffix.lower()
+        if ext in [".mp4", ".mov", ".avi", ".mkv"]:
+            bg_img = get_next_bg_frame(bg_temp_path, (frame.shape[1], frame.shape[0]), state)
+        else:
+            img = cv2.imread(str(bg_temp_path))
+            if img is not None:
+                bg_img = cv2.resize(img, (frame.shape[1], frame.shape[0]))
+
+    elif bg_file_data:
+        bg_np = np.frombuffer(bg_file_data, np.uint8)
+        bg_img = cv2.imdecode(bg_np, cv2.IMREAD_COLOR)
+
+    result = apply_modnet_video(frame, mode=mode, bgcolor=bg_bgr, bg_image=bg_img, tracker=tracker, infer_size=infer_size, model=model,
+                                blur_cache=blur_cache)
+
+    # Encode exactly once; the same bytes are returned and (optionally) saved
+    return encode_frame(result, fmt, quality)
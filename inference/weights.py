@@ -0,0 +1,111 @@
+"""
+weights.py
+---------------------------------
+Memory-mapped MODNet weight loading shared by the inference modules.
+
+The `.ckpt` files in `weights/` are converted once into a `.safetensors`
+sibling. Later loads memory-map that file instead of unpickling the
+checkpoint, so every uvicorn worker (and any other process on the box)
+reads the same page-cache pages instead of holding its own copy.
+
+Functions:
+    safetensors_path(ckpt_path)
+    convert_checkpoint(ckpt_path, st_path)
+    ensure_safetensors(ckpt_path)
+    load_modnet_weights(model, ckpt_path, device)
+
+Usage (convert everything ahead of a deploy):
+    python -m inference.weights
+"""
+
+import os
+from pathlib import Path
+
+import torch
+from filelock import FileLock
+from safetensors.torch import load_file, save_file
+
+ROOT = Path(__file__).resolve().parent.parent
+WEIGHTS_DIR = ROOT / "weights"
+
+
+def safetensors_path(ckpt_path) -> Path:
+    """Return the `.safetensors` file that mirrors a `.ckpt` checkpoint."""
+    return Path(ckpt_path).with_suffix(".safetensors")
+
+
+def _clean_state(state) -> dict:
+    """Unwrap `state_dict` and strip the DataParallel `module.` prefix."""
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+    return {
+        k.replace("module.", ""): v.contiguous()
+        for k, v in state.items()
+        if isinstance(v, torch.Tensor)
+    }
+
+
+def convert_checkpoint(ckpt_path, st_path=None) -> Path:
+    """Convert a torch `.ckpt` into a `.safetensors` file (atomic replace)."""
+    ckpt_path = Path(ckpt_path)
+    st_path = Path(st_path) if st_path else safetensors_path(ckpt_path)
+
+    state = _clean_state(torch.load(ckpt_path, map_location="cpu"))
+    tmp_path = st_path.with_name(st_path.name + ".tmp")
+    save_file(state, str(tmp_path), metadata={"source": ckpt_path.name})
+    os.replace(tmp_path, st_path)
+    print(f"💾 Converted {ckpt_path.name} → {st_path.name} ({len(state)} tensors)")
+    return st_path
+
+
+def ensure_safetensors(ckpt_path) -> Path:
+    """
+    Return an up-to-date `.safetensors` copy of `ckpt_path`, converting it if
+    missing or older than the checkpoint. A file lock keeps concurrent
+    workers from converting the same file twice.
+    """
+    ckpt_path = Path(ckpt_path)
+    st_path = safetensors_path(ckpt_path)
+
+    def is_stale():
+        if not st_path.exists():
+            return True
+        return ckpt_path.exists() and ckpt_path.stat().st_mtime > st_path.stat().st_mtime
+
+    if not is_stale():
+        return st_path
+
+    if not ckpt_path.exists():
+        raise FileNotFoundError(
+            f"Model checkpoint not found at '{ckpt_path}'. "
+            "Please ensure the file exists before running the application."
+        )
+
+    with FileLock(str(st_path) + ".lock"):
+        if is_stale():
+            convert_checkpoint(ckpt_path, st_path)
+    return st_path
+
+
+def load_modnet_weights(model, ckpt_path, device):
+    """
+    Load checkpoint weights into `model` and return (missing, unexpected).
+
+    On CPU the memory-mapped tensors are assigned to the module directly
+    (`assign=True`), so parameters stay backed by the shared file pages and
+    nothing is copied. On CUDA the weights are copied to the device as usual.
+    """
+    st_path = ensure_safetensors(ckpt_path)
+    state = load_file(str(st_path), device="cpu")
+
+    if torch.device(device).type == "cpu":
+        return model.load_state_dict(state, strict=False, assign=True)
+    return model.load_state_dict(state, strict=False)
+
+
+if __name__ == "__main__":
+    for ckpt in sorted(WEIGHTS_DIR.glob("*.ckpt")):
+        try:
+            convert_checkpoint(ckpt)
+        except Exception as e:
+            print(f"⚠️ Could not convert {ckpt.name}: {e}")
@@ -0,0 +1,73 @@
+"""
+jobs.py
+---------------------------------
+JSON job manifests for long-running video jobs.
+
+A manifest records everything needed to run a job again (paths and
+options) plus its status. Together with the encoded segments it lets a
+restarted server pick up jobs that were interrupted mid-way.
+
+Functions:
+    job_manifest_path(dir, job_id)
+    save_job(path, **params)
+    update_job(path, **changes)
+    load_job(path)
+    unfinished_jobs(dir)
+
+Classes:
+    JobCancelled
+"""
+
+import os
+import json, time
+from pathlib import Path
+
+
+class JobCancelled(Exception):
+    """The job was taken away from this run (e.g. a worker's lease was lost)."""
+
+
+def job_manifest_path(directory, job_id: str) -> Path:
+    return Path(directory) / f"job_{job_id}.json"
+
+
+def _write(path: Path, data: dict):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def save_job(manifest_file, **params):
+    """Create a manifest for a newly started job (status 'running')."""
+    p = Path(manifest_file)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    data = {**params, "status": "running", "created": time.time(), "updated": time.time()}
+    _write(p, data)
+    return data
+
+
+def update_job(manifest_file, **changes):
+    """Merge `changes` into an existing manifest (no-op if it is gone)."""
+    data = load_job(manifest_file)
+    if data is None:
+        return None
+    data.update(changes, updated=time.time())
+    _write(Path(manifest_file), data)
+    return data
+
+
+def load_job(manifest_file):
+    try:
+        return json.loads(Path(manifest_file).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def unfinished_jobs(directory):
+    """Manifests still marked 'running' (i.e. interrupted by a restart)."""
+    jobs = []
+    for p in sorted(Path(directory).glob("job_*.json")):
+        data = load_job(p)
+        if data and data.get("status") == "running":
+            jobs.append((p, data))
+    return jobs
@@ -0,0 +1,409 @@
+"""
+loadtest.py
+---------------------------------
+Load generator for the processing endpoints.
+
+Drives /api/image/process, /api/video/process_frame and
+/api/video/process_video (plus, optionally, the /ws/modnet WebSocket
+stream) with N concurrent virtual users and a weighted request mix, using
+synthetic media generated up front. The target is either a running server
+(--url) or the app started in this process on a local uvicorn
+(--in-process, run from the project root).
+
+While the test runs, a sampler polls /api/compute/status and
+/api/video/webcam_status, so the report shows server-side queue depth over
+time next to the client-side numbers:
+
+    per scenario   requests, throughput, p50/p95/p99 latency, error rate,
+                   superseded (204) and shed (503) frames (counted apart
+                   from errors: they are the server's admission control)
+    time series    completed requests/s, interactive/batch slots waiting
+                   and active, queued webcam frames
+
+Only the standard library, OpenCV/NumPy (synthetic media) and the
+project's own dependencies are used; the WebSocket scenario needs the
+`websockets` package.
+
+Usage:
+    python loadtest.py --url http://127.0.0.1:8000 --concurrency 8 --duration 60 \\
+        --mix frame=8,image=1,video=0.1 [--json report.json]
+    python loadtest.py --in-process --concurrency 4 --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import random
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+SCENARIOS = ("image", "frame", "video", "ws")
+DEFAULT_MIX = "frame=8,image=1,video=0.1"
+
+
+# =====================================================
+# 🎨 Synthetic media
+# =====================================================
+def synthetic_frame(w, h, t=0.0, seed=0):
+    """A person-like silhouette (head + torso) over a textured background."""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    frame = np.dstack([xs / w * 200, ys / h * 160, np.full((h, w), 90, np.float32)])
+    frame += rng.normal(0, 12, frame.shape)
+    cx = int(w * (0.5 + 0.15 * np.sin(t)))
+    cv2.ellipse(frame, (cx, int(h * 0.32)), (int(w * 0.09), int(h * 0.13)), 0, 0, 360, (150, 170, 220), -1)
+    cv2.rectangle(frame, (cx - int(w * 0.16), int(h * 0.45)), (cx + int(w * 0.16), h), (60, 60, 140), -1)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(frame, quality=85):
+    ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buf.tobytes()
+
+
+def synthetic_clip(path, w, h, fps=25, seconds=2.0):
+    """Write a short H.264 clip of a moving silhouette; returns its bytes."""
+    from inference.video_io import FFmpegFrameWriter
+    writer = FFmpegFrameWriter(path, w, h, fps, preset="ultrafast")
+    for i in range(int(fps * seconds)):
+        writer.write(synthetic_frame(w, h, t=i / fps, seed=i))
+    if not writer.close():
+        raise RuntimeError("Could not encode the synthetic clip")
+    return Path(path).read_bytes()
+
+
+# =====================================================
+# 🌐 HTTP helpers (stdlib, keep-alive per virtual user)
+# =====================================================
+def multipart(fields, files):
+    """Encode form fields and files ({name: (filename, bytes, type)}) as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, ctype) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {ctype}\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """One persistent HTTP connection (reconnects after errors)."""
+
+    def __init__(self, base_url, timeout=120):
+        u = urlsplit(base_url)
+        self.host, self.port, self.timeout = u.hostname, u.port or 80, timeout
+        self.conn = None
+        self.ws = None  # WebSocket scenario connection
+
+    def request(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            resp = self.conn.getresponse()
+            return resp.status, resp.read()
+        except Exception:
+            self.conn.close()
+            self.conn = None
+            raise
+
+    def get_json(self, path):
+        status, data = self.request("GET", path)
+        return json.loads(data) if status == 200 else None
+
+
+# =====================================================
+# 🧪 Scenarios (one request each → HTTP status)
+# =====================================================
+class Scenarios:
+    def __init__(self, args, media):
+        self.args = args
+        self.media = media
+
+    def image(self, client, user):
+        body, ctype = multipart({"mode": "color", "color": "#00ff00"},
+                                {"file": (f"load_{user}.jpg", self.media["image"], "image/jpeg")})
+        status, _ = client.request("POST", "/api/image/process", body, {"Content-Type": ctype})
+        return status
+
+    def frame(self, client, user):
+        fields = {"mode": "color", "color": "#00ff00", "session": f"load-{user}",
+                  "binary": str(self.args.frame_binary).lower(), "format": "jpeg",
+                  "matte_only": str(self.args.matte_only).lower(), "roi": str(self.args.roi).lower()}
+        body, ctype = multipart(fields, {"file": ("frame.jpg", self.media["frame"], "image/jpeg")})
+        status, _ = client.request("POST", "/api/video/process_frame", body, {"Content-Type": ctype})
+        return status
+
+    def video(self, client, user):
+        fields = {"mode": "color", "color": "#00ff00", "preview": "false", "full_render": "true"}
+        body, ctype = multipart(fields, {"file": ("clip.mp4", self.media["video"], "video/mp4")})
+        status, data = client.request("POST", "/api/video/process_video", body, {"Content-Type": ctype})
+        if status != 200 or not self.args.wait_video:
+            return status
+        # Latency until the job is done, not just accepted
+        progress_id = json.loads(data)["progress_id"]
+        while True:
+            stage = (client.get_json(f"/api/video/progress/{progress_id}") or {}).get("stage")
+            if stage in ("done", "failed"):
+                return 200 if stage == "done" else 500
+            time.sleep(0.5)
+
+    def ws(self, client, user):
+        from websockets.sync.client import connect
+        if client.ws is None:
+            u = urlsplit(self.args.url)
+            client.ws = connect(f"ws://{u.hostname}:{u.port or 80}{self.args.ws_path}")
+        conn = client.ws
+        try:
+            conn.send(self.media["frame"])
+            conn.recv(timeout=client.timeout)
+        except Exception:
+            client.ws = None
+            conn.close()
+            raise
+        return 200
+
+
+# =====================================================
+# 📊 Recording
+# =====================================================
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self.samples = []
+
+    def record(self, scenario, seconds, status):
+        with self.lock:
+            self.completed += 1
+            self.statuses[scenario][status] += 1
+            if status == 200:
+                self.latencies[scenario].append(seconds)
+
+    def error(self, scenario, exc):
+        with self.lock:
+            self.completed += 1
+            self.errors[scenario] += 1
+            self.statuses[scenario][type(exc).__name__] += 1
+
+    def report(self, elapsed):
+        out = {}
+        for scenario, counts in self.statuses.items():
+            total = sum(counts.values())
+            lat = sorted(self.latencies[scenario])
+            failed = sum(n for s, n in counts.items() if s not in (200, 204, 503))
+            out[scenario] = {
+                "requests": total,
+                "ok": counts.get(200, 0),
+                "rps": round(counts.get(200, 0) / elapsed, 2),
+                "p50_ms": _ms(percentile(lat, 50)),
+                "p95_ms": _ms(percentile(lat, 95)),
+                "p99_ms": _ms(percentile(lat, 99)),
+                "error_rate": round(failed / total, 4) if total else 0.0,
+                "superseded": counts.get(204, 0),
+                "shed_503": counts.get(503, 0),
+                "statuses": {str(k): v for k, v in counts.items()},
+            }
+        return out
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def sample_server(base_url, recorder, stop, interval):
+    """Poll server-side queue state every `interval` seconds until `stop` is set."""
+    client = Client(base_url, timeout=10)
+    start = time.perf_counter()
+    last_completed = 0
+    while not stop.wait(interval):
+        sample = {"t": round(time.perf_counter() - start, 1)}
+        with recorder.lock:
+            sample["rps"] = round((recorder.completed - last_completed) / interval, 2)
+            last_completed = recorder.completed
+        try:
+            compute = client.get_json("/api/compute/status") or {}
+            webcam = client.get_json("/api/video/webcam_status") or {}
+        except Exception:
+            compute, webcam = {}, {}
+        for priority in ("interactive", "batch"):
+            sample[f"{priority}_waiting"] = compute.get(priority, {}).get("waiting")
+            sample[f"{priority}_active"] = compute.get(priority, {}).get("active")
+        sample["webcam_queued"] = webcam.get("queued")
+        sample["webcam_busy"] = webcam.get("busy_sessions")
+        recorder.samples.append(sample)
+
+
+# =====================================================
+# 🚀 Runner
+# =====================================================
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def virtual_user(user, args, scenarios, mix, recorder, deadline, budget):
+    client = Client(args.url, timeout=args.timeout)
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(user)
+    while time.perf_counter() < deadline and budget.acquire(blocking=False):
+        scenario = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status = getattr(scenarios, scenario)(client, user)
+            recorder.record(scenario, time.perf_counter() - start, status)
+        except Exception as e:
+            recorder.error(scenario, e)
+        if scenario == "frame" and args.think_ms:
+            time.sleep(args.think_ms / 1000)
+
+
+def wait_until_ready(base_url, timeout=300):
+    """Wait until the heavy routers are loaded (compute status answers)."""
+    client = Client(base_url, timeout=5)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if client.get_json("/api/compute/status") is not None:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} not ready after {timeout}s")
+
+
+def start_in_process_server():
+    """Run the app on a local uvicorn in a background thread; returns its base URL."""
+    import uvicorn
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config("main:app", host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True, name="loadtest-uvicorn").start()
+    return f"http://127.0.0.1:{port}"
+
+
+def build_media(args, mix):
+    media = {}
+    if "image" in mix:
+        media["image"] = encode_jpeg(synthetic_frame(args.image_width, args.image_width * 3 // 4, seed=1))
+    if "frame" in mix or "ws" in mix:
+        media["frame"] = encode_jpeg(synthetic_frame(args.frame_width, args.frame_width * 3 // 4, seed=2), 70)
+    if "video" in mix:
+        with tempfile.TemporaryDirectory() as tmp:
+            media["video"] = synthetic_clip(Path(tmp) / "clip.mp4", args.video_width,
+                                            args.video_width * 9 // 16, seconds=args.video_seconds)
+    return media
+
+
+def print_report(report):
+    cols = ("requests", "rps", "p50_ms", "p95_ms", "p99_ms", "error_rate", "superseded", "shed_503")
+    print(f"\n{'scenario':<10}" + "".join(f"{c:>12}" for c in cols))
+    for scenario, row in report["scenarios"].items():
+        print(f"{scenario:<10}" + "".join(f"{'-' if row[c] is None else row[c]:>12}" for c in cols))
+
+    if report["samples"]:
+        keys = ("t", "rps", "interactive_waiting", "interactive_active", "batch_waiting", "batch_active", "webcam_queued")
+        print("\n" + "".join(f"{k:>20}" for k in keys))
+        for sample in report["samples"]:
+            print("".join(f"{'-' if sample.get(k) is None else sample[k]:>20}" for k in keys))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test for the processing endpoints.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of a running server")
+    target.add_argument("--in-process", action="store_true", help="start the app on a local uvicorn in this process")
+    parser.add_argument("--concurrency", type=int, default=4, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted scenarios ({', '.join(SCENARIOS)})")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a user's webcam frames")
+    parser.add_argument("--frame-width", type=int, default=640)
+    parser.add_argument("--image-width", type=int, default=1600)
+    parser.add_argument("--video-width", type=int, default=640)
+    parser.add_argument("--video-seconds", type=float, default=2.0)
+    parser.add_argument("--frame-binary", action="store_true", help="binary webcam responses")
+    parser.add_argument("--matte-only", action="store_true", help="matte-only webcam responses")
+    parser.add_argument("--roi", action="store_true", help="ROI tracking for webcam frames")
+    parser.add_argument("--wait-video", action="store_true", help="video latency = until the job is done")
+    parser.add_argument("--ws-path", default="/ws/modnet", help="WebSocket frame endpoint")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.in_process:
+        args.url = start_in_process_server()
+    print(f"⏳ Waiting for {args.url} ...")
+    wait_until_ready(args.url)
+
+    print("🎨 Generating synthetic media ...")
+    scenarios = Scenarios(args, build_media(args, mix))
+    recorder = Recorder()
+    budget = threading.Semaphore(args.requests or 10 ** 9)
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_server, args=(args.url, recorder, stop, args.sample_interval), daemon=True)
+
+    print(f"🚀 {args.concurrency} users, mix {mix}, {args.duration:.0f}s against {args.url}")
+    start = time.perf_counter()
+    deadline = start + args.duration
+    users = [threading.Thread(target=virtual_user, args=(i, args, scenarios, mix, recorder, deadline, budget))
+             for i in range(args.concurrency)]
+    sampler.start()
+    for u in users:
+        u.start()
+    for u in users:
+        u.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    report = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "elapsed_s": round(elapsed, 2),
+        "scenarios": recorder.report(elapsed),
+        "samples": recorder.samples,
+    }
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,8 @@ folders = [
     "video/changed",
     "images/upload",
     "images/changed",
-    "images/background"
+    "images/background",
+    "images/bulk"
 ]
 
 for folder in folders:
@@ -54,6 +55,7 @@ app.mount("/video/changed", StaticFiles(directory="video/changed"), name="video_
 app.mount("/images/upload", NoCacheStaticFiles(directory="images/upload"), name="upload")
 app.mount("/images/changed", NoCacheStaticFiles(directory="images/changed"), name="changed")
 app.mount("/images/background", NoCacheStaticFiles(directory="images/background"), name="background")
+app.mount("/images/bulk", NoCacheStaticFiles(directory="images/bulk"), name="bulk")
 
 # ---------------- Lightweight Routers ----------------
 
@@ -76,7 +78,7 @@ async def load_heavy_routers():
         "routers.record_api",
         "routers.image_api",
         "routers.background_api",
-        
+        "routers.compute_api",
     ]
 
     print("🚀 Loading routers asynchronously...")
@@ -88,6 +90,38 @@ async def load_heavy_routers():
 
     print("✅ All routers loaded asynchronously.")
 
+    # Pick up video jobs cut off by the last restart (before retention runs;
+    # manifest and progress scans are file I/O, so off the event loop)
+    await asyncio.to_thread(importlib.import_module("routers.video_api").resume_unfinished_jobs)
+
+@app.on_event("startup")
+async def load_gallery_index():
+    """Load (or rebuild) the gallery index off the event loop, before the first list request."""
+    await asyncio.to_thread(gallery_api.get_gallery_index)
+
+@app.on_event("startup")
+async def start_retention():
+    """Enforce artefact quotas on a background schedule (not in request paths)."""
+    CleanFiles.retention.start()
+
+@app.on_event("startup")
+async def start_inference_pool():
+    """Move inference into worker processes (INFERENCE_PROCESSES=0 keeps it in threads)."""
+    from inference.process_pool import inference_pool
+    await asyncio.to_thread(inference_pool.start)
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    from inference.process_pool import inference_pool
+    await asyncio.to_thread(inference_pool.stop)
+
+@app.on_event("startup")
+async def start_local_worker():
+    """Run bulk image jobs in-process unless separate workers take them (JOB_WORKERS=remote)."""
+    from broker import REMOTE_WORKERS
+    if not REMOTE_WORKERS:
+        importlib.import_module("worker").start_local_worker(("image",))
+
 # ---------------- Web Pages ----------------
 
 
@@ -1,13 +1,210 @@
+import asyncio
+import shutil
+import threading
+import time
 from pathlib import Path
 from fastapi import APIRouter
 
 MAX_FILES_PER_FOLDER = 20
+RETENTION_INTERVAL = 30      # seconds between enforcement passes
+RESCAN_EVERY = 10            # full directory rescan every N passes
+PART_IDLE_SECONDS = 600      # `.part` outputs written to within this are in progress
+
 router = APIRouter(prefix="/api/clean", tags=["Clean API"])
 
-def cleanup_old_files(folder: Path, max_files: int = 20):
-    files = sorted(folder.glob("*"), key=lambda f: f.stat().st_mtime, reverse=True)
-    for old_file in files[max_files:]:
+GB = 1024 ** 3
+HOUR = 3600
+
+
+class RetentionManager:
+    """
+    In-memory index of generated artefacts with per-directory quotas.
+
+    Request paths only call `track(path)` after writing a file (one stat).
+    Quotas (max files, max bytes, max age) are enforced by a background
+    task against the index; directories are only re-globbed every
+    RESCAN_EVERY passes to pick up files written outside `track`.
+    Files in use by a running job can be protected with `hold`/`release`.
+    Partial outputs (`name.part.ext`, renamed into place when complete) are
+    written by jobs in this or other processes (workers, inference pool),
+    so they are never held; they are kept while they were modified within
+    PART_IDLE_SECONDS instead, and only abandoned ones count against quotas.
+    Sub-folders (e.g. HLS segment folders) count as one artefact whose size
+    is the sum of their files.
+    """
+
+    def __init__(self):
+        self.policies = {}   # folder -> {"max_files", "max_bytes", "max_age", "pattern"}
+        self.index = {}      # folder -> {path: (mtime, size)}
+        self.held = set()
+        self.deleted = 0
+        self.passes = 0
+        self.lock = threading.Lock()
+        self._task = None
+
+    # ---------- Registration ----------
+    def register(self, folder, max_files=None, max_bytes=None, max_age=None, pattern="*"):
+        folder = Path(folder).resolve()
+        self.policies[folder] = {
+            "max_files": max_files, "max_bytes": max_bytes,
+            "max_age": max_age, "pattern": pattern,
+        }
+        self.index.setdefault(folder, {})
+
+    # ---------- Index maintenance ----------
+    def rescan(self, folder=None):
+        """Rebuild the index from disk (all folders or one)."""
+        folders = [Path(folder).resolve()] if folder else list(self.policies)
+        for f in folders:
+            f.mkdir(parents=True, exist_ok=True)
+            entries = {}
+            for p in f.glob(self.policies[f]["pattern"]):
+                entry = self._stat(p)
+                if entry:
+                    entries[p] = entry
+            with self.lock:
+                self.index[f] = entries
+
+    @staticmethod
+    def _stat(path):
+        """(mtime, size) of a file or folder, None if it vanished."""
         try:
-            old_file.unlink()
-        except Exception as e:
-            print(f"⚠️ Could not delete {old_file}: {e}")
\ No newline at end of file
+            st = path.stat()
+            if path.is_dir():
+                size = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+                return (st.st_mtime, size)
+            return (st.st_mtime, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def track(self, path):
+        """Record a newly written artefact in its folder's index."""
+        path = Path(path).resolve()
+        entries = self.index.get(path.parent)
+        if entries is None:
+            return
+        entry = self._stat(path)
+        if entry is None:
+            return
+        with self.lock:
+            entries[path] = entry
+
+    def forget(self, path):
+        path = Path(path).resolve()
+        with self.lock:
+            self.index.get(path.parent, {}).pop(path, None)
+
+    def hold(self, *paths):
+        """Protect files used by a running job from deletion."""
+        with self.lock:
+            self.held.update(Path(p).resolve() for p in paths if p)
+
+    def release(self, *paths):
+        with self.lock:
+            self.held.difference_update(Path(p).resolve() for p in paths if p)
+        for p in paths:
+            if p:
+                self.track(p)
+
+    # ---------- Enforcement ----------
+    def enforce(self):
+        """Delete artefacts that exceed each folder's count/byte/age quota."""
+        now = time.time()
+        for folder, policy in self.policies.items():
+            with self.lock:
+                entries = sorted(self.index[folder].items(), key=lambda e: e[1][0], reverse=True)
+                held = set(self.held)
+
+            kept, total, victims = 0, 0, []
+            for path, (mtime, size) in entries:
+                if path not in held and not self._in_progress(path, now):
+                    expired = policy["max_age"] and now - mtime > policy["max_age"]
+                    over_count = policy["max_files"] and kept >= policy["max_files"]
+                    over_bytes = policy["max_bytes"] and total + size > policy["max_bytes"]
+                    if expired or over_count or over_bytes:
+                        victims.append(path)
+                        continue
+                kept += 1
+                total += size
+
+            for path in victims:
+                try:
+                    if path.is_dir():
+                        shutil.rmtree(path)
+                    else:
+                        path.unlink()
+                    self.deleted += 1
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"⚠️ Could not delete {path}: {e}")
+                    continue
+                self.forget(path)
+
+    def _in_progress(self, path, now):
+        """Is `path` a partial output some writer is still producing?"""
+        if ".part." not in path.name:
+            return False
+        entry = self._stat(path)  # the indexed mtime may predate the writes
+        return entry is not None and now - entry[0] < PART_IDLE_SECONDS
+
+    def run_once(self, full=False):
+        if full or self.passes % RESCAN_EVERY == 0:
+            self.rescan()
+        self.enforce()
+        self.passes += 1
+
+    # ---------- Background schedule ----------
+    def start(self, interval=RETENTION_INTERVAL):
+        """Start the periodic retention task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(interval))
+
+    async def _loop(self, interval):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"⚠️ Retention pass failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        with self.lock:
+            folders = {
+                str(folder): {
+                    "files": len(entries),
+                    "bytes": sum(size for _, size in entries.values()),
+                    **self.policies[folder],
+                }
+                for folder, entries in self.index.items()
+            }
+        return {"folders": folders, "held": len(self.held), "deleted": self.deleted, "passes": self.passes}
+
+
+retention = RetentionManager()
+
+# Image tool artefacts
+retention.register("images/upload", max_files=MAX_FILES_PER_FOLDER)
+retention.register("images/changed", max_files=MAX_FILES_PER_FOLDER)
+retention.register("images/background", max_files=MAX_FILES_PER_FOLDER)
+# Bulk batches (one folder each, held while their jobs are queued or running)
+retention.register("images/bulk", max_files=40, max_age=24 * HOUR)
+# Webcam frames / backgrounds
+retention.register("video/changed", max_files=100)
+retention.register("video/background", max_files=100)
+# Full-video jobs (inputs, outputs and progress files)
+retention.register("video/upload", max_files=40, max_bytes=5 * GB, max_age=24 * HOUR)
+retention.register("video/changedVideo", max_files=120, max_bytes=10 * GB, max_age=7 * 24 * HOUR)
+
+
+@router.get("/status")
+async def retention_status():
+    """Current retention index sizes and quotas."""
+    return retention.stats()
+
+
+@router.post("/run")
+async def run_retention():
+    """Force a full rescan + enforcement pass now."""
+    await asyncio.to_thread(retention.run_once, True)
+    return retention.stats()
@@ -23,19 +23,6 @@ BACKGROUND_DIR = BASE_DIR / "background"
 for folder in [UPLOAD_DIR, CHANGED_DIR, BACKGROUND_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
 
-MAX_FILES_PER_FOLDER = 100
-
-
-def cleanup_old_files(folder: Path, max_files: int = 15):
-    """Keep only latest N files."""
-    files = sorted(folder.glob("*"), key=lambda f: f.stat().st_mtime, reverse=True)
-    for old_file in files[max_files:]:
-        try:
-            old_file.unlink()
-        except Exception as e:
-            print(f"⚠️ Could not delete {old_file}: {e}")
-
-
 # -------------------------------------------------------
 # Routes
 # -------------------------------------------------------
@@ -122,10 +109,7 @@ async def ImageView(request: Request):
 #             result = apply_modnet(frame, bg_image_path=str(bg_path))
 #             cv2.imwrite(str(changed_path), result)
 
-#         # Cleanup (keep 100)
-#         cleanup_old_files(UPLOAD_DIR, MAX_FILES_PER_FOLDER)
-#         cleanup_old_files(CHANGED_DIR, MAX_FILES_PER_FOLDER)
-#         cleanup_old_files(BACKGROUND_DIR, MAX_FILES_PER_FOLDER)
+#         # Cleanup is handled by routers.CleanFiles.retention
 
 #         return templates.TemplateResponse(
 #             "image.html",
@@ -1,15 +1,13 @@
 from fastapi import APIRouter, UploadFile, Form
 from pathlib import Path
 import numpy as np, cv2, shutil, asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 router = APIRouter(prefix="/api/background", tags=["Background API"])
 BG_PATH = Path("model/bg_custom.jpg")
-executor = ThreadPoolExecutor(max_workers=2)
 
 # ---------- Helper Functions ----------
 def save_background_sync(file_obj, dst: Path):
-    """Blocking save (runs in thread executor)."""
+    """Blocking save (runs in a worker thread)."""
     with open(dst, "wb") as buffer:
         shutil.copyfileobj(file_obj, buffer)
     return {"status": "ok", "msg": f"Background saved to {dst}"}
@@ -27,8 +25,7 @@ def solid_background_sync(color_hex: str):
 @router.post("/upload")
 async def upload_background(file: UploadFile):
     """Upload a custom background image asynchronously."""
-    loop = asyncio.get_running_loop()
-    result = await loop.run_in_executor(executor, save_background_sync, file.file, BG_PATH)
+    result = await asyncio.to_thread(save_background_sync, file.file, BG_PATH)
     return result
 
 @router.post("/solid")
@@ -39,8 +36,7 @@ async def solid_background(color: str = Form("#ffffff")):
         return {"status": "error", "msg": "Invalid color format"}
 
     try:
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(executor, solid_background_sync, color)
+        result = await asyncio.to_thread(solid_background_sync, color)
         return result
     except ValueError:
         return {"status": "error", "msg": "Invalid color code"}
@@ -0,0 +1,39 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from inference.governor import governor
+from inference.registry import registry
+from inference.memory import memory_budget
+from inference.frame_store import bg_frame_cache
+from inference.process_pool import inference_pool
+from broker import get_broker
+
+router = APIRouter(prefix="/api/compute", tags=["Compute API"])
+
+
+@router.get("/status")
+async def compute_status():
+    """Inference slots, thread sizing, queue state, memory budget, background frame cache, job broker and inference processes."""
+    return {**governor.stats(), "memory": memory_budget.stats(), "bg_frames": bg_frame_cache.stats(),
+            "broker": await asyncio.to_thread(get_broker().stats), "processes": inference_pool.stats()}
+
+
+@router.get("/models")
+async def model_status():
+    """Available and loaded models, their memory use and the budget."""
+    return registry.stats()
+
+
+@router.post("/models/{name}/reload")
+async def reload_model(name: str):
+    """
+    Reload a model from its checkpoint and swap it in (in-flight requests
+    finish on the old one). The inference processes reload it too, in the
+    background; `reloading_processes` says how many were asked.
+    """
+    if name not in registry.checkpoints:
+        return JSONResponse({"error": f"Unknown model '{name}'"}, status_code=404)
+    ok = await asyncio.to_thread(registry.reload, name)
+    if not ok:
+        return JSONResponse({"error": f"Reload of '{name}' failed"}, status_code=500)
+    return {**registry.stats(), "reloading_processes": inference_pool.reload(name)}
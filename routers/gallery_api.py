@@ -1,46 +1,339 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from pathlib import Path
+import asyncio, base64, bisect, hashlib, itertools, json, os, threading
 
 router = APIRouter(prefix="/api/gallery", tags=["Gallery API"])
 
 RECORDED_DIR = Path("video/recorded")
 SNAPSHOT_DIR = Path("video/snapshots")
+THUMB_DIR = SNAPSHOT_DIR / "thumbs"
+INDEX_PATH = Path("video/gallery_index.json")
 RECORDED_DIR.mkdir(parents=True, exist_ok=True)
 SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+THUMB_DIR.mkdir(parents=True, exist_ok=True)
 
+THUMB_WIDTH = 320
+DEFAULT_PAGE_SIZE = 48
+MAX_PAGE_SIZE = 200
+SAVE_DELAY = 1.0   # seconds; changes within it share one index write
 
-@router.get("/list")
-async def list_gallery():
+
+# =================================================
+# 🗂️ Persistent gallery index
+# =================================================
+class GalleryIndex:
     """
-    Return list of recorded videos (.webm + _thumb.jpg) and snapshots (.jpg).
+    Persistent index of recordings and snapshots, updated on write/delete.
+
+    Items are kept sorted newest-first so list requests never touch the
+    filesystem. `version` bumps on every change and drives the list ETag.
+    On load, the saved directory mtimes are compared with the real ones and
+    the index is rebuilt only if files were added/removed behind its back.
+
+    Changes are written to disk SAVE_DELAY seconds later from a timer
+    thread, never by the (async) caller; a write lost to a crash only
+    means the directory mtimes no longer match and the next start rebuilds.
+    The process-wide index is created on first use (`get_gallery_index`),
+    not at import, so processes that merely import this module never
+    rebuild or write it.
     """
-    gallery = []
 
-    # 🎥 Videos
-    for file in sorted(RECORDED_DIR.glob("*.webm"), reverse=True):
-        thumb_file = RECORDED_DIR / f"{file.stem}_thumb.jpg"
-        if thumb_file.exists():
-            thumb_path = f"/video/recorded/{thumb_file.name}"
-        else:
-            thumb_path = "/static/img/video_placeholder.jpg"
+    def __init__(self, index_path=INDEX_PATH):
+        self.index_path = Path(index_path)
+        self.items = {}          # name -> item
+        self.order = []          # sort keys, newest first
+        self.version = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()   # one writer at a time
+        self.save_timer = None
+        self.load()
+
+    # ---------- Persistence ----------
+    def _dir_mtimes(self):
+        return {str(d): d.stat().st_mtime for d in (RECORDED_DIR, SNAPSHOT_DIR)}
+
+    def load(self):
+        try:
+            data = json.loads(self.index_path.read_text())
+            if data.get("dirs") == self._dir_mtimes():
+                self.items = {i["name"]: i for i in data["items"]}
+                self.version = data.get("version", 0)
+                self._resort()
+                return
+        except Exception:
+            pass
+        self.rebuild()
+
+    def save(self):
+        """Write the index now (a snapshot taken under the lock)."""
+        with self.save_lock:
+            dirs = self._dir_mtimes()
+            with self.lock:
+                data = {"version": self.version, "dirs": dirs, "items": list(self.items.values())}
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.index_path)
 
-        gallery.append({
+    def _save_later(self):
+        """Schedule a save unless one is pending; lock held."""
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(SAVE_DELAY, self._save_pending)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def _save_pending(self):
+        with self.lock:
+            self.save_timer = None
+        self.save()
+
+    def rebuild(self):
+        """Full rescan of both folders (startup / index out of date)."""
+        with self.lock:
+            # Build into a new dict: _video_item keeps metadata from the old items
+            items = {}
+            for f in RECORDED_DIR.glob("*.webm"):
+                items[f.name] = self._video_item(f)
+            for f in SNAPSHOT_DIR.glob("*.jpg"):
+                items[f.name] = self._snapshot_item(f)
+            self.items = items
+            self.version += 1
+            self._resort()
+        self.save()
+        print(f"🗂️ Gallery index rebuilt ({len(self.items)} items)")
+
+    # ---------- Items ----------
+    @staticmethod
+    def _sort_key(item):
+        return (-item["mtime"], item["name"])
+
+    def _resort(self):
+        self.order = sorted(self._sort_key(i) for i in self.items.values())
+
+    def _video_item(self, file: Path, meta=None):
+        thumb_file = recording_thumb_path(file.name)
+        st = file.stat()
+        item = {
             "type": "video",
             "path": f"/video/recorded/{file.name}",
-            "thumbnail": thumb_path,
-            "name": file.name
-        })
+            "thumbnail": f"/video/recorded/{thumb_file.name}" if thumb_file.exists()
+                         else thumb_url(file.name, st),
+            "name": file.name,
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+        }
+        # Keep duration/resolution recorded by an earlier thumbnail pass
+        old = self.items.get(file.name, {})
+        for key in ("duration", "width", "height"):
+            if key in old:
+                item[key] = old[key]
+        if meta:
+            item.update(meta)
+        return item
 
-    # 📸 Snapshots
-    for file in sorted(SNAPSHOT_DIR.glob("*.jpg"), reverse=True):
-        gallery.append({
+    @staticmethod
+    def _snapshot_item(file: Path):
+        st = file.stat()
+        return {
             "type": "snapshot",
             "path": f"/video/snapshots/{file.name}",
-            "thumbnail": f"/video/snapshots/{file.name}",
-            "name": file.name
-        })
+            "thumbnail": thumb_url(file.name, st),
+            "name": file.name,
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+        }
+
+    def add(self, file: Path, meta=None):
+        """Index a new (or re-written) recording or snapshot."""
+        file = Path(file)
+        item = self._video_item(file, meta) if file.suffix == ".webm" else self._snapshot_item(file)
+        with self.lock:
+            self.items[file.name] = item
+            self.version += 1
+            self._resort()
+            self._save_later()
+        return item
+
+    def remove(self, name: str):
+        with self.lock:
+            if self.items.pop(name, None) is None:
+                return False
+            self.version += 1
+            self._resort()
+            self._save_later()
+        return True
+
+    # ---------- Queries ----------
+    def page(self, cursor=None, limit=DEFAULT_PAGE_SIZE, kind=None):
+        """Return (items, next_cursor) starting after `cursor`."""
+        with self.lock:
+            start = 0
+            if cursor:
+                start = bisect.bisect_right(self.order, decode_cursor(cursor))
+            out = []
+            pos = start
+            while pos < len(self.order) and len(out) < limit:
+                item = self.items[self.order[pos][1]]
+                pos += 1
+                if kind is None or item["type"] == kind:
+                    out.append(item)
+            # Only point past this page if a later item would match too
+            more = any(kind is None or self.items[name]["type"] == kind
+                       for _, name in itertools.islice(self.order, pos, None))
+            next_cursor = encode_cursor(self._sort_key(out[-1])) if out and more else None
+            return out, next_cursor
+
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        neg_mtime, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(neg_mtime), str(name))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def make_thumbnail(src: Path, dst: Path, width=THUMB_WIDTH):
+    """Write a small JPEG thumbnail of an image (reduced decode when possible)."""
+    import cv2
+    img = cv2.imread(str(src), cv2.IMREAD_REDUCED_COLOR_2)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    if w > width:
+        img = cv2.resize(img, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+    cv2.imwrite(str(dst), img, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+    return dst
+
+
+def make_video_thumbnail(src: Path, dst: Path, at_sec=0.5, width=THUMB_WIDTH):
+    """
+    Grab one frame of a recording in-process (OpenCV) as a JPEG thumbnail.
+    Returns metadata {"duration", "width", "height"} or None on failure.
+    """
+    import cv2
+    cap = cv2.VideoCapture(str(src))
+    if not cap.isOpened():
+        return None
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        cap.set(cv2.CAP_PROP_POS_MSEC, at_sec * 1000)
+        ret, frame = cap.read()
+        if not ret:  # shorter than at_sec → first frame
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        if not ret or frame is None:
+            return None
+
+        # MediaRecorder WebM often has no duration header → count the rest
+        if frame_count <= 0:
+            frame_count = max(1, int(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+            while cap.grab():
+                frame_count += 1
+
+        if frame.shape[1] > width:
+            frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])),
+                               interpolation=cv2.INTER_AREA)
+        cv2.imwrite(str(dst), frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        return {
+            "duration": round(frame_count / fps, 2) if fps else None,
+            "width": w,
+            "height": h,
+        }
+    finally:
+        cap.release()
+
+
+def thumb_url(name: str, st) -> str:
+    """Thumbnail endpoint URL, versioned by the source file's mtime (cached as immutable)."""
+    return f"/api/gallery/thumb/{name}?v={st.st_mtime_ns}"
+
+
+def snapshot_thumb_path(name: str) -> Path:
+    return THUMB_DIR / f"{Path(name).stem}_thumb.jpg"
+
+
+def recording_thumb_path(name: str) -> Path:
+    return RECORDED_DIR / f"{Path(name).stem}_thumb.jpg"
+
+
+_gallery_index = None
+_gallery_index_lock = threading.Lock()
+
+
+def get_gallery_index():
+    """Process-wide gallery index (loaded, or rebuilt, on first use)."""
+    global _gallery_index
+    with _gallery_index_lock:
+        if _gallery_index is None:
+            _gallery_index = GalleryIndex()
+        return _gallery_index
+
+
+def paged_response(request: Request, key: str, items, next_cursor, cursor, limit):
+    """JSON page with an ETag; unchanged polls get 304 Not Modified."""
+    version = get_gallery_index().version
+    tag = hashlib.md5(f"{version}|{key}|{cursor}|{limit}".encode()).hexdigest()
+    etag = f'W/"{tag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    body = json.dumps({key: items, "next_cursor": next_cursor, "version": version})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# =================================================
+# 🌐 Endpoints
+# =================================================
+@router.get("/list")
+async def list_gallery(request: Request, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Return a page of recorded videos (.webm + _thumb.jpg) and snapshots (.jpg),
+    newest first. Pass `next_cursor` back as `cursor` for the next page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    items, next_cursor = get_gallery_index().page(cursor, limit)
+    return paged_response(request, "gallery", items, next_cursor, cursor, limit)
+
+
+@router.get("/thumb/{filename}")
+async def gallery_thumbnail(filename: str, v: str = None):
+    """
+    Small cached thumbnail of a snapshot or recording, generated once on
+    first request if the upload-time thumbnail queue has not made it yet.
+    Versioned URLs (`v`, see thumb_url) are cached as immutable; others
+    are revalidated (ETag).
+    """
+    filename = Path(filename).name
+    loop = asyncio.get_running_loop()
 
-    return {"gallery": gallery}
+    if filename.endswith(".webm"):
+        src = RECORDED_DIR / filename
+        if not src.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        thumb = recording_thumb_path(filename)
+        if not thumb.exists():
+            meta = await loop.run_in_executor(None, make_video_thumbnail, src, thumb)
+            if meta is None:
+                raise HTTPException(status_code=404, detail="Thumbnail unavailable")
+            get_gallery_index().add(src, meta)
+    else:
+        src = SNAPSHOT_DIR / filename
+        if not src.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        thumb = snapshot_thumb_path(filename)
+        if not thumb.exists():
+            if await loop.run_in_executor(None, make_thumbnail, src, thumb) is None:
+                return FileResponse(src, media_type="image/jpeg")
+    cache = "public, max-age=31536000, immutable" if v else "no-cache"
+    return FileResponse(thumb, media_type="image/jpeg", headers={"Cache-Control": cache})
 
 
 @router.delete("/delete/{filename}")
@@ -52,8 +345,10 @@ async def delete_item(filename: str):
         file_path = folder / filename
         if file_path.exists():
             file_path.unlink()
-            thumb_path = file_path.parent / f"{file_path.stem}_thumb.jpg"
-            if thumb_path.exists():
-                thumb_path.unlink()
+            for thumb_path in (file_path.parent / f"{file_path.stem}_thumb.jpg",
+                               snapshot_thumb_path(file_path.name)):
+                if thumb_path.exists():
+                    thumb_path.unlink()
+            get_gallery_index().remove(filename)
             return {"message": f"Deleted {filename}"}
     raise HTTPException(status_code=404, detail="File not found")
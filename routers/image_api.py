@@ -1,10 +1,23 @@
-from fastapi import APIRouter, UploadFile, Form
+import asyncio
+import threading
+import time
+import uuid
+from typing import List
+from fastapi import APIRouter, UploadFile, Form, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pathlib import Path
-import cv2
 import numpy as np
-from inference.modnet_infer import apply_modnet, apply_modnet_blur_background, apply_modnet_cutout_rgba
-from routers.CleanFiles import cleanup_old_files
+from PIL import Image
+from inference.modnet_infer import HIRES_MIN_PIXELS, render_image_sync
+from inference.governor import governor
+from inference.process_pool import inference_pool
+from inference.registry import registry, DEFAULT_IMAGE_MODEL
+from inference.memory import (
+    memory_budget, MemoryUsage, MemoryBudgetExceeded, image_work_bytes, MEMORY_WAIT_SECONDS,
+)
+from routers.CleanFiles import retention
+from broker import get_broker
 
 router = APIRouter(prefix="/api/image", tags=["AJAX Image API"])
 
@@ -12,12 +25,58 @@ BASE_DIR = Path("images")
 UPLOAD_DIR = BASE_DIR / "upload"
 CHANGED_DIR = BASE_DIR / "changed"
 BACKGROUND_DIR = BASE_DIR / "background"
+BULK_DIR = BASE_DIR / "bulk"      # one folder per bulk batch (inputs)
+BULK_POLL_SECONDS = 2
 
-for folder in [UPLOAD_DIR, CHANGED_DIR, BACKGROUND_DIR]:
+for folder in [UPLOAD_DIR, CHANGED_DIR, BACKGROUND_DIR, BULK_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
 
 
 
+def image_dimensions(upload: UploadFile):
+    """(w, h) from the image header without decoding it; None if unreadable."""
+    try:
+        with Image.open(upload.file) as im:
+            return im.size
+    except Exception:
+        return None
+    finally:
+        upload.file.seek(0)
+
+
+def plan_image_memory(size, encoded_bytes, hires, bg_bytes=0):
+    """
+    Working-memory reservation for an image and whether it must take the
+    tiled high-resolution path. Raises MemoryBudgetExceeded if even that
+    path cannot fit the budget.
+    """
+    w, h = size
+    if not hires and w * h < HIRES_MIN_PIXELS:
+        need = image_work_bytes(w, h) + encoded_bytes + bg_bytes
+        if memory_budget.fits(need):
+            return need, False
+        print(f"📉 {w}x{h} image over the memory budget → tiled path")
+    need = image_work_bytes(w, h, hires=True) + encoded_bytes + bg_bytes
+    if not memory_budget.fits(need):
+        raise MemoryBudgetExceeded(f"{w}x{h} image does not fit the memory budget")
+    return need, True
+
+
+def render_image(npimg, bg_bytes, mode, color, blur_strength, hires, original_path, changed_path, bg_path, model=None):
+    """render_image_sync in an inference process when the pool runs, else in this thread."""
+    bg = np.frombuffer(bg_bytes, np.uint8) if bg_bytes else None
+    if not inference_pool.fits(npimg, bg):
+        return render_image_sync(npimg, bg_bytes, mode, color, blur_strength, hires,
+                                 original_path, changed_path, bg_path, model)
+    params = dict(mode=mode, color=color, blur_strength=blur_strength, hires=hires, model=model,
+                  original_path=str(original_path), changed_path=str(changed_path), bg_path=str(bg_path))
+    try:
+        with inference_pool.call("render_image", params=params, image=npimg, bg=bg):
+            return None
+    except ValueError as e:
+        return str(e)
+
+
 @router.post("/process")
 async def process_image(
     file: UploadFile,
@@ -25,10 +84,18 @@ async def process_image(
     color: str = Form("#ffffff"),
     bg_file: UploadFile = None,
     blur_strength: int = Form(35),
+    hires: bool = Form(False),
+    model: str = Form(""),
 ):
     """
     Process an uploaded image with MODNet and return JSON paths.
     Supports solid color, transparent, or custom background modes.
+    Large images (or hires=true) use the memory-bounded tiled path.
+    Work is reserved against the memory budget first: images that would
+    not fit are moved to the tiled path, or rejected (413) if even that does
+    not fit; when memory is busy the request waits (503 after a timeout).
+    The response includes the request's `memory` usage.
+    `model` picks a registry model by name (default: photographic).
     """
     try:
         upload_name = Path(file.filename).stem
@@ -43,67 +110,50 @@ async def process_image(
         print("🎨 color:", color)
         print("🎨 bg_file:", bg_file.filename if bg_file else None)
 
-        # Decode portrait
-        npimg = np.frombuffer(await file.read(), np.uint8)
-        frame = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-        if frame is None:
+        try:
+            model = registry.resolve(model, DEFAULT_IMAGE_MODEL)
+        except KeyError as e:
+            return JSONResponse({"error": str(e.args[0])}, status_code=400)
+
+        size = image_dimensions(file)
+        if size is None:
             return JSONResponse({"error": "Invalid image."}, status_code=400)
-        cv2.imwrite(str(original_path), frame)
-
-        # Transparent
-        if mode == "transparent":
-            rgba = apply_modnet_cutout_rgba(frame)
-            cv2.imwrite(str(changed_path), cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA))
-
-        # Custom background image
-        elif mode == "custom" and bg_file:
-            np_bg = np.frombuffer(await bg_file.read(), np.uint8)
-            bg_img = cv2.imdecode(np_bg, cv2.IMREAD_COLOR)
-            if bg_img is not None:
-                cv2.imwrite(str(bg_path), bg_img)
-                result = apply_modnet(frame, bg_image_path=str(bg_path))
-                cv2.imwrite(str(changed_path), result)
-            else:
-                return JSONResponse({"error": "Could not read background image."}, status_code=400)
-        # elif mode == "extract_bg":
-        #     result = extract_background(frame)
-        #     if result is not None:
-        #         cv2.imwrite(str(changed_path), result)  # Save the extracted background
-        #     else:
-        #         return HTMLResponse("<h3>❌ Could not extract background.</h3>", status_code=400)
-
-        # Replace background with its blurred version
-        elif mode == "blur_bg":
-            print("Blur background mode triggered")
-            # print(f" Blurring background with strength: {blur_strength}")
-            result = apply_modnet_blur_background(frame_bgr=frame, blur_strength=blur_strength)
-            if result is not None:
-                cv2.imwrite(str(changed_path), result)
-            else:
-                return JSONResponse({"error": "Could not blur background."}, status_code=400)   
-
-        # Solid color
-        else:
-            hex_color = color.lstrip("#")
-            try:
-                r = int(hex_color[0:2], 16)
-                g = int(hex_color[2:4], 16)
-                b = int(hex_color[4:6], 16)
-            except ValueError:
-                r, g, b = (255, 255, 255)
-            bg = np.full((frame.shape[0], frame.shape[1], 3), (b, g, r), dtype=np.uint8)
-            cv2.imwrite(str(bg_path), bg)
-            result = apply_modnet(frame, bg_image_path=str(bg_path))
-            cv2.imwrite(str(changed_path), result)
-
-        cleanup_old_files(UPLOAD_DIR)
-        cleanup_old_files(CHANGED_DIR)
-        cleanup_old_files(BACKGROUND_DIR)
+        try:
+            need, hires = plan_image_memory(size, file.size or 0, hires, (bg_file.size or 0) if bg_file else 0)
+        except MemoryBudgetExceeded as e:
+            return JSONResponse({"error": str(e)}, status_code=413)
+
+        # Queue for memory (off the event loop) before reading the upload
+        usage = MemoryUsage()
+        try:
+            await asyncio.to_thread(memory_budget.acquire, need, usage, MEMORY_WAIT_SECONDS)
+        except MemoryBudgetExceeded:
+            return JSONResponse({"error": "Server busy, retry shortly."}, status_code=503,
+                                headers={"Retry-After": "5"})
+        try:
+            npimg = np.frombuffer(await file.read(), np.uint8)
+            bg_bytes = await bg_file.read() if bg_file else None
+
+            # Decode + inference off the event loop, in an interactive slot
+            error = await governor.run(
+                render_image, npimg, bg_bytes, mode, color, blur_strength, hires,
+                original_path, changed_path, bg_path, model,
+            )
+        finally:
+            memory_budget.release(need, usage)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+
+        # Index new artefacts; quotas are enforced in the background
+        retention.track(original_path)
+        retention.track(changed_path)
+        retention.track(bg_path)
 
         return {
             "original": f"/images/upload/{original_path.name}",
             "result": f"/images/changed/{changed_path.name}",
-            "download": f"/image/download/{changed_path.name}"
+            "download": f"/image/download/{changed_path.name}",
+            "memory": usage.as_dict(),
         }
 
     except Exception as e:
@@ -111,3 +161,121 @@ async def process_image(
         traceback.print_exc()
         return JSONResponse({"error": str(e)}, status_code=500)
 
+
+# =================================================
+# 📦 Bulk jobs (run by workers through the job broker)
+# =================================================
+def bulk_paths(batch_dir, job_id, filename, mode):
+    stem = f"{job_id}_{Path(filename).stem}"
+    changed_ext = ".png" if mode == "transparent" else ".jpg"
+    return (batch_dir / f"{stem}{Path(filename).suffix or '.jpg'}",
+            CHANGED_DIR / f"{stem}_changed{changed_ext}",
+            BACKGROUND_DIR / f"{stem}_bg.jpg")
+
+
+def follow_bulk_batch(batch_dir, job_ids):
+    """
+    Keep a batch's inputs held from retention until every job in it is
+    done or failed (jobs may wait in the queue for a long time).
+    """
+    broker = get_broker()
+    pending = set(job_ids)
+    try:
+        while pending:
+            time.sleep(BULK_POLL_SECONDS)
+            try:
+                states = {job_id: broker.get(job_id) for job_id in pending}
+            except Exception as e:  # broker busy / shared mount hiccup: keep following
+                print(f"⚠️ Could not poll bulk batch {batch_dir.name}: {e}")
+                continue
+            pending = {job_id for job_id, job in states.items()
+                       if job is not None and job["status"] not in ("done", "failed")}
+    finally:
+        retention.release(batch_dir)
+
+
+@router.post("/bulk")
+async def bulk_images(
+    files: List[UploadFile] = File(...),
+    mode: str = Form("color"),
+    color: str = Form("#ffffff"),
+    bg_file: UploadFile = None,
+    blur_strength: int = Form(35),
+    hires: bool = Form(False),
+    model: str = Form(""),
+):
+    """
+    Queue many images with the same options as /process. Each image becomes
+    a broker job run by a worker (in this process unless JOB_WORKERS=remote);
+    poll /bulk/{id} for its status and result. Unreadable images are
+    reported in `rejected` and not queued.
+    The inputs of a batch are kept in their own folder under images/bulk,
+    held from retention until all of its jobs have finished.
+    """
+    try:
+        model = registry.resolve(model, DEFAULT_IMAGE_MODEL)
+    except KeyError as e:
+        return JSONResponse({"error": str(e.args[0])}, status_code=400)
+
+    broker = get_broker()
+    batch_dir = BULK_DIR / uuid.uuid4().hex[:8]
+    retention.hold(batch_dir)
+    batch_dir.mkdir(parents=True)
+    bg_upload = None
+    if bg_file is not None and mode == "custom":
+        bg_upload = batch_dir / f"bg{Path(bg_file.filename).suffix or '.jpg'}"
+        await run_in_threadpool(bg_upload.write_bytes, await bg_file.read())
+
+    jobs, rejected = [], []
+    for file in files:
+        size = image_dimensions(file)
+        if size is None:
+            rejected.append(file.filename)
+            continue
+        job_id = uuid.uuid4().hex[:12]
+        original_path, changed_path, bg_path = bulk_paths(batch_dir, job_id, file.filename, mode)
+        await run_in_threadpool(original_path.write_bytes, await file.read())
+        await run_in_threadpool(broker.enqueue, "image", {
+            "original_path": str(original_path.resolve()),
+            "changed_path": str(changed_path.resolve()),
+            "bg_path": str(bg_path.resolve()),
+            "bg_upload": str(bg_upload.resolve()) if bg_upload else None,
+            "size": size,
+            "mode": mode,
+            "color": color,
+            "blur_strength": blur_strength,
+            "hires": hires,
+            "model": model,
+        }, job_id=job_id)
+        jobs.append({"id": job_id, "name": file.filename, "status_url": f"/api/image/bulk/{job_id}"})
+
+    threading.Thread(target=follow_bulk_batch, args=(batch_dir, [job["id"] for job in jobs]),
+                     daemon=True, name=f"bulk-{batch_dir.name}").start()
+    return {"jobs": jobs, "rejected": rejected}
+
+
+@router.get("/bulk/{job_id}")
+async def bulk_image_status(job_id: str):
+    """Status of a bulk image job; result URLs once it is done."""
+    job = await asyncio.to_thread(get_broker().get, job_id)
+    if job is None or job["kind"] != "image":
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+
+    original_path = Path(job["payload"]["original_path"])
+    changed_path = Path(job["payload"]["changed_path"])
+    data = {
+        "id": job_id,
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "original": f"/images/bulk/{original_path.parent.name}/{original_path.name}",
+    }
+    if job["status"] == "done":
+        # Written by the worker: index for retention (idempotent)
+        retention.track(changed_path)
+        retention.track(job["payload"]["bg_path"])
+        data["result"] = f"/images/changed/{changed_path.name}"
+        data["download"] = f"/image/download/{changed_path.name}"
+        data["memory"] = (job["result"] or {}).get("memory")
+    elif job["status"] == "failed":
+        data["error"] = job["error"]
+    return data
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import FileResponse
 from pathlib import Path
-import os, time, asyncio
-import ffmpeg
-from concurrent.futures import ThreadPoolExecutor
+import os, time, asyncio, queue, threading
+from routers.gallery_api import (
+    get_gallery_index, make_thumbnail, make_video_thumbnail, snapshot_thumb_path,
+    recording_thumb_path, paged_response, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+)
+from routers.stream_upload import stream_multipart
 
 router = APIRouter(prefix="/api/record", tags=["Recording API"])
 
@@ -12,46 +15,75 @@ SNAPSHOT_DIR = Path("video/snapshots")
 RECORDED_DIR.mkdir(parents=True, exist_ok=True)
 SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
 
-executor = ThreadPoolExecutor(max_workers=3)
+# =================================================
+# 🖼️ Bounded thumbnail queue (in-process decoder)
+# =================================================
+THUMB_QUEUE_SIZE = 32
+thumb_queue = queue.Queue(maxsize=THUMB_QUEUE_SIZE)
 
-def save_video_sync(video_path: Path, data: bytes):
-    """Blocking save + thumbnail extraction."""
-    with open(video_path, "wb") as f:
-        f.write(data)
-    thumb_path = video_path.with_name(video_path.stem + "_thumb.jpg")
+
+def thumbnail_worker():
+    """Single background thread: grab thumbnail + metadata for new recordings."""
+    while True:
+        video_path = thumb_queue.get()
+        try:
+            meta = make_video_thumbnail(video_path, recording_thumb_path(video_path.name))
+            if meta is not None:
+                get_gallery_index().add(video_path, meta)
+            else:
+                print(f"⚠️ Thumbnail creation failed: {video_path.name}")
+        except Exception as e:
+            print(f"⚠️ Thumbnail creation failed: {e}")
+        finally:
+            thumb_queue.task_done()
+
+
+threading.Thread(target=thumbnail_worker, daemon=True, name="record-thumbs").start()
+
+
+def queue_thumbnail(video_path: Path):
+    """Queue thumbnail extraction; when the queue is full it is made lazily on first view."""
     try:
-        (
-            ffmpeg
-            .input(str(video_path), ss=0.5)
-            .output(str(thumb_path), vframes=1, loglevel="error")
-            .overwrite_output()
-            .run()
-        )
-    except Exception as e:
-        print(f"⚠️ Thumbnail creation failed: {e}")
-    return thumb_path
+        thumb_queue.put_nowait(video_path)
+    except queue.Full:
+        print(f"⏳ Thumbnail queue full, {video_path.name} will be done on demand")
+
 
 @router.post("/upload")
-async def upload_recording(video: UploadFile = File(...)):
-    """Save uploaded WebM recording and generate thumbnail asynchronously."""
+async def upload_recording(request: Request):
+    """
+    Save an uploaded WebM recording (form field `video`), streamed to disk
+    in chunks, and queue its thumbnail in the background.
+    """
+    timestamp = int(time.time() * 1000)
+    base_name = f"recorded_{timestamp}"
+    webm_path = RECORDED_DIR / f"{base_name}.webm"
+
+    def file_path_for(field, filename):
+        return webm_path if field == "video" else None
+
     try:
-        timestamp = int(time.time() * 1000)
-        base_name = f"recorded_{timestamp}"
-        webm_path = RECORDED_DIR / f"{base_name}.webm"
-        data = await video.read()
-        loop = asyncio.get_running_loop()
-        thumb_path = await loop.run_in_executor(executor, save_video_sync, webm_path, data)
-
-        return {
-            "message": "Recording saved successfully",
-            "video_path": f"/video/recorded/{webm_path.name}",
-            "thumbnail_path": f"/video/recorded/{thumb_path.name}",
-            "download_link": f"/api/record/download/{webm_path.name}",
-        }
+        _, files = await stream_multipart(request, file_path_for)
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ Upload failed:", e)
+        webm_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+    if "video" not in files:
+        raise HTTPException(status_code=400, detail="No video uploaded")
+
+    item = get_gallery_index().add(webm_path)
+    queue_thumbnail(webm_path)
+
+    return {
+        "message": "Recording saved successfully",
+        "video_path": f"/video/recorded/{webm_path.name}",
+        "thumbnail_path": item["thumbnail"],
+        "download_link": f"/api/record/download/{webm_path.name}",
+    }
+
 @router.get("/download/{filename}")
 async def download_recording(filename: str):
     """Download recorded video or thumbnail."""
@@ -67,18 +99,17 @@ async def download_recording(filename: str):
     return FileResponse(path=file_path, media_type=media_type, filename=file_path.name)
 
 @router.get("/list")
-async def list_recordings():
-    """List all recordings."""
-    recordings = []
-    for file in sorted(RECORDED_DIR.glob("*.webm"), reverse=True):
-        base = file.stem
-        thumb = RECORDED_DIR / f"{base}_thumb.jpg"
-        recordings.append({
-            "video_path": f"/video/recorded/{file.name}",
-            "thumbnail_path": f"/video/recorded/{thumb.name}" if thumb.exists() else "",
-            "download_link": f"/api/record/download/{file.name}",
-        })
-    return {"recordings": recordings}
+async def list_recordings(request: Request, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """List recordings (newest first, paginated via `cursor`)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    items, next_cursor = get_gallery_index().page(cursor, limit, kind="video")
+    recordings = [{
+        "video_path": item["path"],
+        "thumbnail_path": item["thumbnail"],
+        "duration": item.get("duration"),
+        "download_link": f"/api/record/download/{item['name']}",
+    } for item in items]
+    return paged_response(request, "recordings", recordings, next_cursor, cursor, limit)
 
 @router.delete("/delete/{filename}")
 async def delete_recording(filename: str):
@@ -91,6 +122,7 @@ async def delete_recording(filename: str):
         os.remove(webm)
         if thumb.exists():
             os.remove(thumb)
+        get_gallery_index().remove(filename)
         return {"message": "Deleted", "deleted": filename}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete: {e}")
@@ -105,6 +137,9 @@ async def snapshot_upload(snapshot: UploadFile = File(...)):
         save_path = SNAPSHOT_DIR / filename
         loop = asyncio.get_running_loop()
         await loop.run_in_executor(None, save_path.write_bytes, data)
+        get_gallery_index().add(save_path)
+        # Thumbnail is generated once, off the request path
+        loop.run_in_executor(None, make_thumbnail, save_path, snapshot_thumb_path(filename))
         return {"message": "Snapshot saved", "path": f"/video/snapshots/{filename}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,113 @@
+"""
+stream_upload.py
+---------------------------------
+Incremental multipart/form-data parsing straight to disk.
+
+FastAPI's `UploadFile` only reaches the endpoint after the whole body has
+been received. Endpoints that take a plain `Request` can use
+`stream_multipart` instead: file parts are written to disk chunk by chunk
+as they arrive, and callbacks fire when a file part starts and ends, so
+processing can begin while the upload is still in flight. File data is
+buffered and written in UPLOAD_FLUSH_BYTES blocks on a worker thread, so
+disk writes never stall the event loop.
+"""
+
+import asyncio
+from pathlib import Path
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_FLUSH_BYTES = 1 << 20  # readers tailing the file see data in blocks of this size
+
+
+def _write_block(out, data):
+    out.write(data)
+    out.flush()  # visible to readers tailing the file
+
+
+async def stream_multipart(request: Request, file_path_for, on_file_begin=None, on_file_end=None):
+    """
+    Parse the request body as it streams in.
+
+    file_path_for(field, filename) -> Path | None   where to store a file part (None skips it)
+    on_file_begin(field, path, fields)              called once the file is created, before any data
+    on_file_end(field, path)                        called once the part is complete
+
+    Returns (fields, files): form values by name, and {field: (path, filename)}.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    events = []
+    callbacks = {
+        "on_part_begin": lambda: events.append(("begin", b"")),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", b"")),
+        "on_header_field": lambda data, start, end: events.append(("hfield", data[start:end])),
+        "on_header_value": lambda data, start, end: events.append(("hvalue", data[start:end])),
+        "on_header_end": lambda: events.append(("hend", b"")),
+        "on_headers_finished": lambda: events.append(("hdone", b"")),
+    }
+    parser = MultipartParser(boundary, callbacks)
+
+    fields, files = {}, {}
+    headers, h_field, h_value = {}, b"", b""
+    name, target, value, out, out_path = None, None, b"", None, None
+    pending = bytearray()
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                if kind == "begin":
+                    headers, h_field, h_value = {}, b"", b""
+                    name, target, value, out, out_path = None, None, b"", None, None
+                elif kind == "hfield":
+                    h_field += data
+                elif kind == "hvalue":
+                    h_value += data
+                elif kind == "hend":
+                    headers[h_field.lower()] = h_value
+                    h_field, h_value = b"", b""
+                elif kind == "hdone":
+                    _, opts = parse_options_header(headers.get(b"content-disposition", b""))
+                    name = opts.get(b"name", b"").decode("utf-8", "ignore")
+                    filename = opts.get(b"filename")
+                    target = "field" if filename is None else "skip"
+                    if filename:  # empty file inputs arrive as filename=""
+                        filename = Path(filename.decode("utf-8", "ignore")).name
+                        out_path = file_path_for(name, filename)
+                        if out_path is not None:
+                            out_path = Path(out_path)
+                            files[name] = (out_path, filename)
+                            out = open(out_path, "wb")
+                            target = "file"
+                            if on_file_begin:
+                                on_file_begin(name, out_path, fields)
+                elif kind == "data":
+                    if target == "file":
+                        pending += data
+                        if len(pending) >= UPLOAD_FLUSH_BYTES:
+                            await asyncio.to_thread(_write_block, out, bytes(pending))
+                            pending.clear()
+                    elif target == "field":
+                        value += data
+                elif kind == "end":
+                    if target == "file":
+                        await asyncio.to_thread(_write_block, out, bytes(pending))
+                        pending.clear()
+                        out.close()
+                        out = None
+                        if on_file_end:
+                            on_file_end(name, out_path)
+                    elif target == "field":
+                        fields[name] = value.decode("utf-8", "ignore")
+            events.clear()
+        parser.finalize()
+    finally:
+        if out is not None:
+            out.close()
+
+    return fields, files
@@ -1,11 +1,26 @@
-from fastapi import APIRouter, UploadFile, Form, File, BackgroundTasks
+from fastapi import APIRouter, UploadFile, Form, File, Request, Response
 from pathlib import Path
 from fastapi.responses import FileResponse, JSONResponse
-import cv2, numpy as np, base64, time, asyncio, json, uuid
+import cv2, numpy as np, base64, os, time, asyncio, json, mimetypes, uuid, threading
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-from inference.modnet_infer_video import apply_modnet_video, apply_modnet_video_file
-from routers.CleanFiles import cleanup_old_files
-from progress import read_progress, start_progress
+from inference.modnet_infer_video import (
+    SubjectTracker, run_video_job, EXPORT_FORMATS, export_output_name,
+)
+from inference.webcam import (
+    process_frame_sync, FRAME_FORMATS, FRAME_MEDIA_TYPES, WEBCAM_MAX_WIDTH,
+)
+from inference.governor import governor
+from inference.registry import registry, DEFAULT_VIDEO_MODEL
+from inference.memory import MemoryUsage
+from inference.blur import BlurCache
+from inference.process_pool import inference_pool, PoolError
+from inference.video_io import GrowingFile, PLAYLIST_NAME, segment_dir_for
+from routers.CleanFiles import retention
+from routers.stream_upload import stream_multipart
+from progress import read_progress, start_progress, fail_progress
+from jobs import job_manifest_path, save_job, update_job, load_job, unfinished_jobs
+from broker import get_broker, REMOTE_WORKERS
 
 router = APIRouter(prefix="/api/video", tags=["AJAX Video API"])
 
@@ -19,111 +34,291 @@ UPLOAD_DIR = BASE_DIR / "upload"
 for d in [CHANGED_DIR, BACKGROUND_DIR, CHANGED_VIDEO_DIR, UPLOAD_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
-executor = ThreadPoolExecutor(max_workers=3)
+# Full-video jobs (may wait on uploads); their frames take BATCH governor slots.
+# Webcam frames run on the governor's interactive pool.
+video_executor = ThreadPoolExecutor(max_workers=2)
 
 # =================================================
-# 🎥 Background Video Manager (for Webcam)
+# 📶 Webcam quality negotiation
 # =================================================
-bg_video_cache = {
-    "cap": None,
-    "path": None,
-    "frame_count": 0,
-    "index": 0
-}
-
-def get_next_bg_frame(bg_path, target_size):
-    """Read next frame from background video, looping when necessary."""
-    global bg_video_cache
-
-    if not bg_path:
-        return None
+def env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+
+# Operator bounds for negotiated webcam settings
+WEBCAM_MIN_INTERVAL_MS = env_int("WEBCAM_MIN_INTERVAL_MS", 100)
+WEBCAM_MAX_INTERVAL_MS = env_int("WEBCAM_MAX_INTERVAL_MS", 1000)
+WEBCAM_TARGET_INTERVAL_MS = env_int("WEBCAM_TARGET_INTERVAL_MS", 200)
+
+# Quality ladder, best first: (capture width, JPEG quality, inference size)
+WEBCAM_LEVELS = [
+    level for level in [
+        (1280, 0.90, 512),
+        (960, 0.85, 512),
+        (800, 0.80, 448),
+        (640, 0.75, 384),
+        (480, 0.70, 320),
+        (320, 0.60, 256),
+    ] if level[0] <= WEBCAM_MAX_WIDTH
+] or [(WEBCAM_MAX_WIDTH, 0.60, 256)]
+
+
+class AdaptiveQuality:
+    """
+    Per-session controller for webcam settings.
+
+    Tracks a smoothed round-trip time (client-reported, else server time).
+    When a frame takes longer than the interval budget it steps down the
+    quality ladder, and once at the bottom it lengthens the interval. When
+    there is headroom and no queue it first shortens the interval towards
+    the target rate, then steps back up. Upward moves need several calm
+    frames in a row so the session settles instead of oscillating.
+    """
+
+    UP_AFTER = 8
+    COOLDOWN = 3   # frames to let the average catch up after a change
+    ALPHA = 0.3
+
+    def __init__(self):
+        self.level = min(2, len(WEBCAM_LEVELS) - 1)
+        self.interval = WEBCAM_TARGET_INTERVAL_MS
+        self.rtt = None
+        self.calm = 0
+        self.cooldown = 0
+
+    def observe(self, server_ms, client_ms=0, queue=0):
+        sample = max(server_ms, client_ms or 0)
+        self.rtt = sample if self.rtt is None else (1 - self.ALPHA) * self.rtt + self.ALPHA * sample
+        if self.cooldown:
+            self.cooldown -= 1
+            return
+        budget = max(self.interval, WEBCAM_TARGET_INTERVAL_MS)
+
+        if self.rtt > 0.9 * budget or queue > 0:
+            self.calm = 0
+            self.cooldown = self.COOLDOWN
+            if self.level < len(WEBCAM_LEVELS) - 1:
+                self.level += 1
+            else:
+                self.interval = min(WEBCAM_MAX_INTERVAL_MS, int(self.rtt * 1.2))
+        elif self.rtt < 0.5 * budget:
+            self.calm += 1
+            if self.calm >= self.UP_AFTER:
+                self.calm = 0
+                self.cooldown = self.COOLDOWN
+                if self.interval > WEBCAM_TARGET_INTERVAL_MS:
+                    self.interval = max(WEBCAM_TARGET_INTERVAL_MS, int(self.interval * 0.8))
+                elif self.level > 0:
+                    self.level -= 1
+                else:
+                    self.interval = max(WEBCAM_MIN_INTERVAL_MS, int(self.interval * 0.9))
+        else:
+            self.calm = 0
 
-    # Initialize or reload if new path
-    if (bg_video_cache["path"] != bg_path) or (bg_video_cache["cap"] is None):
-        if bg_video_cache["cap"]:
-            bg_video_cache["cap"].release()
-        cap = cv2.VideoCapture(str(bg_path))
-        if not cap.isOpened():
-            print(f"⚠️ Could not open background video: {bg_path}")
-            return None
-        bg_video_cache.update({
-            "cap": cap,
-            "path": bg_path,
-            "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1,
-            "index": 0
-        })
-        print(f"🎞️ Loaded webcam background video ({bg_video_cache['frame_count']} frames)")
-
-    cap = bg_video_cache["cap"]
-    total = bg_video_cache["frame_count"]
-    idx = bg_video_cache["index"]
-
-    ret, frame = cap.read()
-    if not ret:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        ret, frame = cap.read()
-        bg_video_cache["index"] = 1
-    else:
-        bg_video_cache["index"] = (idx + 1) % total
+    @property
+    def infer_size(self):
+        return WEBCAM_LEVELS[self.level][2]
+
+    def hint(self):
+        width, quality, infer_size = WEBCAM_LEVELS[self.level]
+        return {"width": width, "quality": quality, "interval": self.interval, "infer_size": infer_size}
+
+
+class WebcamSession:
+    """Per-session webcam state: ROI tracker, quality controller, blurred-background cache, background frame index."""
+
+    def __init__(self):
+        self.tracker = SubjectTracker()
+        self.quality = AdaptiveQuality()
+        self.blur_cache = BlurCache()
+        self.bg_index = 0
 
-    if ret and frame is not None:
-        frame = cv2.resize(frame, target_size)
-        return frame
-    return None
 
+MAX_WEBCAM_SESSIONS = 32
+webcam_sessions = OrderedDict()
+
+
+def webcam_stream(session):
+    """Inference-pool stream of a webcam session."""
+    return f"webcam:{session}"
+
+
+def get_webcam_session(session):
+    """
+    State for a webcam session (least recently used sessions are dropped,
+    together with their state in the inference process).
+    """
+    state = webcam_sessions.pop(session, None) or WebcamSession()
+    webcam_sessions[session] = state
+    while len(webcam_sessions) > MAX_WEBCAM_SESSIONS:
+        dropped, _ = webcam_sessions.popitem(last=False)
+        inference_pool.close_stream(webcam_stream(dropped))
+    return state
 
 
 # =================================================
-# 🧠 Process Single Frame (Webcam)
+# 🚦 Webcam admission control (latest frame wins)
 # =================================================
-def process_frame_sync(frame_bytes, mode, color, bg_file_data=None, bg_temp_path=None):
-    """Heavy synchronous MODNet frame processing (runs in thread)."""
-    npimg = np.frombuffer(frame_bytes, np.uint8)
-    frame = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-    if frame is None:
-        return {"error": "Invalid webcam frame"}
-
-    # Parse color
-    hex_color = color.lstrip("#")
-    r, g, b = int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
-    bg_bgr = (b, g, r)
-
-    bg_img = None
-    if bg_temp_path:
-        ext = Path(bg_temp_path).suffix.lower()
-        if ext in [".mp4", ".mov", ".avi", ".mkv"]:
-            bg_img = get_next_bg_frame(bg_temp_path, (frame.shape[1], frame.shape[0]))
+class FrameAdmission:
+    """
+    Per-session admission for webcam frames, on the event loop.
+
+    Each session has at most one frame in flight and one queued. A newer
+    frame replaces the queued one (which is answered as superseded), so a
+    slow server skips frames instead of building a backlog. Sessions that
+    have nothing in flight are refused once `capacity` sessions are busy.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.sessions = {}   # session -> queued frame's future (None when idle queue)
+        self.superseded = 0
+        self.rejected = 0
+
+    async def admit(self, session) -> str:
+        """'run' when the frame may be processed, else 'superseded' or 'overloaded'."""
+        if session not in self.sessions:
+            if len(self.sessions) >= self.capacity:
+                self.rejected += 1
+                return "overloaded"
+            self.sessions[session] = None
+            return "run"
+
+        queued = self.sessions[session]
+        if queued is not None and not queued.done():
+            queued.set_result(False)
+            self.superseded += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.sessions[session] = waiter
+        try:
+            return "run" if await waiter else "superseded"
+        except asyncio.CancelledError:  # client went away while queued
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release(session)  # turn was handed over just before
+            elif self.sessions.get(session) is waiter:
+                self.sessions[session] = None
+            raise
+
+    def release(self, session):
+        """Frame finished: hand the session's turn to its queued frame, if any."""
+        waiter = self.sessions.get(session)
+        if waiter is not None and not waiter.done():
+            self.sessions[session] = None
+            waiter.set_result(True)
         else:
-            img = cv2.imread(str(bg_temp_path))
-            if img is not None:
-                bg_img = cv2.resize(img, (frame.shape[1], frame.shape[0]))
-
-    elif bg_file_data:
-        bg_np = np.frombuffer(bg_file_data, np.uint8)
-        bg_img = cv2.imdecode(bg_np, cv2.IMREAD_COLOR)
-
-    result = apply_modnet_video(frame, mode=mode, bgcolor=bg_bgr, bg_image=bg_img)
-
-    timestamp = int(time.time() * 1000)
-    output_path = CHANGED_DIR / f"frame_changed_{timestamp}.jpg"
-    cv2.imwrite(str(output_path), result)
-    _, buffer = cv2.imencode(".jpg", result)
-    encoded = base64.b64encode(buffer).decode("utf-8")
-    cleanup_old_files(CHANGED_DIR, max_files=100)
-    cleanup_old_files(BACKGROUND_DIR, max_files=100)
-    return {
-        "result": f"data:image/jpeg;base64,{encoded}",
-        "saved_path": f"/video/changed/{output_path.name}"
-    }
+            self.sessions.pop(session, None)
+
+    def stats(self):
+        return {
+            "busy_sessions": len(self.sessions),
+            "queued": sum(1 for w in self.sessions.values() if w is not None and not w.done()),
+            "capacity": self.capacity,
+            "superseded": self.superseded,
+            "rejected": self.rejected,
+        }
+
+
+# Sessions with a frame in flight; beyond that new sessions get 503
+WEBCAM_CAPACITY = int(os.environ.get("WEBCAM_CAPACITY") or governor.slots * 2)
+webcam_admission = FrameAdmission(WEBCAM_CAPACITY)
+
+
+# =================================================
+# 🧠 Process Single Frame (Webcam)
+# =================================================
+def run_webcam_frame(session, roi, frame_bytes, mode, color, bg_temp_path, infer_size, fmt, quality,
+                     matte_only, model, state):
+    """
+    process_frame_sync for an admitted webcam frame: in an inference process
+    when the pool runs (the session's tracker, blur cache and background
+    frame index live there), else in this thread with the session's state.
+    """
+    frame = np.frombuffer(frame_bytes, np.uint8)
+    stream = webcam_stream(session)
+    if not inference_pool.fits(frame, out_bytes=WEBCAM_MAX_WIDTH * WEBCAM_MAX_WIDTH * 4, stream=stream):
+        return process_frame_sync(frame_bytes, mode, color, None, bg_temp_path, state.tracker if roi else None,
+                                  infer_size, fmt, quality, matte_only, model, state.blur_cache, state)
+    params = dict(mode=mode, color=color, bg_path=bg_temp_path, roi=roi, infer_size=infer_size, fmt=fmt,
+                  quality=quality, matte_only=matte_only, model=model)
+    try:
+        with inference_pool.call("webcam_frame", stream, params, frame=frame) as image:
+            return {"image": image.tobytes(), "ext": FRAME_FORMATS.get(fmt, FRAME_FORMATS["jpeg"])[0]}
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+def save_webcam_frame(output_path: Path, data: bytes):
+    """Write an already-encoded webcam frame (opt-in, runs off the request path)."""
+    output_path.write_bytes(data)
+    retention.track(output_path)
 
 @router.post("/process_frame")
 async def process_frame(
+    request: Request,
     mode: str = Form("color"),
     color: str = Form("#ffffff"),
     file: UploadFile = File(...),
-    bg_file: UploadFile = None
+    bg_file: UploadFile = None,
+    roi: bool = Form(False),
+    session: str = Form(""),
+    client_ms: float = Form(0),
+    binary: bool = Form(False),
+    format: str = Form("jpeg"),
+    quality: int = Form(0),
+    save: bool = Form(False),
+    matte_only: bool = Form(False),
+    model: str = Form(""),
 ):
-    """Async MODNet background processing for webcam frames (supports video BG)."""
+    """
+    Async MODNet background processing for webcam frames (supports video BG).
+    With roi=true inference runs on a crop around the subject, tracked
+    across the frames of the same `session`.
+
+    Admission is per session: one frame in flight, newer frames replace a
+    queued one ({"superseded": true}), and 503 + Retry-After when all
+    webcam capacity is busy (or the inference process failed the frame).
+
+    Each result carries `stats` (server time, queue depth) and a `hint`
+    with the negotiated capture width, JPEG quality, interval and inference
+    size. The client reports its previous round trip as `client_ms`.
+
+    binary=true returns the encoded image itself (`format` jpeg|webp,
+    `quality` 1-100, 0 = negotiated) with stats/hint in X-Frame-Stats /
+    X-Frame-Hint headers, and 204 for superseded frames. Otherwise a JSON
+    data URL is returned. save=true also stores the frame in video/changed
+    (written in the background).
+
+    matte_only=true returns just the grayscale matte (at most the inference
+    resolution; format png, webp or jpeg) for compositing in the browser.
+
+    `model` picks a registry model by name (default: webcam).
+    """
+    try:
+        model = registry.resolve(model, DEFAULT_VIDEO_MODEL)
+    except KeyError as e:
+        return JSONResponse({"error": str(e.args[0])}, status_code=400)
+    session = session or f"{request.client.host}:{request.client.port}"
+    admission = await webcam_admission.admit(session)
+    if admission == "superseded":
+        return Response(status_code=204) if binary else {"superseded": True}
+    if admission == "overloaded":
+        return JSONResponse({"error": "Server busy, retry shortly."}, status_code=503,
+                            headers={"Retry-After": "1"})
+    try:
+        return await process_admitted_frame(mode, color, file, bg_file, roi, session, client_ms,
+                                            binary, format, quality, save, matte_only, model)
+    except PoolError as e:
+        print(f"⚠️ Webcam frame for {session} failed in the inference pool: {e}")
+        return JSONResponse({"error": "Server busy, retry shortly."}, status_code=503,
+                            headers={"Retry-After": "1"})
+    finally:
+        webcam_admission.release(session)
+
+
+async def process_admitted_frame(mode, color, file, bg_file, roi, session, client_ms=0,
+                                 binary=False, fmt="jpeg", quality=0, save=False, matte_only=False,
+                                 model=None):
+    """Run one admitted webcam frame through MODNet (interactive slot)."""
     frame_bytes = await file.read()
     bg_temp_path = None
 
@@ -134,17 +329,56 @@ async def process_frame(
         with open(bg_temp_path, "wb") as f:
             f.write(await bg_file.read())
 
-    loop = asyncio.get_running_loop()
-    result = await loop.run_in_executor(
-        executor,
-        process_frame_sync,
+    state = get_webcam_session(session)
+    started = time.perf_counter()
+    result = await governor.run(
+        run_webcam_frame,
+        session,
+        roi,
         frame_bytes,
         mode,
         color,
-        None,
         str(bg_temp_path) if bg_temp_path else None,
+        state.quality.infer_size,
+        fmt,
+        max(1, min(100, quality or int(state.quality.hint()["quality"] * 100))),
+        matte_only,
+        model,
+        state,
     )
-    return result
+    if "error" in result:
+        return JSONResponse(result, status_code=400)
+
+    # Report load and the next negotiated settings with each result
+    server_ms = (time.perf_counter() - started) * 1000
+    queue = governor.stats()["interactive"]["waiting"] + webcam_admission.stats()["queued"]
+    state.quality.observe(server_ms, client_ms, queue)
+    stats = {"server_ms": round(server_ms, 1), "queue": queue}
+    hint = state.quality.hint()
+
+    image, ext = result["image"], result["ext"]
+    saved_path = None
+    if save:
+        output_path = CHANGED_DIR / f"frame_changed_{int(time.time() * 1000)}{ext}"
+        asyncio.get_running_loop().run_in_executor(None, save_webcam_frame, output_path, image)
+        saved_path = f"/video/changed/{output_path.name}"
+
+    if binary:
+        headers = {"X-Frame-Stats": json.dumps(stats), "X-Frame-Hint": json.dumps(hint),
+                   "Cache-Control": "no-store"}
+        if saved_path:
+            headers["X-Saved-Path"] = saved_path
+        return Response(content=image, media_type=FRAME_MEDIA_TYPES[ext], headers=headers)
+
+    encoded = base64.b64encode(image).decode("utf-8")
+    response = {
+        "result": f"data:{FRAME_MEDIA_TYPES[ext]};base64,{encoded}",
+        "stats": stats,
+        "hint": hint,
+    }
+    if saved_path:
+        response["saved_path"] = saved_path
+    return response
 
 
 
@@ -152,55 +386,270 @@ async def process_frame(
 # =================================================
 # 🎞️ Process Full Video (Upload Tab)
 # =================================================
+def form_flag(fields, name, default=False):
+    """Read a boolean form field ('true', '1', 'on', ...)."""
+    value = fields.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "on", "yes")
+
+
+# Memory usage of running video jobs, by progress file name
+job_memory = {}
+# Broker job ids of video jobs handed to workers, by progress file name
+remote_jobs = {}
+REMOTE_POLL_SECONDS = 2
+
+
+def submit_video_job(manifest_path, job, upload):
+    """
+    Run a video job (manifest parameters) in the video pool, or hand it to
+    the workers when JOB_WORKERS=remote. Its files are protected from
+    retention while it runs, and the manifest status is set to done/failed
+    (with the job's peak memory) when it ends.
+    """
+    paths = (job["input_path"], job["bg_path"], job["output_path"], job["preview_path"],
+             job["progress_path"], manifest_path, segment_dir_for(job["output_path"]))
+    retention.hold(*paths)
+    if REMOTE_WORKERS:
+        # A light follower thread, so waiting jobs don't take the video pool
+        threading.Thread(target=enqueue_video_job, args=(manifest_path, job, upload, paths),
+                         daemon=True, name=f"remote-{manifest_path.stem}").start()
+        return None
+    usage = job_memory[Path(job["progress_path"]).name] = MemoryUsage()
+    future = video_executor.submit(run_video_job, job, upload, usage)
+
+    def on_done(f):
+        ok = f.exception() is None and f.result()
+        if f.exception() is not None:
+            print(f"❌ Video job crashed: {f.exception()}")
+            fail_progress(job["progress_path"])
+        update_job(manifest_path, status="done" if ok else "failed", memory=usage.as_dict())
+        job_memory.pop(Path(job["progress_path"]).name, None)
+        retention.release(*paths)
+
+    future.add_done_callback(on_done)
+    return future
+
+
+def enqueue_video_job(manifest_path, job, upload, paths):
+    """
+    Remote mode: wait for the upload to finish (workers read the file from
+    the shared media directory), queue the job on the broker, then follow
+    it until a worker completes it or it runs out of attempts.
+    """
+    upload.done.wait()
+    if upload.failed:
+        fail_progress(job["progress_path"])
+        update_job(manifest_path, status="failed")
+        retention.release(*paths)
+        return False
+
+    broker = get_broker()
+    job_id = broker.enqueue("video", job, job_id=manifest_path.stem)  # no-op when resumed
+    remote_jobs[Path(job["progress_path"]).name] = job_id
+    state = None
+    try:
+        while True:
+            time.sleep(REMOTE_POLL_SECONDS)
+            try:
+                state = broker.get(job_id)
+            except Exception as e:  # broker busy / shared mount hiccup: keep following
+                print(f"⚠️ Could not poll video job {job_id}: {e}")
+                continue
+            if state is None or state["status"] in ("done", "failed"):
+                break
+    finally:
+        remote_jobs.pop(Path(job["progress_path"]).name, None)
+        ok = state is not None and state["status"] == "done"
+        if not ok:
+            fail_progress(job["progress_path"])
+        memory = (state or {}).get("result") or {}
+        update_job(manifest_path, status="done" if ok else "failed", **memory)
+        retention.release(*paths)
+    return ok
+
+
+def resume_unfinished_jobs():
+    """
+    Called once at startup: restart video jobs interrupted by the previous
+    shutdown. Full renders continue after their last finished segment.
+    Jobs that cannot continue (upload cut off, input gone) and orphaned
+    progress files are marked failed instead of staying stuck.
+    """
+    resumed = set()
+    for manifest_path, job in unfinished_jobs(CHANGED_VIDEO_DIR):
+        input_path = Path(job["input_path"])
+        bg_missing = job["bg_path"] and not Path(job["bg_path"]).exists()
+        if not job.get("uploaded") or not input_path.exists() or bg_missing:
+            print(f"⚠️ Cannot resume {manifest_path.name}: input incomplete or missing")
+            fail_progress(job["progress_path"])
+            update_job(manifest_path, status="failed")
+            continue
+        upload = GrowingFile(input_path)
+        upload.finish()
+        print(f"🔁 Resuming video job {manifest_path.name}")
+        submit_video_job(manifest_path, job, upload)
+        resumed.add(Path(job["progress_path"]).name)
+
+    for progress_file in CHANGED_VIDEO_DIR.glob("progress_*.json"):
+        if progress_file.name in resumed:
+            continue
+        if read_progress(progress_file).get("stage") not in ("done", "failed"):
+            fail_progress(progress_file)
+
+
 @router.post("/process_video")
-async def process_video(
-    background_tasks: BackgroundTasks,
-    mode: str = Form("color"),
-    color: str = Form("#00ff00"),
-    file: UploadFile = File(...),
-    bg_file: UploadFile = File(None),
-    blur_strength: int = Form(25),
-):
-    """Handles video upload and background processing (supports image or video backgrounds)."""
+async def process_video(request: Request):
+    """
+    Handles video upload and background processing (supports image or video backgrounds).
+
+    Form fields: mode, color, blur_strength, preview, full_render, roi, export, model, bg_file, file.
+    The upload is streamed to disk in chunks. When the options (and any
+    bg_file) arrive before `file`, MODNet starts decoding while the video is
+    still uploading; otherwise processing starts once the upload completes.
+    With preview=true a fast low-res preview is rendered first
+    (`preview_url`), followed by the full render unless full_render=false.
+    The full render is playable while it runs as an HLS playlist of fMP4
+    segments (`stream_url`), until the final MP4 at `output_url` is ready.
+    export=matte|alpha|png_zip skips compositing and writes only the matte
+    (grayscale MP4, VP9 WebM with alpha, or a PNG sequence ZIP).
+    `model` picks a registry model by name (default: webcam); an unknown
+    one is refused with 400 as soon as a file part starts, so the upload is
+    not stored.
+    """
 
     file_id = str(uuid.uuid4())[:8]
     input_path = (UPLOAD_DIR / f"input_{file_id}.mp4").resolve()
     output_path = (CHANGED_VIDEO_DIR / f"output_{file_id}.mp4").resolve()
     progress_path = (CHANGED_VIDEO_DIR / f"progress_{file_id}.json").resolve()
-    bg_path = None
+    preview_path = (CHANGED_VIDEO_DIR / f"preview_{file_id}.mp4").resolve()
+    manifest_path = job_manifest_path(CHANGED_VIDEO_DIR, file_id).resolve()
+    stream_dir = segment_dir_for(output_path)
+    expected_size = int(request.headers.get("content-length") or 0)
+    job = {"upload": None, "bg_path": None, "started": False, "output_path": output_path, "rejected": None}
+
+    def file_path_for(field, filename):
+        if field == "file":
+            return input_path
+        if field == "bg_file":
+            ext = Path(filename).suffix or ".jpg"
+            return (UPLOAD_DIR / f"bg_{file_id}{ext}").resolve()
+        return None
 
-    # Save main input video
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    def start_job(fields):
+        try:
+            blur_strength = int(fields.get("blur_strength", 25))
+        except ValueError:
+            blur_strength = 25
+        # Transparent output needs an alpha-capable container
+        export = fields.get("export") or ("alpha" if fields.get("mode") == "transparent" else "mp4")
+        if export not in EXPORT_FORMATS:
+            export = "mp4"
+        model = registry.resolve(fields.get("model"), DEFAULT_VIDEO_MODEL)
+        job["output_path"] = (CHANGED_VIDEO_DIR / export_output_name(f"output_{file_id}", export)).resolve()
+        params = save_job(
+            manifest_path,
+            input_path=str(input_path),
+            output_path=str(job["output_path"]),
+            preview_path=str(preview_path),
+            progress_path=str(progress_path),
+            bg_path=str(job["bg_path"]) if job["bg_path"] else None,
+            mode=fields.get("mode", "color"),
+            color=fields.get("color", "#00ff00"),
+            blur_strength=blur_strength,
+            preview=form_flag(fields, "preview"),
+            full_render=form_flag(fields, "full_render", True),
+            roi=form_flag(fields, "roi"),
+            export=export,
+            model=model,
+            expected_size=expected_size,
+            uploaded=job["upload"].done.is_set(),
+        )
+        job["started"] = True
+        start_progress(progress_path, "starting")
+        # ✅ Run in the video pool (non-blocking for the request)
+        submit_video_job(manifest_path, params, job["upload"])
+
+    def release_job_files():
+        retention.release(input_path, job["bg_path"], manifest_path)
+
+    def model_error(fields):
+        try:
+            registry.resolve(fields.get("model"), DEFAULT_VIDEO_MODEL)
+        except KeyError as e:
+            return str(e.args[0])
+        return None
 
-    # Save optional background (image or video)
-    if bg_file:
-        ext = Path(bg_file.filename).suffix or ".jpg"
-        bg_path = (UPLOAD_DIR / f"bg_{file_id}{ext}").resolve()
-        with open(bg_path, "wb") as f:
-            f.write(await bg_file.read())
-        print(f"🎨 Background saved as {bg_path.name}")
+    def reject(error):
+        for path in (job["rejected"], job["bg_path"], input_path):
+            if path:
+                Path(path).unlink(missing_ok=True)
+        release_job_files()
+        print(f"❌ Video upload refused: {error}")
+        return JSONResponse({"error": error}, status_code=400)
+
+    def on_file_begin(field, path, fields):
+        error = model_error(fields)  # options sent before this file: check them now
+        if error:
+            job["rejected"] = path
+            raise ValueError(error)
+        retention.hold(path)
+        if field != "file":
+            return
+        job["upload"] = GrowingFile(path)
+        mode = fields.get("mode")
+        if mode and (mode != "custom" or job["bg_path"]):
+            start_job(fields)
+
+    def on_file_end(field, path):
+        if field == "file":
+            job["upload"].finish()
+            if job["started"]:
+                update_job(manifest_path, uploaded=True)
+        elif field == "bg_file":
+            job["bg_path"] = path
+            print(f"🎨 Background saved as {path.name}")
 
-    start_progress(progress_path, "starting")
+    try:
+        fields, files = await stream_multipart(request, file_path_for, on_file_begin, on_file_end)
+    except Exception as e:
+        if job["rejected"]:
+            return reject(str(e))
+        if job["upload"]:
+            job["upload"].abort()
+        if job["started"]:
+            fail_progress(progress_path)
+        else:
+            release_job_files()
+        print(f"❌ Video upload failed: {e}")
+        return JSONResponse({"error": "Upload failed."}, status_code=400)
 
-    # ✅ Schedule background execution (non-blocking)
-    background_tasks.add_task(
-        apply_modnet_video_file,
-        str(input_path),
-        str(output_path),
-        mode,
-        color,
-        str(bg_path) if bg_path else None,
-        str(progress_path),
-        blur_strength
-    )
+    if "file" not in files:
+        release_job_files()
+        return JSONResponse({"error": "No video uploaded."}, status_code=400)
+
+    if not job["started"]:
+        error = model_error(fields)  # `model` sent after the files
+        if error:
+            return reject(error)
+        start_job(fields)
 
     # ✅ Return immediately for frontend polling
-    return {
+    response = {
         "result": "processing",
         "progress_id": file_id,
-        "output_url": f"/video/changedVideo/{output_path.name}"
+        "output_url": f"/video/changedVideo/{job['output_path'].name}",
     }
+    if job["output_path"] != output_path:  # matte/alpha export
+        return response
+    response["stream_url"] = f"/video/changedVideo/{stream_dir.name}/{PLAYLIST_NAME}"
+    if form_flag(fields, "preview"):
+        response["preview_url"] = f"/video/changedVideo/{preview_path.name}"
+        if not form_flag(fields, "full_render", True):
+            response["output_url"] = response["preview_url"]
+            del response["stream_url"]
+    return response
 
 # =================================================
 # ⬇️ Download Processed Video
@@ -217,11 +666,18 @@ async def download_video(filename: str):
             break
         await asyncio.sleep(0.5)
 
-    return FileResponse(path=file_path, filename=filename, media_type="video/mp4")
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return FileResponse(path=file_path, filename=filename, media_type=media_type)
 
 # =================================================
 # 📊 Progress Polling Endpoint
 # =================================================
+@router.get("/webcam_status")
+async def webcam_status():
+    """Webcam admission state (busy sessions, queued, shed frames)."""
+    return webcam_admission.stats()
+
+
 @router.get("/progress/{file_id}")
 async def get_progress(file_id: str):
     progress_file = (CHANGED_VIDEO_DIR / f"progress_{file_id}.json").resolve()
@@ -236,6 +692,21 @@ async def get_progress(file_id: str):
         print("⚠️ Error reading progress file:", e)
         data = {"progress": 0.0, "stage": "unknown"}
 
+    # Worker-side state of jobs handed to the broker
+    job_id = remote_jobs.get(progress_file.name)
+    if job_id is not None:
+        state = await asyncio.to_thread(get_broker().get, job_id) or {}
+        data["job"] = {k: state.get(k) for k in ("status", "attempts", "lease_owner", "error")}
+
+    # Peak memory: live while the job runs, from the manifest afterwards
+    usage = job_memory.get(progress_file.name)
+    if usage is not None:
+        data["memory"] = usage.as_dict()
+    else:
+        manifest = load_job(job_manifest_path(CHANGED_VIDEO_DIR, file_id)) or {}
+        if "memory" in manifest:
+            data["memory"] = manifest["memory"]
+
     data["timestamp"] = time.time()
     headers = {
         "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
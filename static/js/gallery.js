@@ -15,97 +15,143 @@ document.addEventListener("DOMContentLoaded", () => {
 
   let items = [];
   let currentIndex = 0;
-  let observer = null;
+  let etag = null;        // ETag of the first page (unchanged polls → 304)
+  let nextCursor = null;  // cursor for the next page, null when at the end
+
+  // Lazy-load thumbnails
+  const observer = new IntersectionObserver(entries => {
+    entries.forEach(e => {
+      if (e.isIntersecting) {
+        const el = e.target;
+        if (el.dataset.src) {
+          el.src = el.dataset.src;
+          el.removeAttribute("data-src");
+        }
+        observer.unobserve(el);
+      }
+    });
+  });
+
+  // "Load more" button for the next page
+  const loadMoreBtn = document.createElement("button");
+  loadMoreBtn.className = "btn";
+  loadMoreBtn.textContent = "⬇ Load more";
+  loadMoreBtn.style.display = "none";
+  loadMoreBtn.style.margin = "16px auto";
+  loading.insertAdjacentElement("afterend", loadMoreBtn);
+  loadMoreBtn.addEventListener("click", loadMore);
+
+  // =============== FETCH PAGE ===============
+  async function fetchPage(cursor) {
+    const url = "/api/gallery/list" + (cursor ? `?cursor=${encodeURIComponent(cursor)}` : "");
+    const headers = {};
+    if (!cursor && etag) headers["If-None-Match"] = etag;
+
+    const res = await fetch(url, { headers, cache: "no-store" });
+    if (res.status === 304) return null; // nothing changed
+    if (!res.ok) throw new Error("HTTP " + res.status);
+    if (!cursor) etag = res.headers.get("ETag");
+    return res.json();
+  }
 
   // =============== LOAD GALLERY ===============
   async function loadGallery() {
     try {
-      const res = await fetch("/api/gallery/list");
-      const data = await res.json();
+      const data = await fetchPage(null);
+      if (!data) return;
+
       items = data.gallery || [];
+      nextCursor = data.next_cursor;
 
       gallery.innerHTML = "";
       loading.textContent = "";
+      items.forEach((item, index) => renderItem(item, index));
+      loadMoreBtn.style.display = nextCursor ? "block" : "none";
 
-      items.forEach((item, index) => {
-        const box = document.createElement("div");
-        box.className = "item";
-        box.dataset.index = index;
-
-        // ---------- Thumbnail ----------
-        if (item.type === "video") {
-          box.classList.add("video");
+    } catch (err) {
+      loading.textContent = "Error loading gallery.";
+      console.error(err);
+    }
+  }
 
-          const wrap = document.createElement("div");
-          wrap.className = "thumb video-thumb";
+  async function loadMore() {
+    if (!nextCursor) return;
+    try {
+      const data = await fetchPage(nextCursor);
+      const page = (data && data.gallery) || [];
+      const offset = items.length;
+      items = items.concat(page);
+      nextCursor = data ? data.next_cursor : null;
+      page.forEach((item, i) => renderItem(item, offset + i));
+      loadMoreBtn.style.display = nextCursor ? "block" : "none";
+    } catch (err) {
+      console.error(err);
+    }
+  }
 
-          const img = document.createElement("img");
-          img.className = "thumb-img";
-          img.dataset.src = item.thumbnail;
+  window.refreshGallery = () => {
+    etag = null;
+    loadGallery();
+  };
 
-          const play = document.createElement("div");
-          play.className = "play-overlay";
+  // =============== RENDER ITEM ===============
+  function renderItem(item, index) {
+    const box = document.createElement("div");
+    box.className = "item";
+    box.dataset.index = index;
 
-          wrap.appendChild(img);
-          wrap.appendChild(play);
-          wrap.addEventListener("click", () => openViewer(index));
+    // ---------- Thumbnail ----------
+    if (item.type === "video") {
+      box.classList.add("video");
 
-          box.appendChild(wrap);
-        } else {
-          const img = document.createElement("img");
-          img.className = "thumb";
-          img.dataset.src = item.thumbnail;
-          img.addEventListener("click", () => openViewer(index));
-          box.appendChild(img);
-        }
+      const wrap = document.createElement("div");
+      wrap.className = "thumb video-thumb";
 
-        // ---------- Name ----------
-        const name = document.createElement("div");
-        name.style.textAlign = "center";
-        name.style.padding = "6px 0";
-        name.style.fontWeight = "600";
-        name.textContent = item.name;
-        box.appendChild(name);
-
-        // ---------- Actions ----------
-        const actions = document.createElement("div");
-        actions.className = "actions";
-        actions.innerHTML = `
-          <a href="${item.path}" download class="btn btn-download">⬇ Download</a>
-          <button class="btn btn-delete">🗑 Delete</button>
-        `;
-        box.appendChild(actions);
-
-        actions.querySelector(".btn-delete").addEventListener("click", async () => {
-          if (!confirm("Delete file?")) return;
-          await fetch(`/api/gallery/delete/${item.name}`, { method: "DELETE" });
-          loadGallery();
-        });
-
-        gallery.appendChild(box);
-      });
+      const img = document.createElement("img");
+      img.className = "thumb-img";
+      img.dataset.src = item.thumbnail;
 
-      // Lazy-load thumbnails
-      if (observer) observer.disconnect();
-      observer = new IntersectionObserver(entries => {
-        entries.forEach(e => {
-          if (e.isIntersecting) {
-            const el = e.target;
-            if (el.dataset.src) {
-              el.src = el.dataset.src;
-              el.removeAttribute("data-src");
-            }
-            observer.unobserve(el);
-          }
-        });
-      });
+      const play = document.createElement("div");
+      play.className = "play-overlay";
 
-      document.querySelectorAll("[data-src]").forEach(el => observer.observe(el));
+      wrap.appendChild(img);
+      wrap.appendChild(play);
+      wrap.addEventListener("click", () => openViewer(index));
 
-    } catch (err) {
-      loading.textContent = "Error loading gallery.";
-      console.error(err);
+      box.appendChild(wrap);
+    } else {
+      const img = document.createElement("img");
+      img.className = "thumb";
+      img.dataset.src = item.thumbnail;
+      img.addEventListener("click", () => openViewer(index));
+      box.appendChild(img);
     }
+
+    // ---------- Name ----------
+    const name = document.createElement("div");
+    name.style.textAlign = "center";
+    name.style.padding = "6px 0";
+    name.style.fontWeight = "600";
+    name.textContent = item.name;
+    box.appendChild(name);
+
+    // ---------- Actions ----------
+    const actions = document.createElement("div");
+    actions.className = "actions";
+    actions.innerHTML = `
+      <a href="${item.path}" download class="btn btn-download">⬇ Download</a>
+      <button class="btn btn-delete">🗑 Delete</button>
+    `;
+    box.appendChild(actions);
+
+    actions.querySelector(".btn-delete").addEventListener("click", async () => {
+      if (!confirm("Delete file?")) return;
+      await fetch(`/api/gallery/delete/${item.name}`, { method: "DELETE" });
+      window.refreshGallery();
+    });
+
+    gallery.appendChild(box);
+    box.querySelectorAll("[data-src]").forEach(el => observer.observe(el));
   }
 
   // =============== OPEN VIEWER ===============
@@ -74,6 +74,7 @@ document.addEventListener("DOMContentLoaded", () => {
     formData.append("mode", modeSelect.value);
     formData.append("color", document.getElementById("colorPicker").value);
     formData.append("blur_strength", document.getElementById("blurSlider").value);
+    formData.append("model", document.getElementById("modelSelect").value);
 
     const bgFile = document.getElementById("bg_file").files[0];
     if (bgFile) formData.append("bg_file", bgFile);
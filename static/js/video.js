@@ -89,6 +89,75 @@ if (bgFileInput) {
   });
 }
 
+// ======================================================
+// 📺 Live playback of a render in progress (HLS / fMP4)
+// ======================================================
+const SEGMENT_MIME = 'video/mp4; codecs="avc1.640028"';
+
+// Plays the segment playlist while the server is still producing it.
+// Native HLS (Safari) is used when available, otherwise the fMP4 segments
+// are fetched and appended to a MediaSource. Returns { stop() }.
+function playLiveStream(streamUrl, videoEl) {
+  let stopped = false;
+  const stop = () => { stopped = true; };
+
+  if (videoEl.canPlayType("application/vnd.apple.mpegurl")) {
+    videoEl.src = streamUrl;
+    videoEl.style.display = "block";
+    return { stop };
+  }
+  if (!window.MediaSource || !MediaSource.isTypeSupported(SEGMENT_MIME)) {
+    return { stop };
+  }
+
+  const base = streamUrl.slice(0, streamUrl.lastIndexOf("/") + 1);
+  const mediaSource = new MediaSource();
+  videoEl.src = URL.createObjectURL(mediaSource);
+
+  const appendBuffer = (sb, buf) => new Promise((resolve, reject) => {
+    sb.addEventListener("updateend", resolve, { once: true });
+    sb.addEventListener("error", reject, { once: true });
+    sb.appendBuffer(buf);
+  });
+
+  mediaSource.addEventListener("sourceopen", async () => {
+    const sb = mediaSource.addSourceBuffer(SEGMENT_MIME);
+    const appended = new Set();
+    let initDone = false;
+
+    while (!stopped) {
+      try {
+        const resp = await fetch(streamUrl + `?t=${Date.now()}`, { cache: "no-store" });
+        if (resp.ok) {
+          const lines = (await resp.text()).split("\n").map(l => l.trim());
+          const map = lines.find(l => l.startsWith("#EXT-X-MAP:"));
+          if (map && !initDone) {
+            const uri = /URI="([^"]+)"/.exec(map)[1];
+            await appendBuffer(sb, await (await fetch(base + uri)).arrayBuffer());
+            initDone = true;
+            videoEl.style.display = "block";
+          }
+          for (const uri of lines.filter(l => l && !l.startsWith("#"))) {
+            if (!initDone || appended.has(uri) || stopped) continue;
+            const seg = await fetch(base + uri);
+            if (!seg.ok) break;  // assembled and cleaned up meanwhile
+            await appendBuffer(sb, await seg.arrayBuffer());
+            appended.add(uri);
+          }
+          if (lines.includes("#EXT-X-ENDLIST")) {
+            if (mediaSource.readyState === "open") mediaSource.endOfStream();
+            return;
+          }
+        }
+      } catch (err) {
+        console.warn("Live stream update failed:", err);
+      }
+      await new Promise(r => setTimeout(r, 2000));
+    }
+  });
+  return { stop };
+}
+
 // ======================================================
 // 🔹 Upload and Process Video (with Frame Progress)
 // ======================================================
@@ -99,13 +168,21 @@ document.getElementById('uploadBtn').onclick = async () => {
     return;
   }
 
+  // Options and background go first so the server can start processing
+  // while the main video is still uploading
   const formData = new FormData();
-  formData.append("file", videoInput.files[0]);
   formData.append("mode", modeSelect.value);
   formData.append("color", colorPicker.value);
   formData.append("blur_strength", blurRange.value);
+  const renderMode = document.getElementById('renderMode').value;
+  formData.append("preview", renderMode !== "full");
+  formData.append("full_render", renderMode !== "preview");
+  formData.append("roi", document.getElementById("roiToggle").checked);
+  formData.append("export", document.getElementById("exportFormat").value);
+  formData.append("model", document.getElementById("modelSelect").value);
   const bgFile = bgFileInput.files[0];
   if (bgFile) formData.append("bg_file", bgFile);
+  formData.append("file", videoInput.files[0]);
 
   const statusMsg = document.getElementById('statusMsg');
   const processedVideo = document.getElementById('processedVideo');
@@ -134,6 +211,10 @@ document.getElementById('uploadBtn').onclick = async () => {
 
     const progressUrl = `/api/video/progress/${data.progress_id}`;
     const outputUrl = data.output_url;
+    const previewUrl = data.preview_url;
+    const streamUrl = data.stream_url;
+    let previewShown = false;
+    let liveStream = null;
     let finished = false;
 
     // ======================================================
@@ -159,12 +240,33 @@ document.getElementById('uploadBtn').onclick = async () => {
         if ((framePct >= 100 && stage === "done") || stage === "failed") {
           finished = true;
         }
+
+        // ⚡ Show the preview as soon as it exists (full render keeps going)
+        if (previewUrl && !previewShown && stage !== "preview" && stage !== "starting") {
+          const headPreview = await fetch(previewUrl, { method: "HEAD", cache: "no-store" });
+          if (headPreview.ok) {
+            previewShown = true;
+            processedVideo.src = previewUrl + "?t=" + Date.now();
+            processedVideo.load();
+            processedVideo.style.display = "block";
+            statusMsg.textContent = previewUrl === outputUrl
+              ? "⚡ Preview ready."
+              : "⚡ Preview ready — full render in progress...";
+          }
+        }
+
+        // 📺 Without a preview, watch the full render while it is encoded
+        if (streamUrl && !previewUrl && !liveStream && stage === "processing" && frameIdx > 0) {
+          liveStream = playLiveStream(streamUrl, processedVideo);
+          statusMsg.textContent = "📺 Playing while processing...";
+        }
       } catch (err) {
         console.warn("Progress fetch failed:", err);
       }
 
       await new Promise(r => setTimeout(r, 1000)); // wait 1 second
     }
+    if (liveStream) liveStream.stop();
 
     // ======================================================
     // ✅ Wait until file is ready and then display video
@@ -189,9 +291,12 @@ document.getElementById('uploadBtn').onclick = async () => {
     }
 
    if (fileReady) {
-        processedVideo.src = outputUrl + "?t=" + Date.now();
-        processedVideo.load();
-        processedVideo.style.display = "block";
+        // PNG sequence archives can only be downloaded
+        if (!outputUrl.endsWith(".zip")) {
+          processedVideo.src = outputUrl + "?t=" + Date.now();
+          processedVideo.load();
+          processedVideo.style.display = "block";
+        }
 
         // Show both buttons
         const viewLink = document.getElementById('viewLink');
@@ -8,11 +8,23 @@ document.addEventListener("DOMContentLoaded", () => {
   const bgLabel = document.getElementById("bg_label");
   const bgPreview = document.getElementById("bg_preview");
   const bgFile = document.getElementById("bg_file");
+  const roiToggle = document.getElementById("roiToggle");
+  const clientComposite = document.getElementById("clientComposite");
 
   let streaming = false;
-  let intervalId = null;
   let sessionId = 0; // 🆕 Used to ignore late frames
 
+  // Capture settings negotiated with the server (updated from each result's hint)
+  let frameInterval = 500; // ms between frame starts
+  let captureWidth = 800;
+  let jpegQuality = 0.8;
+  let lastRoundTrip = 0;
+
+  // Results come back as raw image bytes; WebP when the browser can show it
+  const resultFormat = document.createElement("canvas")
+    .toDataURL("image/webp").startsWith("data:image/webp") ? "webp" : "jpeg";
+  let resultUrl = null;
+
   // 🧠 Mode change: show/hide background + color picker
   modeSelect.addEventListener("change", () => {
     const mode = modeSelect.value;
@@ -57,7 +69,7 @@ document.addEventListener("DOMContentLoaded", () => {
         startBtn.textContent = "⏹ Stop Webcam";
         startBtn.classList.remove("btn-start");
         startBtn.classList.add("btn-stop");
-        intervalId = setInterval(() => processFrame(sessionId), 500);
+        frameLoop(sessionId);
       } catch (err) {
         alert("Webcam access denied: " + err.message);
       }
@@ -71,9 +83,7 @@ document.addEventListener("DOMContentLoaded", () => {
       // 🧩 Invalidate session so late frames are ignored
       sessionId = 0;
 
-      // Stop interval
-      clearInterval(intervalId);
-      intervalId = null;
+      // frameLoop exits on its own once the session changes
 
       // 🎨 Reset UI
       startBtn.textContent = "🎥 Start Webcam";
@@ -89,43 +99,151 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
+  // 💻 Client-side compositing: the server only returns the matte
+  const maskCanvas = document.createElement("canvas");
+  const fgCanvas = document.createElement("canvas");
+  const compCanvas = document.createElement("canvas");
+  let bgSource = null; // <img> or <video> made from the chosen background file
+
+  bgFile.addEventListener("change", () => {
+    const file = bgFile.files[0];
+    bgSource = null;
+    if (!file) return;
+    const url = URL.createObjectURL(file);
+    if (file.type.startsWith("video/")) {
+      const vid = document.createElement("video");
+      Object.assign(vid, { src: url, muted: true, loop: true, playsInline: true });
+      vid.play();
+      bgSource = vid;
+    } else {
+      const img = new Image();
+      img.src = url;
+      bgSource = img;
+    }
+  });
+
+  // Composite the frame still in `canvas` over the background with the matte
+  async function compositeLocally(matteBlob) {
+    const matte = await createImageBitmap(matteBlob);
+    const w = canvas.width, h = canvas.height;
+
+    // Matte luminance → alpha, at matte resolution (small)
+    maskCanvas.width = matte.width;
+    maskCanvas.height = matte.height;
+    const mctx = maskCanvas.getContext("2d", { willReadFrequently: true });
+    mctx.drawImage(matte, 0, 0);
+    const px = mctx.getImageData(0, 0, matte.width, matte.height);
+    for (let i = 0; i < px.data.length; i += 4) px.data[i + 3] = px.data[i];
+    mctx.putImageData(px, 0, 0);
+    matte.close();
+
+    // Foreground = frame masked by the (upsampled) matte
+    fgCanvas.width = w;
+    fgCanvas.height = h;
+    const fctx = fgCanvas.getContext("2d");
+    fctx.drawImage(canvas, 0, 0);
+    fctx.globalCompositeOperation = "destination-in";
+    fctx.drawImage(maskCanvas, 0, 0, w, h);
+    fctx.globalCompositeOperation = "source-over";
+
+    compCanvas.width = w;
+    compCanvas.height = h;
+    const cctx = compCanvas.getContext("2d");
+    const mode = modeSelect.value;
+    if (mode === "custom" && bgSource) {
+      cctx.drawImage(bgSource, 0, 0, w, h);
+    } else if (mode === "blur") {
+      const strength = Number(document.getElementById("blurRange")?.value || 25);
+      cctx.filter = `blur(${Math.max(1, strength / 4)}px)`;
+      cctx.drawImage(canvas, 0, 0);
+      cctx.filter = "none";
+    } else if (mode !== "transparent") {
+      cctx.fillStyle = colorPicker.value;
+      cctx.fillRect(0, 0, w, h);
+    }
+    cctx.drawImage(fgCanvas, 0, 0);
+
+    const type = mode === "transparent" ? "image/png" : "image/jpeg";
+    return new Promise((resolve) => compCanvas.toBlob(resolve, type, 0.9));
+  }
+
+  // 🔁 One frame in flight at a time: the next frame is captured only after
+  // the previous response, so latency stays bounded when the server is slow.
+  async function frameLoop(currentSession) {
+    while (streaming && currentSession === sessionId) {
+      const started = performance.now();
+      const retryAfter = await processFrame(currentSession);
+      const wait = retryAfter
+        ? retryAfter * 1000
+        : frameInterval - (performance.now() - started);
+      await new Promise((r) => setTimeout(r, Math.max(0, wait)));
+    }
+  }
+
   // 🧠 Frame processing (with session check)
+  // Returns the server's Retry-After (seconds) when it is overloaded.
   async function processFrame(currentSession) {
-    if (!streaming || video.readyState !== 4) return;
+    if (!streaming || video.readyState !== 4) return 0;
 
     const ctx = canvas.getContext("2d");
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
+    const scale = Math.min(1, captureWidth / video.videoWidth);
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
     const blob = await new Promise((resolve) =>
-      canvas.toBlob(resolve, "image/jpeg", 0.9)
+      canvas.toBlob(resolve, "image/jpeg", jpegQuality)
     );
-    if (!blob || blob.size === 0) return;
+    if (!blob || blob.size === 0) return 0;
 
     const formData = new FormData();
     formData.append("mode", modeSelect.value);
     formData.append("color", colorPicker.value);
     formData.append("file", blob, "frame.jpg");
+    formData.append("roi", roiToggle ? roiToggle.checked : false);
+    formData.append("session", currentSession);
+    formData.append("client_ms", lastRoundTrip.toFixed(1));
+    formData.append("binary", true);
+    const matteOnly = clientComposite ? clientComposite.checked : false;
+    formData.append("matte_only", matteOnly);
+    formData.append("format", matteOnly ? "png" : resultFormat);
 
-    if (modeSelect.value === "custom" && bgFile.files.length > 0) {
+    if (!matteOnly && modeSelect.value === "custom" && bgFile.files.length > 0) {
       formData.append("bg_file", bgFile.files[0]);
     }
 
+    const sent = performance.now();
     try {
       const res = await fetch("/api/video/process_frame", {
         method: "POST",
         body: formData,
       });
-      const data = await res.json();
+      if (res.status === 503) {
+        return Number(res.headers.get("Retry-After")) || 1;
+      }
+      if (res.status !== 200) return 0; // 204: superseded by a newer frame
+      let image = await res.blob();
 
       // 🧩 Ignore late responses (from previous session)
-      if (!streaming || currentSession !== sessionId) return;
+      if (!streaming || currentSession !== sessionId) return 0;
+      if (matteOnly) image = await compositeLocally(image);
 
-      if (data.result) output.src = data.result;
+      const previousUrl = resultUrl;
+      resultUrl = URL.createObjectURL(image);
+      output.src = resultUrl;
+      if (previousUrl) output.addEventListener("load", () => URL.revokeObjectURL(previousUrl), { once: true });
+
+      const hint = JSON.parse(res.headers.get("X-Frame-Hint") || "null");
+      if (hint) {
+        lastRoundTrip = performance.now() - sent;
+        captureWidth = hint.width;
+        jpegQuality = hint.quality;
+        frameInterval = hint.interval;
+      }
     } catch (err) {
       console.error("Frame error:", err);
     }
+    return 0;
   }
 
   if (!modeSelect) {
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The app is run from the project root (no package install): import it from there
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from inference.blur import BlurCache, blur_kernel, fast_blur
+
+
+def scene(seed=0, h=240, w=320):
+    """Gradient with solid shapes and some noise: edges of every orientation."""
+    rng = np.random.default_rng(seed)
+    img = np.zeros((h, w, 3), np.uint8)
+    img[:] = np.linspace(0, 255, w, dtype=np.uint8)[None, :, None]
+    cv2.circle(img, (w // 2, h // 2), h // 4, (255, 40, 90), -1)
+    cv2.rectangle(img, (20, 20), (90, h - 40), (10, 200, 30), -1)
+    return cv2.add(img, rng.integers(0, 30, img.shape, dtype=np.uint8))
+
+
+def diff(a, b):
+    return np.abs(a.astype(np.int16) - b.astype(np.int16))
+
+
+def test_blur_kernel_is_odd_and_at_least_3():
+    assert [blur_kernel(s) for s in (0, 1, 4, 35)] == [3, 3, 5, 35]
+
+
+def test_small_kernels_are_exact():
+    img = scene()
+    assert np.array_equal(fast_blur(img, 7), cv2.GaussianBlur(img, (7, 7), 0))
+
+
+@pytest.mark.parametrize("strength", [15, 35, 61, 101])
+def test_large_kernels_match_gaussian_blur(strength):
+    img = scene()
+    k = blur_kernel(strength)
+    d = diff(fast_blur(img, strength), cv2.GaussianBlur(img, (k, k), 0))
+    assert d.mean() < 1.0
+    assert d.max() <= 8
+
+
+def test_cache_reuses_blur_of_a_static_scene():
+    cache = BlurCache(refresh=2)
+    img = scene()
+    first = cache.get(img, 35)
+    assert cache.get(img.copy(), 35) is first  # same picture
+    assert cache.get(img, 35) is first
+    assert cache.get(img, 35) is not first     # refreshed after `refresh` reuses
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_redoes_blur_on_change():
+    cache = BlurCache()
+    img = scene()
+    first = cache.get(img, 35)
+    assert cache.get(img, 61) is not first             # other strength
+    assert cache.get(scene(1, w=200), 61).shape[1] == 200  # other size
+    moved = np.roll(img, 80, axis=1)
+    assert cache.get(moved, 61) is not cache.get(img, 61)
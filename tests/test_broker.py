@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+import broker
+from broker import JobBroker
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return JobBroker(tmp_path / "jobs.sqlite3")
+
+
+def test_enqueue_is_idempotent(jobs):
+    assert jobs.enqueue("video", {"a": 1}, job_id="j1") == "j1"
+    jobs.enqueue("video", {"a": 2}, job_id="j1")
+    job = jobs.get("j1")
+    assert job["payload"] == {"a": 1}
+    assert job["status"] == "queued"
+
+
+def test_lease_takes_oldest_job_of_requested_kind(jobs):
+    jobs.enqueue("image", {}, job_id="img")
+    jobs.enqueue("video", {}, job_id="v1")
+    jobs.enqueue("video", {}, job_id="v2")
+
+    job = jobs.lease("w1", ["video"])
+    assert job["id"] == "v1"
+    assert job["status"] == "leased" and job["lease_owner"] == "w1" and job["attempts"] == 1
+    assert jobs.lease("w1", ["video"])["id"] == "v2"
+    assert jobs.lease("w1", ["video"]) is None
+
+
+def test_complete_only_by_lease_owner(jobs):
+    jobs.enqueue("video", {}, job_id="j1")
+    jobs.lease("w1", ["video"])
+    assert not jobs.complete("j1", "w2")
+    assert jobs.complete("j1", "w1", {"ok": True})
+    job = jobs.get("j1")
+    assert job["status"] == "done" and job["result"] == {"ok": True}
+
+
+def test_failed_attempt_is_retried_after_backoff(jobs, monkeypatch):
+    monkeypatch.setattr(broker, "RETRY_BACKOFF_SECONDS", 0)
+    jobs.enqueue("video", {}, job_id="j1", max_attempts=2)
+    jobs.lease("w1", ["video"])
+    assert jobs.fail("j1", "w1", "boom")
+    assert jobs.get("j1")["status"] == "queued"
+
+    assert jobs.lease("w1", ["video"])["attempts"] == 2
+    jobs.fail("j1", "w1", "boom again")
+    job = jobs.get("j1")
+    assert job["status"] == "failed" and job["error"] == "boom again"
+
+
+def test_backoff_delays_the_retry(jobs):
+    jobs.enqueue("video", {}, job_id="j1")
+    jobs.lease("w1", ["video"])
+    jobs.fail("j1", "w1", "boom")
+    assert jobs.lease("w1", ["video"]) is None
+
+
+def test_permanent_failure_is_not_retried(jobs):
+    jobs.enqueue("image", {}, job_id="j1")
+    jobs.lease("w1", ["image"])
+    jobs.fail("j1", "w1", "bad input", retry=False)
+    assert jobs.get("j1")["status"] == "failed"
+
+
+def test_expired_lease_is_taken_over_and_old_owner_loses_it(jobs):
+    jobs.enqueue("video", {}, job_id="j1")
+    jobs.lease("w1", ["video"], lease_seconds=0.01)
+    time.sleep(0.05)
+
+    job = jobs.lease("w2", ["video"])
+    assert job["id"] == "j1" and job["attempts"] == 2
+    assert not jobs.heartbeat("j1", "w1")
+    assert not jobs.complete("j1", "w1")
+    assert jobs.heartbeat("j1", "w2")
+
+
+def test_expired_lease_out_of_attempts_fails(jobs):
+    jobs.enqueue("video", {}, job_id="j1", max_attempts=1)
+    jobs.lease("w1", ["video"], lease_seconds=0.01)
+    time.sleep(0.05)
+
+    assert jobs.lease("w2", ["video"]) is None
+    job = jobs.get("j1")
+    assert job["status"] == "failed" and "lease expired" in job["error"]
+
+
+def test_stats_counts_jobs_and_live_workers(jobs):
+    jobs.enqueue("video", {}, job_id="j1")
+    jobs.enqueue("image", {}, job_id="j2")
+    jobs.lease("w1", ["video"])
+    jobs.worker_seen("w1", ["video"], "j1")
+
+    stats = jobs.stats()
+    assert stats["jobs"] == {"video_leased": 1, "image_queued": 1}
+    assert [w["id"] for w in stats["workers"]] == ["w1"]
+    assert stats["workers"][0]["current_job"] == "j1"
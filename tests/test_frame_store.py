@@ -0,0 +1,154 @@
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("filelock")
+pytest.importorskip("cv2")
+
+from inference import frame_store
+from inference.frame_store import BackgroundFrameCache, fingerprint
+
+
+class FakeReader:
+    """Stands in for FFmpegFrameReader: `frames` frames of the requested size."""
+
+    frames = 3
+    opened = 0
+    error = None
+
+    def __init__(self, path, vf=None):
+        type(self).opened += 1
+        if self.error:
+            raise RuntimeError(self.error)
+        self.width, self.height = (int(v) for v in vf.split("=")[1].split(":"))
+        self.fps = 25.0
+        self.frame_count = self.frames
+
+    def __iter__(self):
+        for i in range(self.frames):
+            yield np.full((self.height, self.width, 3), i, np.uint8)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    monkeypatch.setattr(frame_store, "FFmpegFrameReader", FakeReader)
+    monkeypatch.setattr(FakeReader, "opened", 0)
+    return FakeReader
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "bg.mp4"
+    path.write_bytes(b"video")
+    return path
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_fingerprint_follows_content_not_name(tmp_path):
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    a.write_bytes(b"same" * 50000)
+    b.write_bytes(b"same" * 50000)
+    c.write_bytes(b"diff" * 50000)
+    assert fingerprint(a) == fingerprint(b) != fingerprint(c)
+
+
+def test_fingerprint_is_rehashed_only_when_the_file_changes(tmp_path, monkeypatch, video):
+    cache = BackgroundFrameCache(tmp_path / "cache")
+    hashed = []
+    monkeypatch.setattr(frame_store, "fingerprint", lambda path: hashed.append(path) or f"fp{len(hashed)}")
+
+    assert cache._fingerprint(video) == cache._fingerprint(video) == "fp1"
+    video.write_bytes(b"other video")
+    assert cache._fingerprint(video) == "fp2"
+    assert len(hashed) == 2
+
+
+def test_frames_are_decoded_once_and_loop(tmp_path, reader, video):
+    cache = BackgroundFrameCache(tmp_path / "cache")
+
+    store = cache.open(video, 4, 2)
+    assert len(store) == 3 and store.frame(0).shape == (2, 4, 3)
+    assert store.frame(4)[0, 0, 0] == 1  # index past the end loops
+
+    assert cache.open(video, 4, 2) is store
+    assert reader.opened == 1 and cache.hits == 1
+    assert BackgroundFrameCache(tmp_path / "cache").open(video, 4, 2).count == 3  # another process
+    assert reader.opened == 1
+
+
+def test_too_large_video_is_not_retried(tmp_path, reader, video):
+    cache = BackgroundFrameCache(tmp_path / "cache", max_store_mb=0)
+
+    assert cache.open(video, 4, 2) is None
+    assert cache.open(video, 4, 2) is None
+    assert reader.opened == 1
+    assert len(list((tmp_path / "cache").glob("*.skip"))) == 1
+    assert BackgroundFrameCache(tmp_path / "cache").open(video, 4, 2) is None  # marker is shared
+    assert reader.opened == 1
+
+
+def test_undecodable_video_is_retried_after_marker_expires(tmp_path, reader, video, monkeypatch):
+    monkeypatch.setattr(FakeReader, "error", "invalid data")
+    cache = BackgroundFrameCache(tmp_path / "cache", max_age_hours=1)
+    assert cache.open(video, 4, 2) is None
+    assert cache.open(video, 4, 2) is None
+    assert reader.opened == 1
+
+    for marker in (tmp_path / "cache").glob("*.skip"):
+        age(marker, 7200)
+    cache.evict()
+    monkeypatch.setattr(FakeReader, "error", None)
+    assert cache.open(video, 4, 2) is not None
+    assert reader.opened == 2
+
+
+def test_unused_stores_are_evicted_but_used_ones_kept(tmp_path, reader, video, monkeypatch):
+    monkeypatch.setattr(frame_store, "TOUCH_INTERVAL", 0)
+    cache = BackgroundFrameCache(tmp_path / "cache", max_age_hours=1)
+    cache.open(video, 4, 2)
+    cache.open(video, 8, 4)
+    used, unused = (tmp_path / "cache").glob("*_4x2.json"), (tmp_path / "cache").glob("*_8x4.json")
+    used, unused = next(used), next(unused)
+    age(used, 7200)
+    age(unused, 7200)
+
+    cache.open(video, 4, 2)  # hit: refreshes the store's last use
+    cache.evict()
+
+    assert used.exists() and used.with_suffix(".raw").exists()
+    assert not unused.exists() and not unused.with_suffix(".raw").exists()
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path, reader, video):
+    cache = BackgroundFrameCache(tmp_path / "cache")
+    cache.open(video, 4, 2)
+    old = next((tmp_path / "cache").glob("*.json"))
+    age(old, 60)
+    cache.max_bytes = 3 * 8 * 4 * 3  # room for the 8x4 store only
+
+    cache.open(video, 8, 4)
+
+    assert not old.exists()
+    assert cache.stats()["stores"] == 1
+
+
+def test_background_build(tmp_path, reader, video):
+    cache = BackgroundFrameCache(tmp_path / "cache")
+
+    assert cache.open(video, 4, 2, wait=False) is None
+    for _ in range(100):
+        store = cache.open(video, 4, 2, wait=False)
+        if store is not None:
+            break
+        time.sleep(0.01)
+    assert store is not None and len(store) == 3
+    assert reader.opened == 1
@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+
+@pytest.fixture
+def gallery(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the module creates its folders on import
+    gallery_api = importlib.import_module("routers.gallery_api")
+    recorded, snapshots = tmp_path / "recorded", tmp_path / "snapshots"
+    recorded.mkdir()
+    snapshots.mkdir()
+    monkeypatch.setattr(gallery_api, "RECORDED_DIR", recorded)
+    monkeypatch.setattr(gallery_api, "SNAPSHOT_DIR", snapshots)
+    monkeypatch.setattr(gallery_api, "THUMB_DIR", snapshots / "thumbs")
+    monkeypatch.setattr(gallery_api, "SAVE_DELAY", 0.01)
+    return gallery_api
+
+
+def write(path, age):
+    path.write_bytes(b"x")
+    then = time.time() - age
+    os.utime(path, (then, then))
+    return path
+
+
+def flush(index):
+    timer = index.save_timer
+    if timer is not None:
+        timer.join()
+
+
+def test_rebuild_keeps_recorded_metadata(gallery, tmp_path):
+    video = write(gallery.RECORDED_DIR / "a.webm", age=10)
+    index = gallery.GalleryIndex(tmp_path / "index.json")
+    index.add(video, {"duration": 3.5, "width": 640, "height": 480})
+
+    flush(index)
+    index.rebuild()
+
+    assert index.items["a.webm"]["duration"] == 3.5
+    assert index.items["a.webm"]["width"] == 640
+
+
+def test_pages_are_newest_first_with_cursor(gallery, tmp_path):
+    for i in range(3):
+        write(gallery.RECORDED_DIR / f"v{i}.webm", age=10 - i)
+    index = gallery.GalleryIndex(tmp_path / "index.json")
+
+    items, cursor = index.page(limit=2)
+    assert [i["name"] for i in items] == ["v2.webm", "v1.webm"]
+    items, cursor = index.page(cursor, limit=2)
+    assert [i["name"] for i in items] == ["v0.webm"]
+    assert cursor is None
+
+
+def test_kind_filter_has_no_cursor_without_later_match(gallery, tmp_path):
+    write(gallery.RECORDED_DIR / "v.webm", age=10)
+    write(gallery.SNAPSHOT_DIR / "s1.jpg", age=20)
+    write(gallery.SNAPSHOT_DIR / "s2.jpg", age=30)
+    index = gallery.GalleryIndex(tmp_path / "index.json")
+
+    items, cursor = index.page(limit=1, kind="video")
+    assert [i["name"] for i in items] == ["v.webm"]
+    assert cursor is None
+
+    items, cursor = index.page(limit=1, kind="snapshot")
+    assert [i["name"] for i in items] == ["s1.jpg"]
+    assert cursor is not None
+
+
+def test_changes_are_saved_in_the_background_and_reloaded(gallery, tmp_path):
+    path = tmp_path / "index.json"
+    index = gallery.GalleryIndex(path)
+    video = write(gallery.RECORDED_DIR / "a.webm", age=10)
+    index.add(video, {"duration": 2.0})
+    flush(index)
+
+    saved = json.loads(path.read_text())
+    assert [i["name"] for i in saved["items"]] == ["a.webm"]
+
+    reloaded = gallery.GalleryIndex(path)
+    assert reloaded.version == index.version  # loaded, not rebuilt
+    assert reloaded.items["a.webm"]["duration"] == 2.0
+
+
+def test_load_rebuilds_when_folders_changed(gallery, tmp_path):
+    path = tmp_path / "index.json"
+    gallery.GalleryIndex(path)
+    write(gallery.SNAPSHOT_DIR / "new.jpg", age=0)
+    later = time.time() + 5  # make sure the folder mtime differs from the saved one
+    os.utime(gallery.SNAPSHOT_DIR, (later, later))
+
+    assert "new.jpg" in gallery.GalleryIndex(path).items
+
+
+def test_remove(gallery, tmp_path):
+    write(gallery.SNAPSHOT_DIR / "s.jpg", age=10)
+    index = gallery.GalleryIndex(tmp_path / "index.json")
+    version = index.version
+
+    assert index.remove("s.jpg")
+    assert not index.remove("s.jpg")
+    flush(index)
+    assert index.page()[0] == [] and index.version == version + 1
+
+
+def test_thumbnail_urls_are_versioned_by_mtime(gallery, tmp_path):
+    snapshot = write(gallery.SNAPSHOT_DIR / "s.jpg", age=10)
+    index = gallery.GalleryIndex(tmp_path / "index.json")
+    assert index.items["s.jpg"]["thumbnail"] == f"/api/gallery/thumb/s.jpg?v={snapshot.stat().st_mtime_ns}"
+
+
+def test_only_versioned_thumbnails_are_cached_as_immutable(gallery):
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    gallery.THUMB_DIR.mkdir()
+    cv2.imwrite(str(gallery.SNAPSHOT_DIR / "s.jpg"), np.zeros((8, 8, 3), np.uint8))
+
+    versioned = asyncio.run(gallery.gallery_thumbnail("s.jpg", v="123"))
+    plain = asyncio.run(gallery.gallery_thumbnail("s.jpg"))
+    assert "immutable" in versioned.headers["cache-control"]
+    assert plain.headers["cache-control"] == "no-cache"  # revalidated with the ETag FileResponse sends
@@ -0,0 +1,65 @@
+import threading
+
+from inference.governor import BATCH, INTERACTIVE, ComputeGovernor
+
+
+def governor(slots):
+    return ComputeGovernor(slots=slots, torch_threads=1, cpus=slots)
+
+
+def hold(gov, priority):
+    """Take a slot on a thread; returns (started, release) events."""
+    started, release = threading.Event(), threading.Event()
+
+    def run():
+        with gov.slot(priority):
+            started.set()
+            release.wait(5)
+
+    threading.Thread(target=run, daemon=True).start()
+    return started, release
+
+
+def test_single_slot_serves_interactive_ahead_of_a_running_batch_job():
+    gov = governor(1)
+    assert gov.batch_slots == 0
+
+    batch_started, batch_release = hold(gov, BATCH)  # batch borrows the idle slot
+    assert batch_started.wait(5)
+    started, release = hold(gov, INTERACTIVE)
+    assert started.wait(5)  # does not wait for the batch frame
+
+    next_batch, next_release = hold(gov, BATCH)
+    batch_release.set()
+    assert not next_batch.wait(0.1)  # the job's next frame waits for the interactive work
+    release.set()
+    assert next_batch.wait(5)
+    next_release.set()
+
+
+def test_batch_jobs_leave_one_slot_free():
+    gov = governor(2)
+    first, release = hold(gov, BATCH)
+    assert first.wait(5)
+    second, second_release = hold(gov, BATCH)
+    assert not second.wait(0.1)
+
+    interactive, interactive_release = hold(gov, INTERACTIVE)
+    assert interactive.wait(5)
+    for event in (release, second_release, interactive_release):
+        event.set()
+    assert second.wait(5)
+
+
+def test_interactive_work_uses_every_slot():
+    gov = governor(2)
+    held = [hold(gov, INTERACTIVE) for _ in range(2)]
+    assert all(started.wait(5) for started, _ in held)
+    third, third_release = hold(gov, INTERACTIVE)
+    assert not third.wait(0.1)
+
+    held[0][1].set()
+    assert third.wait(5)
+    for _, release in held[1:] + [(third, third_release)]:
+        release.set()
+    assert gov.stats()["interactive"]["served"] == 3
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("torch")
+if not (Path(__file__).resolve().parent.parent / "thirdparty" / "MODNet" / "src").is_dir():
+    pytest.skip("needs the MODNet sources and weights", allow_module_level=True)
+
+import inference.modnet_infer as modnet_infer
+from inference.blur import fast_blur
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (18, 24, 3), dtype=np.uint8)
+    return cv2.resize(small, (960, 720), interpolation=cv2.INTER_NEAREST)  # hard edges everywhere
+
+
+@pytest.fixture(autouse=True)
+def background_only(monkeypatch):
+    # An empty matte: the output is the blurred background alone
+    monkeypatch.setattr(modnet_infer, "predict_matte", lambda frame, model=None: np.zeros((512, 512), np.float32))
+
+
+@pytest.mark.parametrize("blur_strength", [7, 35, 101])
+def test_banded_blur_matches_a_single_pass(frame, blur_strength):
+    single = modnet_infer.apply_modnet_hires(frame, frame, mode="blur_bg", blur_strength=blur_strength,
+                                             tile_rows=frame.shape[0])
+    banded = modnet_infer.apply_modnet_hires(frame, frame, mode="blur_bg", blur_strength=blur_strength,
+                                             tile_rows=100)
+
+    assert np.abs(banded.astype(int) - single.astype(int)).max() <= 2
+    assert np.abs(banded.astype(int) - fast_blur(frame, blur_strength).astype(int)).max() <= 2
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psutil")
+
+from inference.memory import (
+    FIXED_OVERHEAD, MB, MemoryBudget, MemoryBudgetExceeded, MemoryUsage, fit_video_frame, video_frame_bytes,
+)
+
+
+def test_work_larger_than_the_budget_is_refused():
+    budget = MemoryBudget(budget_mb=10)
+    assert not budget.fits(11 * MB)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.acquire(11 * MB)
+    assert budget.stats()["rejected"] == 1 and budget.reserved == 0
+
+
+def test_reserve_records_usage_and_releases():
+    budget = MemoryBudget(budget_mb=10)
+    usage = MemoryUsage()
+    with budget.reserve(4 * MB, usage):
+        with budget.reserve(2 * MB, usage):
+            assert budget.reserved == 6 * MB
+    assert budget.reserved == 0
+    assert usage.reserved_peak == 6 * MB and usage.holding == 0
+    assert usage.process_rss_peak > 0
+    assert usage.as_dict()["reserved_peak_mb"] == 6.0
+
+
+def test_acquire_times_out_while_memory_is_held():
+    budget = MemoryBudget(budget_mb=10)
+    budget.acquire(8 * MB)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.acquire(4 * MB, timeout=0.05)
+    assert budget.stats()["timed_out"] == 1
+    budget.release(8 * MB)
+    assert budget.reserved == 0
+
+
+def test_waiter_gets_memory_once_released():
+    budget = MemoryBudget(budget_mb=10)
+    usage = MemoryUsage()
+    budget.acquire(8 * MB)
+    got = threading.Event()
+
+    def wait_for_memory():
+        with budget.reserve(4 * MB, usage):
+            got.set()
+
+    waiter = threading.Thread(target=wait_for_memory)
+    waiter.start()
+    time.sleep(0.05)
+    assert not got.is_set() and budget.stats()["waiting"] == 1
+
+    budget.release(8 * MB)
+    waiter.join(1)
+    assert got.is_set()
+    assert usage.wait_seconds >= 0.04
+
+
+def test_video_frames_that_fit_keep_their_size():
+    assert fit_video_frame(1920, 1080, video_frame_bytes(1920, 1080)) == (1920, 1080)
+
+
+def test_oversized_video_frames_are_scaled_down_to_fit():
+    budget = video_frame_bytes(1280, 720)
+    w, h = fit_video_frame(3840, 2160, budget)
+    assert video_frame_bytes(w, h) <= budget
+    assert w % 2 == 0 and h % 2 == 0
+    assert 1200 <= w <= 1280 and abs(w / h - 16 / 9) < 0.01
+
+
+def test_video_frames_that_cannot_fit_even_downscaled():
+    assert fit_video_frame(1920, 1080, FIXED_OVERHEAD) is None
+    assert fit_video_frame(1920, 1080, video_frame_bytes(32, 18)) is None
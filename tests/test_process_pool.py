@@ -0,0 +1,110 @@
+import queue
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from inference import process_pool
+from inference.process_pool import ALIGN, MB, FrameRing, InferencePool, _Process
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(2, 4096)
+    yield ring
+    ring.close(unlink=True)
+
+
+def test_layout_aligns_inputs_and_result():
+    frame = np.zeros((4, 5, 3), np.uint8)      # 60 bytes
+    matte = np.zeros((4, 5), np.float32)       # 80 bytes
+    specs, end = FrameRing.layout({"frame": frame, "matte": matte})
+    assert specs["frame"] == (0, (4, 5, 3), "|u1")
+    assert specs["matte"] == (ALIGN, (4, 5), "<f4")
+    assert end == 3 * ALIGN
+    assert FrameRing.layout({}) == ({}, 0)
+
+
+def test_slots_do_not_overlap(ring):
+    ring.view(0, 0, (4096,), "|u1")[...] = 1
+    ring.view(1, 0, (4096,), "|u1")[...] = 2
+    assert (ring.view(0, 0, (4096,), "|u1") == 1).all()
+    assert (ring.view(1, 0, (4096,), "|u1") == 2).all()
+
+
+def test_attached_ring_sees_the_same_memory(ring):
+    data = np.arange(12, dtype=np.float32).reshape(3, 4)
+    specs, _ = FrameRing.layout({"data": data})
+    ring.view(1, *specs["data"])[...] = data
+
+    other = FrameRing(2, 4096, name=ring.name)
+    try:
+        assert np.array_equal(other.view(1, *specs["data"]), data)
+    finally:
+        other.close()
+
+
+def test_each_process_starts_with_all_slots_free():
+    p = _Process(0, 3, MB)
+    try:
+        assert p.free.qsize() == 3
+        assert sorted(p.free.get_nowait() for _ in range(3)) == [0, 1, 2]
+    finally:
+        p.ring.close(unlink=True)
+
+
+def test_streams_stick_to_a_process_and_spread_out():
+    pool = InferencePool(slots=1, slot_mb=1)
+    pool.procs = [_Process(0, 1, MB), _Process(1, 1, MB)]
+    try:
+        assert pool._route("a").index == 0
+        assert pool._route("b").index == 1
+        assert pool._route("a").index == 0
+        assert [p.streams for p in pool.procs] == [1, 1]
+        assert pool._route(None) in pool.procs
+    finally:
+        for p in pool.procs:
+            p.ring.close(unlink=True)
+
+
+def test_oldest_unclosed_streams_are_dropped(monkeypatch):
+    monkeypatch.setattr(process_pool, "MAX_STREAMS", 2)
+    pool = InferencePool(slots=1, slot_mb=1)
+    pool.procs = [_Process(0, 1, MB)]
+    p = pool.procs[0]
+    p.tasks = queue.Queue()
+    try:
+        for stream in ("s0", "s1", "s2"):
+            pool._route(stream)
+        assert list(pool.routes) == ["s1", "s2"]
+        assert p.streams == 2
+        assert p.tasks.get_nowait()[2:4] == ("close", "s0")
+    finally:
+        p.ring.close(unlink=True)
+
+
+def test_pool_that_is_not_running_is_never_used():
+    pool = InferencePool(slots=1, slot_mb=1)
+    assert not pool.fits(np.zeros(10, np.uint8))
+
+
+def test_fits_checks_only_the_process_a_call_would_use():
+    pool = InferencePool(slots=1, slot_mb=1)
+    pool.procs = [_Process(0, 1, MB), _Process(1, 1, MB)]
+    pool.running = True
+    frame = np.zeros(10, np.uint8)
+    try:
+        pool.procs[1].ready = True
+        assert pool._route("new").index == 1     # new streams go to ready processes
+        assert pool._route(None).index == 1
+        pool.routes["old"] = 0                   # routed before process 0 restarted
+        assert not pool.fits(frame, stream="old")
+        assert pool.fits(frame, stream="new")
+        assert pool.fits(frame)
+        assert not pool.fits(frame, out_bytes=MB)  # too large for a slot
+
+        pool.procs[1].ready = False
+        assert not pool.fits(frame)
+    finally:
+        for p in pool.procs:
+            p.ring.close(unlink=True)
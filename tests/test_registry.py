@@ -0,0 +1,92 @@
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+pytest.importorskip("filelock")
+
+from inference import registry as registry_module
+from inference.registry import ModelRegistry
+
+SIDE = 128  # one model: 128×128 + 128 float32 ≈ 65 KB
+
+
+def tiny_model():
+    return torch.nn.Linear(SIDE, SIDE)
+
+
+def write_checkpoint(path, value):
+    model = tiny_model()
+    with torch.no_grad():
+        model.weight.fill_(value)
+    torch.save(model.state_dict(), path)
+    return path
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    return {name: str(write_checkpoint(tmp_path / f"{name}.ckpt", i))
+            for i, name in enumerate(("a", "b", "c"))}
+
+
+def make_registry(checkpoints, models_in_budget=2):
+    budget_mb = models_in_budget * (SIDE * SIDE + SIDE) * 4 / (1024 * 1024) + 0.001
+    return ModelRegistry(checkpoints, device=torch.device("cpu"), budget_mb=budget_mb, factory=tiny_model)
+
+
+def test_models_load_once_on_demand(checkpoints):
+    registry = make_registry(checkpoints)
+    model = registry.get("b")
+    assert model.weight[0, 0].item() == 1
+    assert registry.get("b") is model
+    assert registry.loads == 1
+
+
+def test_least_recently_used_model_is_evicted_over_budget(checkpoints):
+    registry = make_registry(checkpoints)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert list(registry.models) == ["a", "c"]
+    assert registry.evictions == 1
+
+
+def test_resolve(checkpoints):
+    registry = make_registry(checkpoints)
+    assert registry.resolve("", "a") == "a"
+    assert registry.resolve("c", "a") == "c"
+    with pytest.raises(KeyError):
+        registry.resolve("nope", "a")
+
+
+def test_changed_checkpoint_is_reloaded_in_the_background(checkpoints, monkeypatch):
+    monkeypatch.setattr(registry_module, "RELOAD_CHECK_SECONDS", 0)
+    registry = make_registry(checkpoints)
+    old = registry.get("a")
+    write_checkpoint(checkpoints["a"], 7)
+    later = time.time() + 10
+    os.utime(checkpoints["a"], (later, later))
+
+    assert registry.get("a") is old  # requests keep the old model meanwhile
+    for _ in range(200):
+        model = registry.get("a")
+        if model is not old:
+            break
+        time.sleep(0.01)
+    assert model.weight[0, 0].item() == 7
+    assert registry.loads == 2
+
+
+def test_failed_reload_keeps_the_old_model(checkpoints, tmp_path):
+    registry = make_registry(checkpoints)
+    old = registry.get("a")
+    broken = tmp_path / "a.ckpt"
+    broken.write_bytes(b"not a checkpoint")
+    later = time.time() + 10
+    os.utime(broken, (later, later))
+
+    assert not registry.reload("a")
+    assert registry.get("a") is old
@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from routers.CleanFiles import RetentionManager
+
+
+def write(path, size=10, age=0):
+    path.write_bytes(b"x" * size)
+    if age:
+        then = time.time() - age
+        os.utime(path, (then, then))
+    return path
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return tmp_path.resolve() / "out"
+
+
+def test_max_files_keeps_newest(folder):
+    r = RetentionManager()
+    r.register(folder, max_files=2)
+    folder.mkdir()
+    paths = [write(folder / f"f{i}", age=100 - i) for i in range(4)]
+
+    r.run_once(full=True)
+
+    assert [p.exists() for p in paths] == [False, False, True, True]
+    assert r.deleted == 2
+
+
+def test_max_bytes_and_max_age(folder):
+    r = RetentionManager()
+    r.register(folder, max_bytes=25, max_age=3600)
+    folder.mkdir()
+    old = write(folder / "old", age=7200)
+    a = write(folder / "a", size=10, age=30)
+    b = write(folder / "b", size=10, age=20)
+    c = write(folder / "c", size=10, age=10)
+
+    r.run_once(full=True)
+
+    assert not old.exists() and not a.exists()
+    assert b.exists() and c.exists()
+
+
+def test_held_files_survive_until_released(folder):
+    r = RetentionManager()
+    r.register(folder, max_files=1)
+    folder.mkdir()
+    busy = write(folder / "busy", age=100)
+    write(folder / "new")
+
+    r.hold(busy)
+    r.run_once(full=True)
+    assert busy.exists()
+
+    r.release(busy)
+    r.enforce()
+    assert not busy.exists()
+
+
+def test_track_indexes_without_rescan(folder):
+    r = RetentionManager()
+    r.register(folder, max_files=1)
+    r.run_once(full=True)  # creates the folder, index empty
+    first = write(folder / "first", age=100)
+    r.track(first)
+    r.track(write(folder / "second"))
+
+    r.enforce()
+
+    assert not first.exists()
+    assert r.stats()["folders"][str(folder)]["files"] == 1
+
+
+def test_subfolder_counts_as_one_artefact(folder):
+    r = RetentionManager()
+    r.register(folder, max_bytes=15)
+    segments = folder / "stream"
+    segments.mkdir(parents=True)
+    write(segments / "seg0", size=10)
+    write(segments / "seg1", size=10)
+    then = time.time() - 100
+    os.utime(segments, (then, then))
+    single = write(folder / "single", size=10)
+
+    r.run_once(full=True)
+
+    assert not segments.exists()  # 20 bytes together: over the cap, and older
+    assert single.exists()
+
+
+def test_partial_outputs_are_kept_while_written(folder):
+    r = RetentionManager()
+    r.register(folder, max_files=1, max_age=3600)
+    folder.mkdir()
+    writing = write(folder / "preview_a.part.mp4", age=60)
+    done = write(folder / "output_b.mp4", age=10)
+    abandoned = write(folder / "output_c_matte.part.mp4", age=5000)
+
+    r.run_once(full=True)
+
+    assert writing.exists() and done.exists()  # over max_files, but still being written
+    assert not abandoned.exists()
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("torch")
+if not (Path(__file__).resolve().parent.parent / "thirdparty" / "MODNet" / "src").is_dir():
+    pytest.skip("needs the MODNet sources and weights", allow_module_level=True)
+
+from inference.modnet_infer_video import SubjectTracker, _roi_tensor_size
+
+SHAPE = (480, 640, 3)
+
+
+def matte(box, shape=SHAPE):
+    m = np.zeros(shape[:2], np.float32)
+    x0, y0, x1, y1 = box
+    m[y0:y1, x0:x1] = 1.0
+    return m
+
+
+def test_first_frame_is_a_full_pass():
+    assert SubjectTracker().region(SHAPE) is None
+
+
+def test_region_is_the_padded_subject_box():
+    tracker = SubjectTracker(padding=0.25)
+    tracker.update(matte((200, 100, 300, 300)), None)
+    assert tracker.box == (200, 100, 300, 300)
+    assert tracker.region(SHAPE) == (175, 50, 325, 350)
+
+
+def test_padding_is_clipped_to_the_frame():
+    tracker = SubjectTracker(padding=0.25)
+    tracker.update(matte((0, 0, 100, 100)), None)
+    assert tracker.region(SHAPE) == (0, 0, 125, 125)
+
+
+def test_large_subject_gets_a_full_pass():
+    tracker = SubjectTracker()
+    tracker.update(matte((0, 0, 600, 400)), None)
+    assert tracker.region(SHAPE) is None
+
+
+def test_full_pass_every_refresh_frames():
+    tracker = SubjectTracker(padding=0.25, refresh=2)
+    subject = matte((200, 100, 300, 300))
+    tracker.update(subject, None)
+    for _ in range(2):
+        region = tracker.region(SHAPE)
+        assert region is not None
+        tracker.update(subject, region)
+    assert tracker.region(SHAPE) is None
+
+
+def test_lost_subject_gets_a_full_pass():
+    tracker = SubjectTracker()
+    tracker.update(matte((200, 100, 300, 300)), None)
+    tracker.update(np.zeros(SHAPE[:2], np.float32), tracker.region(SHAPE))
+    assert tracker.region(SHAPE) is None
+
+
+def test_subject_at_the_crop_border_gets_a_full_pass():
+    tracker = SubjectTracker(padding=0.25)
+    tracker.update(matte((200, 100, 300, 300)), None)
+    region = tracker.region(SHAPE)                        # (175, 50, 325, 350)
+    tracker.update(matte((175, 100, 300, 300)), region)   # reaches the left edge of the crop
+    assert tracker.box is None
+
+
+def test_roi_tensor_size():
+    assert _roi_tensor_size(100, 50) == (96, 64)      # multiples of 32, at least 64
+    assert _roi_tensor_size(1024, 512) == (512, 256)  # longest side capped
+    assert _roi_tensor_size(10, 10) == (64, 64)
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("python_multipart")
+
+from fastapi import HTTPException
+
+import routers.stream_upload as stream_upload
+from routers.stream_upload import stream_multipart
+
+BOUNDARY = "testboundary"
+
+
+class FakeRequest:
+    """Just what stream_multipart uses: headers and the body in chunks."""
+
+    def __init__(self, body, chunk_size=7, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+        self.headers = {"content-type": content_type}
+        self.body, self.chunk_size = body, chunk_size
+
+    async def stream(self):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+
+def form(*parts):
+    """multipart body from (name, value) fields and (name, filename, data) files."""
+    body = b""
+    for part in parts:
+        body += f"--{BOUNDARY}\r\n".encode()
+        if len(part) == 2:
+            body += f'Content-Disposition: form-data; name="{part[0]}"\r\n\r\n'.encode() + part[1].encode()
+        else:
+            body += (f'Content-Disposition: form-data; name="{part[0]}"; filename="{part[1]}"\r\n'
+                     "Content-Type: application/octet-stream\r\n\r\n").encode() + part[2]
+        body += b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def parse(request, tmp_path, **callbacks):
+    return asyncio.run(stream_multipart(request, lambda field, filename: tmp_path / f"{field}.bin", **callbacks))
+
+
+def test_fields_and_files_across_chunk_boundaries(tmp_path):
+    data = bytes(range(256)) * 40
+    body = form(("mode", "blur"), ("file", "../clip.mp4", data), ("color", "#00ff00"))
+
+    fields, files = parse(FakeRequest(body), tmp_path)
+
+    assert fields == {"mode": "blur", "color": "#00ff00"}
+    path, filename = files["file"]
+    assert filename == "clip.mp4"  # directory parts are dropped
+    assert path.read_bytes() == data
+
+
+def test_file_data_is_written_in_blocks_off_the_event_loop(tmp_path, monkeypatch):
+    writes = []
+
+    def write_block(out, data):
+        writes.append((threading.get_ident(), len(data)))
+        out.write(data)
+
+    monkeypatch.setattr(stream_upload, "UPLOAD_FLUSH_BYTES", 1000)
+    monkeypatch.setattr(stream_upload, "_write_block", write_block)
+    data = bytes(range(256)) * 10
+
+    _, files = parse(FakeRequest(form(("file", "a.mp4", data)), chunk_size=300), tmp_path)
+
+    assert files["file"][0].read_bytes() == data
+    assert threading.get_ident() not in {thread for thread, _ in writes}
+    assert all(size >= 1000 for _, size in writes[:-1])  # the rest goes out at file end
+    assert sum(size for _, size in writes) == len(data)
+
+
+def test_callbacks_see_earlier_fields_and_finished_file(tmp_path):
+    events = []
+
+    def on_file_begin(field, path, fields):
+        events.append(("begin", field, dict(fields), path.exists()))
+
+    def on_file_end(field, path):
+        events.append(("end", field, path.read_bytes()))
+
+    body = form(("mode", "color"), ("file", "a.mp4", b"abc"), ("model", "webcam"))
+    parse(FakeRequest(body), tmp_path, on_file_begin=on_file_begin, on_file_end=on_file_end)
+
+    assert events == [("begin", "file", {"mode": "color"}, True), ("end", "file", b"abc")]
+
+
+def test_skipped_and_empty_file_parts(tmp_path):
+    body = form(("file", "a.mp4", b"abc"), ("other", "x.bin", b"zzz"), ("bg_file", "", b""))
+    request = FakeRequest(body)
+
+    fields, files = asyncio.run(stream_multipart(
+        request, lambda field, filename: tmp_path / "a.bin" if field == "file" else None))
+
+    assert list(files) == ["file"]
+    assert fields == {}
+
+
+def test_callback_error_aborts_and_closes_the_file(tmp_path):
+    def on_file_begin(field, path, fields):
+        raise ValueError("refused")
+
+    with pytest.raises(ValueError):
+        parse(FakeRequest(form(("file", "a.mp4", b"abc" * 100))), tmp_path, on_file_begin=on_file_begin)
+    (tmp_path / "file.bin").unlink()  # closed, so removable everywhere
+
+
+def test_rejects_non_multipart(tmp_path):
+    with pytest.raises(HTTPException) as err:
+        parse(FakeRequest(b"{}", content_type="application/json"), tmp_path)
+    assert err.value.status_code == 400
@@ -0,0 +1,114 @@
+import struct
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from inference.video_io import (
+    PLAYLIST_NAME, GrowingFile, finished_segments, segments_complete, sniff_streamable,
+)
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def finished(path, data):
+    path.write_bytes(data)
+    growing = GrowingFile(path)
+    growing.finish()
+    return growing
+
+
+FTYP = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2")
+
+
+def test_webm_is_streamable(tmp_path):
+    assert sniff_streamable(finished(tmp_path / "a.webm", b"\x1a\x45\xdf\xa3" + b"\x00" * 60))
+
+
+def test_mpeg_ts_is_streamable(tmp_path):
+    packet = b"\x47" + b"\x00" * 187
+    assert sniff_streamable(finished(tmp_path / "a.ts", packet * 4))
+
+
+def test_m2ts_is_streamable(tmp_path):
+    packet = b"\x00" * 4 + b"\x47" + b"\x00" * 187
+    assert sniff_streamable(finished(tmp_path / "a.m2ts", packet * 4))
+
+
+def test_single_sync_byte_is_not_a_transport_stream(tmp_path):
+    assert not sniff_streamable(finished(tmp_path / "a.bin", b"\x47" + b"\x00" * 1000))
+    assert not sniff_streamable(finished(tmp_path / "b.bin", (b"\x47" + b"\x00" * 187) * 2))
+
+
+def test_mp4_with_index_first_is_streamable(tmp_path):
+    data = FTYP + box(b"free", b"\x00" * 8) + box(b"moov", b"\x00" * 32) + box(b"mdat", b"\x00" * 64)
+    assert sniff_streamable(finished(tmp_path / "a.mp4", data))
+
+
+def test_mp4_with_index_last_is_not(tmp_path):
+    data = FTYP + box(b"mdat", b"\x00" * 64) + box(b"moov", b"\x00" * 32)
+    assert not sniff_streamable(finished(tmp_path / "a.mp4", data))
+
+
+def test_large_box_is_skipped(tmp_path):
+    large = struct.pack(">I4sQ", 1, b"free", 16 + 8) + b"\x00" * 8
+    data = FTYP + large + box(b"moov", b"\x00" * 32)
+    assert sniff_streamable(finished(tmp_path / "a.mp4", data))
+
+
+def test_unknown_or_short_data_is_not(tmp_path):
+    assert not sniff_streamable(finished(tmp_path / "a.bin", b"not a video container at all"))
+    assert not sniff_streamable(finished(tmp_path / "b.bin", b"\x00\x01"))
+    assert not sniff_streamable(finished(tmp_path / "c.mp4", FTYP + box(b"free", b"\x00" * 8)))
+
+
+def test_waits_for_the_upload(tmp_path):
+    path = tmp_path / "a.mp4"
+    path.write_bytes(FTYP)
+    growing = GrowingFile(path)
+
+    def upload_rest():
+        time.sleep(0.1)
+        with open(path, "ab") as f:
+            f.write(box(b"moov", b"\x00" * 32) + box(b"mdat", b"\x00" * 64))
+        growing.finish()
+
+    threading.Thread(target=upload_rest).start()
+    assert sniff_streamable(growing)
+
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-PLAYLIST-TYPE:EVENT
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4.000000,
+seg_00000.m4s
+#EXTINF:2.500000,
+seg_00001.m4s
+"""
+
+
+def test_finished_segments_of_an_interrupted_playlist(tmp_path):
+    (tmp_path / PLAYLIST_NAME).write_text(PLAYLIST)
+    assert finished_segments(tmp_path) == (2, 6.5)
+    assert not segments_complete(tmp_path)
+
+
+def test_closed_playlist_is_complete(tmp_path):
+    (tmp_path / PLAYLIST_NAME).write_text(PLAYLIST + "#EXT-X-ENDLIST\n")
+    assert segments_complete(tmp_path)
+
+
+def test_no_or_unreadable_playlist_means_start_over(tmp_path):
+    assert finished_segments(tmp_path) == (0, 0.0)
+    assert not segments_complete(tmp_path)
+    (tmp_path / PLAYLIST_NAME).write_bytes(b"\xff\xfe\x00garbage")
+    assert finished_segments(tmp_path) == (0, 0.0)
+    assert not segments_complete(tmp_path)
@@ -0,0 +1,108 @@
+import asyncio
+import importlib
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")
+if not (Path(__file__).resolve().parent.parent / "thirdparty" / "MODNet" / "src").is_dir():
+    pytest.skip("needs the MODNet sources and weights", allow_module_level=True)
+
+
+@pytest.fixture
+def video_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the module creates its folders on import
+    return importlib.import_module("routers.video_api")
+
+
+def test_idle_sessions_run_until_capacity(video_api):
+    async def main():
+        admission = video_api.FrameAdmission(capacity=1)
+        assert await admission.admit("s1") == "run"
+        assert await admission.admit("s2") == "overloaded"
+        admission.release("s1")
+        assert await admission.admit("s2") == "run"
+        assert admission.stats()["rejected"] == 1
+
+    asyncio.run(main())
+
+
+def test_newer_frame_supersedes_the_queued_one(video_api):
+    async def main():
+        admission = video_api.FrameAdmission(capacity=4)
+        assert await admission.admit("s") == "run"
+        first = asyncio.ensure_future(admission.admit("s"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(admission.admit("s"))
+        await asyncio.sleep(0)
+
+        assert await first == "superseded"
+        assert not second.done() and admission.stats()["queued"] == 1
+        admission.release("s")  # frame in flight done: the queued one runs
+        assert await second == "run"
+        admission.release("s")
+        assert admission.stats()["busy_sessions"] == 0
+        assert admission.superseded == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_queued_frame_leaves_the_session_usable(video_api):
+    async def main():
+        admission = video_api.FrameAdmission(capacity=4)
+        assert await admission.admit("s") == "run"
+        queued = asyncio.ensure_future(admission.admit("s"))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert admission.stats()["queued"] == 0
+
+        admission.release("s")
+        assert admission.stats()["busy_sessions"] == 0
+        assert await admission.admit("s") == "run"
+
+    asyncio.run(main())
+
+
+def test_slow_frames_step_quality_down_then_stretch_the_interval(video_api):
+    quality = video_api.AdaptiveQuality()
+    for _ in range(60):
+        quality.observe(server_ms=2000)
+    assert quality.level == len(video_api.WEBCAM_LEVELS) - 1
+    assert quality.interval == video_api.WEBCAM_MAX_INTERVAL_MS
+
+
+def test_one_slow_frame_moves_one_step(video_api):
+    quality = video_api.AdaptiveQuality()
+    level = quality.level
+    for _ in range(1 + quality.COOLDOWN):
+        quality.observe(server_ms=2000)  # later ones fall into the cooldown
+    assert quality.level == level + 1
+
+
+def test_queued_frames_step_down_even_when_fast(video_api):
+    quality = video_api.AdaptiveQuality()
+    level = quality.level
+    quality.observe(server_ms=5, queue=1)
+    assert quality.level == level + 1
+
+
+def test_calm_frames_step_back_up_to_the_best_level(video_api):
+    quality = video_api.AdaptiveQuality()
+    for _ in range(quality.UP_AFTER - 1):
+        quality.observe(server_ms=5)
+    assert quality.level == 2  # not yet: needs UP_AFTER calm frames in a row
+    for _ in range(200):
+        quality.observe(server_ms=5)
+    assert quality.level == 0
+    assert quality.interval == video_api.WEBCAM_MIN_INTERVAL_MS
+
+
+def test_hint_describes_the_current_level(video_api):
+    quality = video_api.AdaptiveQuality()
+    width, jpeg_quality, infer_size = video_api.WEBCAM_LEVELS[quality.level]
+    assert quality.hint() == {"width": width, "quality": jpeg_quality,
+                              "interval": quality.interval, "infer_size": infer_size}
+    assert quality.infer_size == infer_size
@@ -0,0 +1,204 @@
+"""
+worker.py
+---------------------------------
+Inference worker: pulls video and bulk-image jobs from the job broker
+(broker.py) and runs the existing inference on them.
+
+Run one per inference machine (it shares the broker file and the media
+directories with the web tier):
+
+    python worker.py [--kinds video,image] [--concurrency 1]
+
+and start the web tier with JOB_WORKERS=remote so it only enqueues and
+serves. Progress is written to the usual progress files, results and
+failures to the broker; the API picks both up from there.
+
+While a job runs its lease is extended by heartbeats. If the worker dies
+the lease runs out and another worker takes the job over; video renders
+then resume after their last finished segment. A worker whose heartbeat
+finds the lease gone (e.g. it was cut off from the broker for too long)
+cancels its run at the next frame, so two runs never write the same job.
+
+Without JOB_WORKERS=remote the API runs an in-process worker for bulk
+image jobs (start_local_worker) and keeps running video jobs itself.
+
+Classes:
+    Worker, JobFailed
+
+Functions:
+    run_job(job, usage)
+    start_local_worker(kinds)
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from broker import get_broker, LEASE_SECONDS
+from jobs import JobCancelled
+
+JOB_KINDS = ("video", "image")
+POLL_SECONDS = 1.0
+
+
+class JobFailed(Exception):
+    """Permanent job failure (bad input, does not fit): not retried."""
+
+
+# =====================================================
+# 🧠 Job runners (inference modules are imported lazily)
+# =====================================================
+def run_video(payload, usage, cancel):
+    from inference.modnet_infer_video import run_video_job
+    if not run_video_job(payload, usage=usage, cancel=cancel):
+        raise JobFailed("video processing failed")
+
+
+def run_image(payload, usage, cancel):
+    import numpy as np
+    from inference.governor import governor, BATCH
+    from inference.memory import memory_budget, MemoryBudgetExceeded
+    from routers.image_api import render_image, plan_image_memory
+
+    original_path = Path(payload["original_path"])
+    data = original_path.read_bytes()
+    bg_bytes = Path(payload["bg_upload"]).read_bytes() if payload.get("bg_upload") else None
+    try:
+        need, hires = plan_image_memory(payload["size"], len(data), payload["hires"], len(bg_bytes or b""))
+    except MemoryBudgetExceeded as e:
+        raise JobFailed(str(e))
+    with memory_budget.reserve(need, usage), governor.slot(BATCH):
+        if cancel.is_set():
+            raise JobCancelled()
+        error = render_image(
+            np.frombuffer(data, np.uint8), bg_bytes, payload["mode"], payload["color"],
+            payload["blur_strength"], hires, original_path, Path(payload["changed_path"]),
+            Path(payload["bg_path"]), payload["model"],
+        )
+    if error:
+        raise JobFailed(error)
+
+
+RUNNERS = {"video": run_video, "image": run_image}
+
+
+def run_job(job, usage=None, cancel=None):
+    """
+    Run a leased job; raises JobFailed (no retry), JobCancelled (`cancel`
+    was set) or any other error (retried).
+    """
+    RUNNERS[job["kind"]](job["payload"], usage, cancel or threading.Event())
+
+
+# =====================================================
+# 🔁 Worker loop
+# =====================================================
+class Worker:
+    """Lease → run → complete/fail loop with a heartbeat thread per running job."""
+
+    def __init__(self, kinds=JOB_KINDS, lease_seconds=LEASE_SECONDS, worker_id=None):
+        self.kinds = tuple(kinds)
+        self.lease_seconds = lease_seconds
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.broker = get_broker()
+        self.stop = threading.Event()
+
+    def _heartbeat(self, job_id, done, cancel):
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                self.broker.worker_seen(self.id, self.kinds, job_id)
+                alive = self.broker.heartbeat(job_id, self.id, self.lease_seconds)
+            except Exception as e:  # broker unreachable: retry; the lease may still run out
+                print(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+                continue
+            if not alive:
+                print(f"⚠️ Lease on job {job_id} lost; cancelling this run")
+                cancel.set()
+                return
+
+    def run_one(self):
+        """Lease and run one job; False when the queue had nothing for us."""
+        from inference.memory import MemoryUsage
+
+        job = self.broker.lease(self.id, self.kinds, self.lease_seconds)
+        if job is None:
+            return False
+        print(f"🛠️ {self.id}: {job['kind']} job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        done, cancel = threading.Event(), threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job["id"], done, cancel), daemon=True).start()
+        usage = MemoryUsage()
+        try:
+            run_job(job, usage, cancel)
+        except JobCancelled:
+            print(f"🛑 Job {job['id']} cancelled (lease lost); left to its new worker")
+        except JobFailed as e:
+            print(f"❌ Job {job['id']} failed: {e}")
+            self.broker.fail(job["id"], self.id, e, retry=False)
+        except Exception as e:
+            print(f"❌ Job {job['id']} crashed: {e}")
+            self.broker.fail(job["id"], self.id, e, retry=True)
+        else:
+            self.broker.complete(job["id"], self.id, {"memory": usage.as_dict()})
+        finally:
+            done.set()
+            self.broker.worker_seen(self.id, self.kinds)
+        return True
+
+    def run(self):
+        print(f"👷 Worker {self.id} ready for {', '.join(self.kinds)} jobs")
+        while not self.stop.is_set():
+            self.broker.worker_seen(self.id, self.kinds)
+            try:
+                busy = self.run_one()
+            except Exception as e:  # broker unavailable (e.g. shared mount hiccup)
+                print(f"⚠️ Worker {self.id}: {e}")
+                busy = False
+            if not busy:
+                self.stop.wait(POLL_SECONDS)
+
+
+def start_local_worker(kinds=("image",), concurrency=1):
+    """Run workers as daemon threads inside the current (API) process."""
+    workers = [Worker(kinds) for _ in range(concurrency)]
+    for w in workers:
+        threading.Thread(target=w.run, daemon=True, name=f"worker-{w.id}").start()
+    return workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run inference jobs from the job broker.")
+    parser.add_argument("--kinds", default=",".join(JOB_KINDS), help="job kinds to take (video, image)")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs run at the same time")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+    args = parser.parse_args(argv)
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in JOB_KINDS]
+    if unknown:
+        parser.error(f"unknown job kind(s): {', '.join(unknown)}")
+
+    from inference.process_pool import inference_pool
+    inference_pool.start()
+    workers = [Worker(kinds, args.lease) for _ in range(args.concurrency)]
+    threads = [threading.Thread(target=w.run, name=f"worker-{w.id}") for w in workers]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("🛑 Stopping workers after their current job ...")
+        for w in workers:
+            w.stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        inference_pool.stop()
+
+
+if __name__ == "__main__":
+    main()